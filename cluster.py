@@ -0,0 +1,476 @@
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from models import TravelPlan
+
+# --- Coordinator / worker batch mode ---
+# Runs a batch of find_best_travel_plan queries over worker processes on any number of
+# hosts. The coordinator holds the queue; workers connect to it over TCP, load the
+# flights once, and pull queries a few at a time. Messages are pickled tuples framed by
+# multiprocessing.connection, which also authenticates both ends with a shared authkey
+# (pickles from an unauthenticated peer would be unsafe to load). There is no built-in
+# key: it comes from FLIGHT_CLUSTER_AUTHKEY or --authkey, and the coordinator only
+# listens on localhost unless it is given another address.
+#
+# Worker -> coordinator                 Coordinator -> worker
+#   ("hello", name, flight_count)         ("welcome",)
+#   ("get", max_tasks)                    ("tasks", [(task_id, params), ...]) | ("wait", seconds) | ("stop",)
+#   ("result", task_id, plans)            ("ok", cancelled_task_ids)
+#   ("error", task_id, message)           ("ok", cancelled_task_ids)
+#
+# Workers prefetch up to PREFETCH_TASKS queries. Once the queue is empty, an idle worker
+# steals the queries another worker has prefetched but not started yet; the victim
+# learns which of its queries were taken from the next "ok". A query runs again on
+# another worker if its worker disconnects or reports an error (up to max_attempts),
+# or if it runs longer than task_timeout. The first result for a query wins. Results
+# are streamed from Coordinator.results() in completion order. If every worker has
+# disconnected and none connects within orphan_timeout, the queries still open finish
+# as failed, so results() returns instead of waiting forever.
+
+PREFETCH_TASKS = 2
+WAIT_SECONDS = 0.5
+ORPHAN_TIMEOUT = 30.0
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 6060
+AUTHKEY_ENV = "FLIGHT_CLUSTER_AUTHKEY"
+
+
+def default_authkey() -> bytes:
+    """The shared key from the environment; refuses to run without one."""
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"No cluster authkey: set {AUTHKEY_ENV} or pass --authkey")
+    return authkey.encode()
+
+
+@dataclass
+class TaskResult:
+    task_id: int
+    params: Dict[str, Any]
+    plans: Optional[List[TravelPlan]]  # None if every attempt failed
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    attempts: int = 0
+
+
+@dataclass
+class _Task:
+    task_id: int
+    params: Dict[str, Any]
+    attempts: int = 0
+    started: float = 0.0        # When it was last handed out
+    workers: Set[str] = field(default_factory=set)  # Workers currently holding it
+
+
+class Coordinator:
+    """
+    Serves `queries` (find_best_travel_plan keyword arguments, without base_flights)
+    to workers. start() listens in background threads; results() yields a TaskResult
+    per query as they complete, and returns once all have.
+    """
+
+    def __init__(
+        self,
+        queries: Iterable[Dict[str, Any]],
+        address: Tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+        authkey: Optional[bytes] = None,
+        max_attempts: int = 3,
+        task_timeout: Optional[float] = None,
+        orphan_timeout: float = ORPHAN_TIMEOUT
+    ):
+        self._tasks = {task_id: _Task(task_id, params) for task_id, params in enumerate(queries)}
+        self._pending: Deque[int] = deque(self._tasks)
+        self._outstanding: Dict[str, List[int]] = {}   # Worker -> task ids handed to it, oldest first
+        self._cancelled: Dict[str, Set[int]] = {}     # Worker -> task ids stolen from it
+        self._done: Set[int] = set()
+        self._results: Deque[TaskResult] = deque()
+        self._condition = threading.Condition()
+        self.max_attempts = max_attempts
+        self.task_timeout = task_timeout
+        self.orphan_timeout = orphan_timeout
+        self._orphaned_since: Optional[float] = None  # When the last worker left with queries open
+        self._flight_count: Optional[int] = None
+        self._listener = Listener(address, authkey=authkey or default_authkey())
+        self._closed = False
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def start(self) -> "Coordinator":
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        print(f"Coordinator listening on {self.address[0]}:{self.address[1]} with {len(self._tasks)} queries.")
+        return self
+
+    def close(self) -> None:
+        self._closed = True
+        self._listener.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def results(self) -> Iterator[TaskResult]:
+        finished = 0
+        while finished < len(self._tasks):
+            with self._condition:
+                while not self._results:
+                    self._condition.wait(WAIT_SECONDS)
+                    self._requeue_timed_out()
+                    self._abandon_if_orphaned()
+                result = self._results.popleft()
+            finished += 1
+            yield result
+
+    # --- Connections ---
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                continue  # A peer that failed authentication
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: Connection) -> None:
+        worker = None
+        try:
+            message = connection.recv()
+            if message[0] != "hello":
+                return
+            _, name, flight_count = message
+            worker = f"{name}#{id(connection)}"
+            self._join(worker, name, flight_count)
+            print(f"Worker {name} connected ({flight_count} flights).")
+            connection.send(("welcome",))
+            while True:
+                message = connection.recv()
+                if message[0] == "get":
+                    connection.send(self._assign(worker, message[1]))
+                elif message[0] == "result":
+                    connection.send(self._complete(worker, message[1], message[2], None))
+                elif message[0] == "error":
+                    connection.send(self._complete(worker, message[1], None, message[2]))
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            if worker is not None:
+                self._drop_worker(worker)
+
+    # --- Scheduling (called with connections' threads) ---
+
+    def _join(self, worker: str, name: str, flight_count: int) -> None:
+        with self._condition:
+            if self._flight_count is None:
+                self._flight_count = flight_count
+            elif flight_count != self._flight_count:
+                print(f"Warning: worker {name} loaded {flight_count} flights, the first worker {self._flight_count}.")
+            self._outstanding[worker] = []
+            self._cancelled[worker] = set()
+            self._orphaned_since = None
+
+    def _assign(self, worker: str, max_tasks: int) -> tuple:
+        with self._condition:
+            if len(self._done) == len(self._tasks):
+                return ("stop",)
+            self._requeue_timed_out()
+            if not self._pending:
+                self._steal_for(worker)
+            batch = []
+            while self._pending and len(batch) < max_tasks:
+                task = self._tasks[self._pending.popleft()]
+                if task.task_id in self._done:
+                    continue
+                task.started = time.monotonic()
+                task.workers.add(worker)
+                # A query stolen from this worker can come back to it (after failing on
+                # the thief); the new assignment must not be cancelled by the old steal.
+                self._cancelled[worker].discard(task.task_id)
+                self._outstanding[worker].append(task.task_id)
+                batch.append((task.task_id, task.params))
+            return ("tasks", batch) if batch else ("wait", WAIT_SECONDS)
+
+    def _steal_for(self, thief: str) -> None:
+        # Take the not yet started half of the longest prefetch queue. Workers run their
+        # tasks in order, so everything but the first outstanding task is unstarted.
+        victim = max(
+            (worker for worker in self._outstanding if worker != thief),
+            key=lambda worker: len(self._outstanding[worker]), default=None
+        )
+        if victim is None or len(self._outstanding[victim]) < 2:
+            return
+        queue = self._outstanding[victim]
+        stolen = queue[-(len(queue) // 2):]
+        del queue[-len(stolen):]
+        for task_id in stolen:
+            self._tasks[task_id].workers.discard(victim)
+            self._cancelled[victim].add(task_id)
+        self._pending.extend(stolen)
+
+    def _requeue_timed_out(self) -> None:
+        if self.task_timeout is None:
+            return
+        now = time.monotonic()
+        for worker, queue in self._outstanding.items():
+            if queue:
+                task = self._tasks[queue[0]]
+                if now - task.started > self.task_timeout and len(task.workers) < 2 and task.task_id not in self._pending:
+                    # Run it again elsewhere too; whichever result comes first wins.
+                    task.started = now
+                    self._pending.appendleft(task.task_id)
+
+    def _complete(self, worker: str, task_id: int, plans, error: Optional[str]) -> tuple:
+        with self._condition:
+            task = self._tasks[task_id]
+            task.workers.discard(worker)
+            if task_id in self._outstanding[worker]:
+                self._outstanding[worker].remove(task_id)
+            if task_id not in self._done:
+                if error is None:
+                    self._finish(task, TaskResult(task_id, task.params, plans, None, worker, task.attempts + 1))
+                else:
+                    task.attempts += 1
+                    print(f"Query {task_id} failed on {worker} (attempt {task.attempts}): {error.splitlines()[-1]}")
+                    if task.attempts >= self.max_attempts:
+                        self._finish(task, TaskResult(task_id, task.params, None, error, worker, task.attempts))
+                    elif not task.workers and task_id not in self._pending:
+                        self._pending.append(task_id)
+            cancelled = sorted(self._cancelled[worker])
+            self._cancelled[worker].clear()
+            return ("ok", cancelled)
+
+    def _finish(self, task: _Task, result: TaskResult) -> None:
+        self._done.add(task.task_id)
+        self._results.append(result)
+        self._condition.notify_all()
+
+    def _abandon_if_orphaned(self) -> None:
+        if self._orphaned_since is None or time.monotonic() - self._orphaned_since < self.orphan_timeout:
+            return
+        print(f"No workers for {self.orphan_timeout}s; {len(self._tasks) - len(self._done)} queries left unfinished.")
+        for task in self._tasks.values():
+            if task.task_id not in self._done:
+                self._finish(task, TaskResult(task.task_id, task.params, None, "No live workers", None, task.attempts))
+        self._pending.clear()
+        self._orphaned_since = None
+
+    def _drop_worker(self, worker: str) -> None:
+        with self._condition:
+            lost = self._outstanding.pop(worker, [])
+            self._cancelled.pop(worker, None)
+            for task_id in reversed(lost):
+                task = self._tasks[task_id]
+                task.workers.discard(worker)
+                if task_id not in self._done and not task.workers and task_id not in self._pending:
+                    task.attempts += 1
+                    if task.attempts >= self.max_attempts:
+                        self._finish(task, TaskResult(task_id, task.params, None, f"Worker {worker} disconnected", worker, task.attempts))
+                    else:
+                        self._pending.appendleft(task_id)
+            if not self._outstanding and len(self._done) < len(self._tasks):
+                self._orphaned_since = time.monotonic()
+        if lost:
+            print(f"Worker {worker} disconnected; {len(lost)} queries requeued.")
+
+
+# --- Worker ---
+
+def load_worker_flights(data_path: str):
+    """A copied snapshot (.flights) is mapped as it is; anything else goes through load_flights_fast."""
+    if data_path.endswith(".flights"):
+        from flight_store import FlightStore
+        return FlightStore.open(data_path)
+    from data_handler import load_flights_fast
+    return load_flights_fast(data_path)
+
+
+class WorkerQueue:
+    """A worker's prefetched queries, minus those the coordinator has reported stolen."""
+
+    def __init__(self):
+        self._tasks: Deque[Tuple[int, Dict[str, Any]]] = deque()
+        self._cancelled: Set[int] = set()
+
+    def add(self, batch: Iterable[Tuple[int, Dict[str, Any]]]) -> None:
+        for task_id, params in batch:
+            # A stolen query handed back (it failed on the thief) is a new assignment.
+            self._cancelled.discard(task_id)
+            self._tasks.append((task_id, params))
+
+    def cancel(self, task_ids: Iterable[int]) -> None:
+        self._cancelled.update(task_ids)
+
+    def next(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """The next query to run, or None once all prefetched ones are run or stolen."""
+        while self._tasks:
+            task = self._tasks.popleft()
+            if task[0] not in self._cancelled:
+                return task
+        return None
+
+
+def run_worker(
+    address: Tuple[str, int],
+    data_path: str,
+    authkey: Optional[bytes] = None,
+    name: Optional[str] = None,
+    prefetch: int = PREFETCH_TASKS,
+    base_flights=None
+) -> int:
+    """
+    Loads the flights once (or uses base_flights), then runs queries from the
+    coordinator at `address` until it says stop. Returns the number of queries run.
+    """
+    from main import find_best_travel_plan
+
+    if base_flights is None:
+        base_flights = load_worker_flights(data_path)
+    name = name or f"{os.uname().nodename}:{os.getpid()}"
+    connection = Client(address, authkey=authkey or default_authkey())
+    tasks = WorkerQueue()
+    completed = 0
+    try:
+        connection.send(("hello", name, len(base_flights)))
+        connection.recv()
+        while True:
+            task = tasks.next()
+            if task is None:
+                connection.send(("get", prefetch))
+                reply = connection.recv()
+                if reply[0] == "stop":
+                    break
+                if reply[0] == "wait":
+                    time.sleep(reply[1])
+                    continue
+                tasks.add(reply[1])
+                continue
+            task_id, params = task
+            try:
+                plans = find_best_travel_plan(base_flights, **params)
+            except Exception:
+                connection.send(("error", task_id, traceback.format_exc()))
+            else:
+                connection.send(("result", task_id, plans))
+                completed += 1
+            _, stolen = connection.recv()
+            tasks.cancel(stolen)
+    except (EOFError, OSError):
+        print(f"Worker {name}: lost the coordinator.")
+    finally:
+        connection.close()
+    return completed
+
+
+# --- Query files ---
+# One JSON object per line with find_best_travel_plan's keyword arguments; dates as
+# "YYYY-MM-DD".
+
+DATE_PARAMS = ("start_date", "end_date")
+
+
+def read_queries(path: str) -> List[Dict[str, Any]]:
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                for name in DATE_PARAMS:
+                    query[name] = date.fromisoformat(query[name])
+                queries.append(query)
+    return queries
+
+
+def result_record(result: TaskResult) -> Dict[str, Any]:
+    return {
+        "task_id": result.task_id,
+        "worker": result.worker,
+        "attempts": result.attempts,
+        "error": result.error,
+        "plans": None if result.plans is None else [
+            {
+                "total_duration": str(plan.total_duration),
+                "flights": [
+                    f"{f.flight_number} {f.departure_city_code}>{f.arrival_city_code} {f.departure_datetime:%Y-%m-%d %H:%M}"
+                    for f in plan.flights
+                ]
+            }
+            for plan in result.plans
+        ]
+    }
+
+
+def run_local(queries: List[Dict[str, Any]], data_path: str, workers: int = 2) -> Iterator[TaskResult]:
+    """
+    The whole batch on this host: a coordinator on localhost plus `workers` worker
+    processes, sharing a random authkey only they know.
+    """
+    import multiprocessing
+    import secrets
+
+    authkey = secrets.token_bytes(32)
+    with Coordinator(queries, ("127.0.0.1", 0), authkey) as coordinator:
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(coordinator.address, data_path, authkey), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        yield from coordinator.results()
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Distributed batch of travel plan queries.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    coordinator_parser = commands.add_parser("coordinator", help="serve a query file to workers")
+    coordinator_parser.add_argument("queries")
+    coordinator_parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: localhost only)")
+    coordinator_parser.add_argument("--authkey", help=f"shared key (default: ${AUTHKEY_ENV})")
+    coordinator_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator_parser.add_argument("--task-timeout", type=float)
+    worker_parser = commands.add_parser("worker", help="run queries from a coordinator")
+    worker_parser.add_argument("coordinator", help="host:port")
+    worker_parser.add_argument("--data", default="merged_flight_data.xlsx")
+    worker_parser.add_argument("--authkey", help=f"shared key (default: ${AUTHKEY_ENV})")
+    local_parser = commands.add_parser("local", help="coordinator plus worker processes on this host")
+    local_parser.add_argument("queries")
+    local_parser.add_argument("--data", default="merged_flight_data.xlsx")
+    local_parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    authkey = None
+    if args.command != "local":
+        try:
+            authkey = args.authkey.encode() if args.authkey else default_authkey()
+        except ValueError as e:
+            print(e)
+            sys.exit(2)
+    if args.command == "worker":
+        host, port = args.coordinator.rsplit(":", 1)
+        run_worker((host, int(port)), args.data, authkey)
+    else:
+        if args.command == "local":
+            results = run_local(read_queries(args.queries), args.data, args.workers)
+        else:
+            coordinator = Coordinator(read_queries(args.queries), (args.host, args.port), authkey, task_timeout=args.task_timeout)
+            results = coordinator.start().results()
+        for result in results:
+            print(json.dumps(result_record(result), ensure_ascii=False), flush=True)
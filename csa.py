@@ -0,0 +1,131 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import CITY_CODES, Flight, TravelPlan
+from timeline import Leg, expand_legs, to_minutes
+
+# --- Connection Scan Algorithm ---
+# Point-to-point questions ("how fast can I get from X to Y leaving after T") answered
+# with single linear scans over the legs of a window sorted by departure, instead of the
+# multi-country search. The minimum layover is the transfer time at every city except
+# the origin. The maximum layover is not applied: a scan can't express "waited too long".
+# Times are minutes on the legs' timeline (see timeline.py). FeasibilityBounds sweeps
+# the same connection array to bound the multi-country search.
+
+
+class ConnectionScan:
+    """
+    Connections (legs) sorted by departure time, with:
+    - earliest_arrivals(source, t): one-to-all earliest arrival when ready at source at t
+    - earliest_arrival(source, target, t): the fastest route, as a list of flights
+    - profiles(target) / profile(source, target): every non-dominated (departure,
+      arrival) pair towards target, for all cities at once / for one source
+    """
+
+    def __init__(self, legs: Iterable[Leg], min_layover: int = 0, presorted: bool = False):
+        """min_layover in minutes; presorted: legs already sorted by (departure, arrival)."""
+        self.min_layover = min_layover
+        self.connections: List[Leg] = list(legs) if presorted else sorted(legs, key=lambda f: (f.departure, f.arrival))
+        self._departures = [f.departure for f in self.connections]
+
+    def earliest_arrivals(
+        self,
+        source: int,
+        depart_after: int,
+        target: Optional[int] = None
+    ) -> Tuple[Dict[int, int], Dict[int, Leg]]:
+        """
+        Earliest arrival at every city reachable from source (CITY_CODES codes), and the
+        last flight of the route that achieves it. With a target the scan stops as soon
+        as no later departure can improve the arrival at target.
+        """
+        arrival: Dict[int, int] = {source: depart_after}
+        ready: Dict[int, int] = {source: depart_after}  # Earliest boarding time per city
+        incoming: Dict[int, Leg] = {}
+        connections = self.connections
+        for i in range(bisect_left(self._departures, depart_after), len(connections)):
+            f = connections[i]
+            if target is not None and target in incoming and f.departure >= arrival[target]:
+                break
+            boarding = ready.get(f.departure_city_id)
+            if boarding is None or f.departure < boarding:
+                continue
+            destination = f.arrival_city_id
+            if destination not in arrival or f.arrival < arrival[destination]:
+                arrival[destination] = f.arrival
+                ready[destination] = f.arrival + self.min_layover
+                incoming[destination] = f
+        return arrival, incoming
+
+    def earliest_arrival(self, source: int, target: int, depart_after: int) -> Optional[List[Leg]]:
+        """The route from source to target that arrives first, or None if there is none."""
+        _, incoming = self.earliest_arrivals(source, depart_after, target)
+        if target not in incoming:
+            return None
+        route = []
+        city = target
+        while city != source:
+            flight = incoming[city]
+            route.append(flight)
+            city = flight.departure_city_id
+        route.reverse()
+        return route
+
+    def profiles(self, target: int) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        For every city that can reach target, the Pareto set of (departure from the city,
+        arrival at target) pairs: leaving later always means arriving later. Pairs are
+        listed latest departure first. One scan over the connections, latest first.
+        """
+        entries: Dict[int, List[Tuple[int, int]]] = {}
+        # Negated departures, parallel to entries, so bisect works on increasing keys.
+        keys: Dict[int, List[int]] = {}
+        for f in reversed(self.connections):
+            origin = f.departure_city_id
+            if origin == target:
+                continue
+            if f.arrival_city_id == target:
+                best = f.arrival
+            else:
+                best = self._evaluate(entries, keys, f.arrival_city_id, f.arrival + self.min_layover)
+                if best is None:
+                    continue
+            city_entries = entries.setdefault(origin, [])
+            if not city_entries or best < city_entries[-1][1]:
+                if city_entries and city_entries[-1][0] == f.departure:
+                    city_entries[-1] = (f.departure, best)  # Same departure, earlier arrival
+                else:
+                    city_entries.append((f.departure, best))
+                    keys.setdefault(origin, []).append(-f.departure)
+        return entries
+
+    @staticmethod
+    def _evaluate(entries, keys, city: int, ready: int) -> Optional[int]:
+        # The entries departing at or after `ready` are a prefix (departures decrease);
+        # arrivals decrease along the list too, so the last of them arrives first.
+        city_keys = keys.get(city)
+        if not city_keys:
+            return None
+        count = bisect_right(city_keys, -ready)
+        return entries[city][count - 1][1] if count else None
+
+    def profile(self, source: int, target: int) -> List[Tuple[int, int]]:
+        return self.profiles(target).get(source, [])
+
+
+def fastest_route(
+    base_flights: List[Flight],
+    start_city: str,
+    end_city: str,
+    depart_after: datetime,
+    min_layover_hours: int = 10,
+    search_days: int = 14
+) -> Optional[TravelPlan]:
+    """How fast can I get from start_city to end_city leaving after depart_after?"""
+    start_date = depart_after.date()
+    legs = expand_legs(base_flights, start_date, (depart_after + timedelta(days=search_days)).date())
+    scan = ConnectionScan(legs, min_layover_hours * 60)
+    depart_after_minute = to_minutes(depart_after - datetime.combine(start_date, datetime.min.time()))
+    route = scan.earliest_arrival(CITY_CODES.encode(start_city), CITY_CODES.encode(end_city), depart_after_minute)
+    return TravelPlan(flights=[leg.dated_flight(start_date) for leg in route]) if route else None
@@ -1,10 +1,21 @@
-import pandas as pd
+import glob
+import hashlib
+import json
+import math
+import os
 import re
+import zlib
 from datetime import datetime, timedelta, date
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Mapping, Sequence, Tuple, Optional
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 
-from models import Flight
+from models import (
+    Flight, AIRLINES, FLIGHT_NUMBERS, FLIGHT_CLASSES, CITY_CODES, TRANSFER_INFOS, VISA_INFOS
+)
+from flight_store import FlightStore, FlightStoreWriter, write_flight_store
+import tracing
 
 def parse_arrival_info(arrival_str: str) -> Tuple[Optional[str], int]:
     """
@@ -65,115 +76,587 @@ def parse_duration(duration_str: str) -> timedelta:
     return timedelta(days=days, hours=hours, minutes=minutes)
 
 
-import os
+def _is_missing(value) -> bool:
+    """True for blank cells: None, NaN/NaT and pandas' NA (without importing pandas)."""
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    return str(value) in ("nan", "NaT", "<NA>")
 
-def load_flights(
-    filepath: str = "merged_flight_data.xlsx"
-) -> List[Flight]:
+def flight_from_row(row) -> Flight:
     """
-    Loads flight data from a fast-loading Feather cache if it exists.
-    If not, it reads the original Excel file, creates the cache, and then loads the data.
+    Builds a Flight from one sheet row: a pandas Series or a dict with the sheet's columns,
+    where 'Date' is already a datetime. Raises ValueError/KeyError/AttributeError on bad rows.
     """
-    feather_path = filepath.replace(".xlsx", ".feather")
-    flights = []
+    # Date and Time parsing - now 'Date' is a datetime object
+    flight_date = row['Date'].date()
+
+    # Make sure times are read as strings before parsing
+    departure_time_str = str(row['Departure Time'])
+    arrival_time_str = str(row['Arrival Time'])
 
+    # Handle cases where time might be just 'HH:MM' without seconds
     try:
-        if os.path.exists(feather_path):
-            print(f"Loading flights from fast cache: {feather_path}")
-            df = pd.read_feather(feather_path)
+        departure_time = datetime.strptime(departure_time_str, '%H:%M').time()
+    except ValueError:
+        departure_time = datetime.strptime(departure_time_str, '%H:%M:%S').time()
+
+    departure_datetime = datetime.combine(flight_date, departure_time)
+
+    # Duration is parsed from the 'Total Time' column (source of truth)
+    duration = parse_duration(row['Total Time'])
+
+    # Arrival datetime is now correctly calculated from the departure time and true duration
+    arrival_time_str, days_offset = parse_arrival_info(arrival_time_str)
+    try:
+        arrival_time = datetime.strptime(arrival_time_str, '%H:%M').time()
+    except (ValueError, AttributeError):
+        arrival_time = datetime.strptime(arrival_time_str, '%H:%M:%S').time()
+
+    # Calculate arrival datetime with day offset
+    arrival_datetime = datetime.combine(flight_date + timedelta(days=days_offset), arrival_time)
+
+
+    transfer_info = str(row['Transfer Info'])
+    if "转" in transfer_info:
+        match = re.search(r'(\d+)', transfer_info)
+        transfers = int(match.group(1)) if match else 0
+    else:
+        transfers = 0
+
+    flight_number = str(row['Plane'])
+
+    # Handle flight class; get the value from the correct 'Flight Class' column.
+    flight_class = str(row.get('Flight Class', 'Economy')).strip()
+
+    # Get Visa Info, provide a default value if missing
+    # --- MODIFIED LOGIC FOR VISA INFO ---
+    raw_visa_info = row.get('Visa Info')
+    if _is_missing(raw_visa_info):
+        visa_info = 'N/A'
+    else:
+        visa_info = str(raw_visa_info).strip()
+
+    # Create Flight object
+    return Flight(
+        date=flight_date,
+        airline_id=AIRLINES.encode(row['Company (Airline)']),
+        flight_number_id=FLIGHT_NUMBERS.encode(flight_number if flight_number else "N/A"),
+        flight_class_id=FLIGHT_CLASSES.encode(flight_class),
+        flight_class_ids=frozenset([FLIGHT_CLASSES.encode(flight_class)]),
+        departure_city_id=CITY_CODES.encode(row['From']),
+        arrival_city_id=CITY_CODES.encode(row['To']),
+        departure_time=departure_datetime.time(),
+        arrival_time=arrival_datetime.time(),
+        departure_datetime=departure_datetime,
+        arrival_datetime=arrival_datetime,
+        duration=duration,
+        transfers=transfers,
+        transfer_info_id=TRANSFER_INFOS.encode(transfer_info),
+        visa_info_id=VISA_INFOS.encode(visa_info),
+        direct_flight=(transfers == 0)
+    )
+
+# --- Source files ---
+# load_flights accepts the merged workbook, a directory of carrier exports, or a glob.
+SOURCE_EXTENSIONS = (".xlsx", ".csv", ".parquet")
+# Column names used by carrier exports, mapped to the names of the merged sheet.
+COLUMN_ALIASES = {
+    "date": "Date",
+    "airline": "Company (Airline)",
+    "company": "Company (Airline)",
+    "flight number": "Plane",
+    "flight": "Plane",
+    "class": "Flight Class",
+    "cabin": "Flight Class",
+    "from": "From",
+    "origin": "From",
+    "to": "To",
+    "destination": "To",
+    "departure time": "Departure Time",
+    "arrival time": "Arrival Time",
+    "total time": "Total Time",
+    "duration": "Total Time",
+    "transfer info": "Transfer Info",
+    "visa info": "Visa Info",
+}
+
+def _is_glob(filepath: str) -> bool:
+    return any(char in filepath for char in "*?[")
+
+def resolve_sources(filepath: str) -> List[str]:
+    """Expands a directory or glob into its source files (sorted); a plain path is returned as is."""
+    if os.path.isdir(filepath):
+        names = sorted(os.listdir(filepath))
+        paths = [os.path.join(filepath, name) for name in names]
+    elif _is_glob(filepath):
+        paths = sorted(glob.glob(filepath))
+    else:
+        return [filepath]
+    # Skip Office lock files ("~$...") and our own caches.
+    return [
+        path for path in paths
+        if path.lower().endswith(SOURCE_EXTENSIONS) and not os.path.basename(path).startswith("~$")
+    ]
+
+def normalize_columns(df):
+    """Renames export-specific columns to the merged sheet's names (in place) and returns df."""
+    renames = {}
+    present = set(df.columns)
+    for column in df.columns:
+        canonical = COLUMN_ALIASES.get(str(column).strip().lower())
+        if canonical and canonical != column and canonical not in present:
+            renames[column] = canonical
+            present.add(canonical)
+    if renames:
+        df.rename(columns=renames, inplace=True)
+    return df
+
+def read_flight_table(filepath: str):
+    """
+    Reads one source file into a DataFrame with normalized columns and a parsed 'Date'
+    column. Workbooks go through the Feather cache when it is at least as new as the source.
+    """
+    import pandas as pd
+
+    with tracing.span("load_flights.read", path=filepath):
+        if filepath.lower().endswith(".csv"):
+            df = pd.read_csv(filepath)
+        elif filepath.lower().endswith(".parquet"):
+            df = pd.read_parquet(filepath)
         else:
-            print(f"Cache not found. Loading from original file: {filepath}")
-            df = pd.read_excel(filepath)
-            # Save the dataframe to a feather file for future fast loading
-            df.to_feather(feather_path)
-            print(f"Cache created at: {feather_path}")
-
-        # Convert 'Date' column to datetime, coercing errors to NaT
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        # Drop rows where 'Date' could not be parsed
-        df.dropna(subset=['Date'], inplace=True)
-
-        for _, row in df.iterrows():
-            try:
-                # Date and Time parsing - now 'Date' is a datetime object
-                flight_date = row['Date'].date()
-                
-                # Make sure times are read as strings before parsing
-                departure_time_str = str(row['Departure Time'])
-                arrival_time_str = str(row['Arrival Time'])
-
-                # Handle cases where time might be just 'HH:MM' without seconds
-                try:
-                    departure_time = datetime.strptime(departure_time_str, '%H:%M').time()
-                except ValueError:
-                    departure_time = datetime.strptime(departure_time_str, '%H:%M:%S').time()
-
-                departure_datetime = datetime.combine(flight_date, departure_time)
-                
-                # Duration is parsed from the 'Total Time' column (source of truth)
-                duration = parse_duration(row['Total Time'])
-                
-                # Arrival datetime is now correctly calculated from the departure time and true duration
-                arrival_time_str, days_offset = parse_arrival_info(arrival_time_str)
+            feather_path = filepath.replace(".xlsx", ".feather")
+            if os.path.exists(feather_path) and is_snapshot_fresh(filepath, feather_path):
+                print(f"Loading flights from fast cache: {feather_path}")
+                df = pd.read_feather(feather_path)
+            else:
+                print(f"Cache not found or stale. Loading from original file: {filepath}")
+                df = pd.read_excel(filepath)
+                # Save the dataframe to a feather file for future fast loading
+                df.to_feather(feather_path)
+                print(f"Cache created at: {feather_path}")
+
+    with tracing.span("load_flights.parse"):
+        return prepare_flight_frame(df)
+
+def prepare_flight_frame(df):
+    """Normalizes the columns of a freshly read frame and parses its 'Date' column (in place)."""
+    import pandas as pd
+
+    normalize_columns(df)
+    # Convert 'Date' column to datetime, coercing errors to NaT
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    # Drop rows where 'Date' could not be parsed
+    df.dropna(subset=['Date'], inplace=True)
+    return df
+
+def read_flight_tables(filepath: str):
+    """read_flight_table over every source of a file, directory or glob, concatenated."""
+    import pandas as pd
+
+    tables = [read_flight_table(path) for path in resolve_sources(filepath)]
+    if len(tables) == 1:
+        return tables[0]
+    if not tables:
+        raise FileNotFoundError(filepath)
+    return pd.concat(tables, ignore_index=True)
+
+def parse_source_file(filepath: str) -> List[Flight]:
+    """
+    Parses one source file into one Flight per row (class variants not merged yet).
+    Runs in the worker processes of a multi-file load, so it must stay importable.
+    """
+    flights = []
+
+    try:
+        df = read_flight_table(filepath)
+
+        with tracing.span("load_flights.build_objects", rows=len(df)):
+            for _, row in df.iterrows():
                 try:
-                    arrival_time = datetime.strptime(arrival_time_str, '%H:%M').time()
-                except (ValueError, AttributeError):
-                    arrival_time = datetime.strptime(arrival_time_str, '%H:%M:%S').time()
-                
-                # Calculate arrival datetime with day offset
-                arrival_datetime = datetime.combine(flight_date + timedelta(days=days_offset), arrival_time)
-                
-                
-                transfer_info = str(row['Transfer Info'])
-                if "转" in transfer_info:
-                    match = re.search(r'(\d+)', transfer_info)
-                    transfers = int(match.group(1)) if match else 0
-                else:
-                    transfers = 0
-                
-                flight_number = str(row['Plane'])
-
-                # Handle flight class; get the value from the correct 'Flight Class' column.
-                flight_class = str(row.get('Flight Class', 'Economy')).strip()
-\
-                # Get Visa Info, provide a default value if missing
-                # --- MODIFIED LOGIC FOR VISA INFO ---
-                raw_visa_info = row.get('Visa Info')
-                # pd.isna is a robust way to check for blank/empty values in pandas
-                if pd.isna(raw_visa_info):
-                    visa_info = 'N/A'
-                else:
-                    visa_info = str(raw_visa_info).strip()
-
-                # Create Flight object
-                flight = Flight(
-                    date=flight_date,
-                    airline=row['Company (Airline)'],
-                    flight_number=flight_number if flight_number else "N/A",
-                    flight_class=flight_class,
-                    departure_city_code=row['From'],
-                    arrival_city_code=row['To'],
-                    departure_time=departure_datetime.time(),
-                    arrival_time=arrival_datetime.time(),
-                    departure_datetime=departure_datetime,
-                    arrival_datetime=arrival_datetime,
-                    duration=duration,
-                    transfers=transfers,
-                    transfer_info=transfer_info,
-                    visa_info=visa_info, # <-- ADD THIS LINE
-                    direct_flight=(transfers == 0)
-                )
-                flights.append(flight)
-            except (ValueError, KeyError, IndexError, AttributeError) as e:
-                print(f"Warning: Could not parse row: {row}. Error: {e}. Skipping.")
-                continue
+                    flights.append(flight_from_row(row))
+                except (ValueError, KeyError, IndexError, AttributeError) as e:
+                    print(f"Warning: Could not parse row: {row}. Error: {e}. Skipping.")
+                    continue
     except FileNotFoundError:
         print(f"Error: Data file not found at {filepath}.")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        print(f"An unexpected error occurred while reading {filepath}: {e}")
+    return flights
+
+def load_flights(
+    filepath: str = "merged_flight_data.xlsx"
+) -> List[Flight]:
+    """
+    Loads flight data from a file, a directory of source files or a glob (xlsx, csv or parquet).
+    Workbooks load from a fast Feather cache if it exists and is fresh; if not, the Excel
+    file is read and the cache created. Several sources are parsed in parallel worker
+    processes; overlapping rows are deduplicated when class variants are merged.
+    pandas is imported (by read_flight_table) rather than at module level so that callers which only
+    need the prebuilt snapshot (see load_flights_fast) never pay for the import.
+    """
+    sources = resolve_sources(filepath)
+    if not sources:
+        print(f"Error: No flight data files found at {filepath}.")
+        return []
+
+    if len(sources) == 1:
+        flights = parse_source_file(sources[0])
+    else:
+        workers = min(len(sources), os.cpu_count() or 1)
+        print(f"Parsing {len(sources)} source files with {workers} worker processes...")
+        flights = []
+        with tracing.span("load_flights.parallel_parse", sources=len(sources), workers=workers):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map() keeps source order, so the first source wins when rows overlap.
+                for path, source_flights in zip(sources, executor.map(parse_source_file, sources)):
+                    print(f"  {path}: {len(source_flights)} rows")
+                    flights.extend(source_flights)
+
+    with tracing.span("load_flights.merge_classes", rows=len(flights)):
+        return merge_class_variants(flights)
 
+# --- Streaming ingest ---
+# Reads sources in batches and appends each parsed batch straight to a FlightStore,
+# so neither the whole raw frame nor the whole Flight list is ever held at once.
+STREAMING_EXTENSIONS = (".csv", ".parquet")
+STREAM_BATCH_ROWS = 50_000
+
+def iter_source_frames(filepath: str, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator:
+    """
+    Yields one source file as DataFrames of at most batch_rows rows. CSV is read in
+    chunks and Parquet by record batch (when pyarrow is installed); workbooks can't be
+    read partially, so they are read whole and handed out in slices.
+    """
+    import pandas as pd
+
+    lower = filepath.lower()
+    if lower.endswith(".csv"):
+        yield from pd.read_csv(filepath, chunksize=batch_rows)
+        return
+    if lower.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            pq = None
+        if pq is not None:
+            for batch in pq.ParquetFile(filepath).iter_batches(batch_size=batch_rows):
+                yield batch.to_pandas()
+            return
+        df = pd.read_parquet(filepath)
+    else:
+        df = pd.read_excel(filepath)
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows].copy()
+
+def iter_flight_batches(filepath: str, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[List[Flight]]:
+    """Parses every source of a file, directory or glob batch by batch, yielding row flights."""
+    for path in resolve_sources(filepath):
+        for df in iter_source_frames(path, batch_rows):
+            prepare_flight_frame(df)
+            columns = list(df.columns)
+            flights = []
+            for values in df.itertuples(index=False, name=None):
+                row = dict(zip(columns, values))
+                try:
+                    flights.append(flight_from_row(row))
+                except (ValueError, KeyError, IndexError, AttributeError) as e:
+                    print(f"Warning: Could not parse row: {row}. Error: {e}. Skipping.")
+            del df  # Free the raw frame before the next batch is read
+            yield flights
+
+def load_flights_streaming(
+    filepath: str,
+    store_path: str,
+    batch_rows: int = STREAM_BATCH_ROWS
+) -> Optional[FlightStore]:
+    """
+    Streams every source into a flight store at store_path (class variants merged as
+    rows arrive) and maps it. Peak memory is one batch plus the merge keys.
+    """
+    with tracing.span("load_flights.streaming", path=filepath, batch_rows=batch_rows):
+        with FlightStoreWriter(store_path, merge_classes=True) as writer:
+            parsed = 0
+            for batch in iter_flight_batches(filepath, batch_rows):
+                parsed += len(batch)
+                writer.extend(batch)
+                print(f"  Streamed {parsed} rows ({len(writer)} flights)...")
+    if len(writer) < parsed:
+        print(f"Merged {parsed} flight rows into {len(writer)} flights (class variants combined).")
+    return load_snapshot(store_path)
+
+def can_stream(filepath: str) -> bool:
+    """True if every source of filepath is a CSV or Parquet file."""
+    sources = resolve_sources(filepath)
+    return bool(sources) and all(path.lower().endswith(STREAMING_EXTENSIONS) for path in sources)
+
+def merge_class_variants(flights: List[Flight]) -> List[Flight]:
+    """
+    Merges the rows that list the same physical flight once per 'Flight Class' (same
+    airline, flight number, route and times) into one Flight whose flight_class_ids
+    holds every available class. The search then branches once per physical flight.
+    Duplicate rows (e.g. the same flight in two overlapping exports) collapse the same way.
+    """
+    merged: Dict[tuple, Flight] = {}
+    for flight in flights:
+        key = (
+            flight.airline_id, flight.flight_number_id,
+            flight.departure_city_id, flight.arrival_city_id,
+            flight.departure_datetime, flight.arrival_datetime, flight.duration
+        )
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = flight
+        else:
+            # Copy instead of updating in place: the row flights may be reused by a reload.
+            merged[key] = replace(existing, flight_class_ids=existing.flight_class_ids | flight.flight_class_ids)
+    if len(merged) < len(flights):
+        print(f"Merged {len(flights)} flight rows into {len(merged)} flights (class variants combined).")
+    return list(merged.values())
+
+
+# --- Delta ingestion (used by the hot reload in dataset.py) ---
+RowKey = Tuple[str, str, str, date, int]
+
+def source_signature(path: str) -> Optional[Tuple[int, ...]]:
+    """
+    (size, mtime in ns) of a file, or None if it doesn't exist. Changes when the file does.
+    For a directory or glob: total size, newest mtime and file count over its sources.
+    """
+    if os.path.isdir(path) or _is_glob(path):
+        stats = []
+        for source in resolve_sources(path):
+            try:
+                stats.append(os.stat(source))
+            except OSError:
+                continue
+        if not stats:
+            return None
+        return sum(s.st_size for s in stats), max(s.st_mtime_ns for s in stats), len(stats)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def row_content_hash(values) -> int:
+    # Stable across processes (str hashes are salted per process), so saved indexes stay valid.
+    text = "\x1f".join(str(value) for value in values)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def ingest_changed_rows(
+    df,
+    previous_rows: Mapping[RowKey, Tuple[int, Flight]]
+) -> Tuple[Dict[RowKey, Tuple[int, Flight]], int]:
+    """
+    Builds the row index of a freshly read sheet, keyed on airline, flight number, class
+    and date (plus a counter for repeated keys). Rows whose content hash matches the
+    previous index (a dict, or a SavedRowIndex) reuse their Flight; only added or
+    changed rows are parsed. Returns the new index and the number of rows parsed.
+    """
+    rows: Dict[RowKey, Tuple[int, Flight]] = {}
+    occurrences: Dict[tuple, int] = defaultdict(int)
+    parsed = 0
+    columns = list(df.columns)
+    for values in df.itertuples(index=False, name=None):
+        row = dict(zip(columns, values))
+        try:
+            base_key = (
+                str(row['Company (Airline)']), str(row['Plane']),
+                str(row.get('Flight Class', 'Economy')).strip(), row['Date'].date()
+            )
+        except (KeyError, AttributeError) as e:
+            print(f"Warning: Could not key row: {row}. Error: {e}. Skipping.")
+            continue
+        key = base_key + (occurrences[base_key],)
+        occurrences[base_key] += 1
+        content_hash = row_content_hash(values)
+        previous = previous_rows.get(key)
+        if previous is not None and previous[0] == content_hash:
+            rows[key] = previous
+            continue
+        try:
+            rows[key] = (content_hash, flight_from_row(row))
+            parsed += 1
+        except (ValueError, KeyError, IndexError, AttributeError) as e:
+            print(f"Warning: Could not parse row: {row}. Error: {e}. Skipping.")
+    return rows, parsed
+
+# The row index is saved next to the snapshot, so the first reload after a start from
+# the snapshot only parses changed rows too: the row flights as a store of their own
+# (<stem>.rows.flights) and the keys and content hashes, in the same order, as JSON
+# (<stem>.rows.json), tagged with the source_signature of the data they came from.
+def row_index_paths(snapshot_path: str) -> Tuple[str, str]:
+    stem = os.path.splitext(snapshot_path)[0]
+    return stem + ".rows.flights", stem + ".rows.json"
+
+def save_row_index(rows: Dict[RowKey, Tuple[int, Flight]], signature: Tuple[int, ...], snapshot_path: str) -> None:
+    flights_path, keys_path = row_index_paths(snapshot_path)
+    write_flight_store((flight for _, flight in rows.values()), flights_path)
+    entries = [
+        [airline, plane, flight_class, day.isoformat(), occurrence, content_hash]
+        for (airline, plane, flight_class, day, occurrence), (content_hash, _) in rows.items()
+    ]
+    tmp_path = keys_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"signature": list(signature), "rows": entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, keys_path)
+
+class SavedRowIndex:
+    """
+    A row index read back by load_row_index. Lookups decode the row's flight from the
+    mapped store, so holding the index costs no Flight objects.
+    """
+
+    def __init__(self, positions: Dict[RowKey, Tuple[int, int]], flights: FlightStore):
+        self._positions = positions  # key -> (content hash, row in flights)
+        self._flights = flights
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def get(self, key: RowKey, default=None) -> Optional[Tuple[int, Flight]]:
+        entry = self._positions.get(key)
+        if entry is None:
+            return default
+        content_hash, position = entry
+        return content_hash, self._flights[position]
+
+def load_row_index(snapshot_path: str, signature: Optional[Tuple[int, ...]]) -> Optional[SavedRowIndex]:
+    """The saved row index, or None if it is missing, unreadable or not for `signature`."""
+    if signature is None:
+        return None
+    flights_path, keys_path = row_index_paths(snapshot_path)
+    try:
+        with open(keys_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if tuple(saved["signature"]) != tuple(signature):
+            return None
+        flights = FlightStore.open(flights_path)
+        if flights is None or len(flights) != len(saved["rows"]):
+            return None
+        positions = {
+            (airline, plane, flight_class, date.fromisoformat(day), occurrence): (content_hash, position)
+            for position, (airline, plane, flight_class, day, occurrence, content_hash) in enumerate(saved["rows"])
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return SavedRowIndex(positions, flights)
+
+
+# --- Prebuilt binary snapshot ---
+# The snapshot is a memory-mapped FlightStore (see flight_store.py), so loading it needs
+# neither pandas nor any row parsing, and all processes on the host share its pages.
+# It is rebuilt whenever the source file is newer.
+def snapshot_path_for(filepath: str) -> str:
+    """Returns the snapshot file path that belongs to a source data file, directory or glob."""
+    if _is_glob(filepath):
+        # A pattern can't name a file; key the snapshot on the pattern instead.
+        return os.path.join(os.path.dirname(filepath) or ".", f"sources-{zlib.crc32(filepath.encode()):08x}.flights")
+    if os.path.isdir(filepath):
+        return filepath.rstrip("/\\") + ".flights"
+    return os.path.splitext(filepath)[0] + ".flights"
+
+def save_snapshot(flights: List[Flight], snapshot_path: str) -> None:
+    """Writes parsed flights to a memory-mappable snapshot."""
+    write_flight_store(flights, snapshot_path)
+
+def load_snapshot(snapshot_path: str) -> Optional[FlightStore]:
+    """Maps a snapshot. Returns None if it is missing, stale in format or unreadable."""
+    return FlightStore.open(snapshot_path)
+
+def is_snapshot_fresh(filepath: str, snapshot_path: str) -> bool:
+    """True if the snapshot exists and is at least as new as the source file(s)."""
+    if not os.path.exists(snapshot_path):
+        return False
+    if os.path.isdir(filepath) or _is_glob(filepath):
+        # The directory's own mtime covers removed files; the sources cover edited ones.
+        sources = resolve_sources(filepath) + ([filepath] if os.path.isdir(filepath) else [])
+        snapshot_mtime = os.path.getmtime(snapshot_path)
+        return all(os.path.getmtime(source) <= snapshot_mtime for source in sources if os.path.exists(source))
+    if not os.path.exists(filepath):
+        # Shipped without the source spreadsheet; the snapshot is all we have.
+        return True
+    return os.path.getmtime(snapshot_path) >= os.path.getmtime(filepath)
+
+def load_flights_fast(
+    filepath: str = "merged_flight_data.xlsx",
+    progress: Optional[Callable[[str, float], None]] = None
+) -> Sequence[Flight]:
+    """
+    Startup path: maps the prebuilt snapshot when it is fresh, and only falls back to
+    the full (pandas) parse of load_flights when it is missing or out of date.
+    After a parse the snapshot is written and the freshly mapped store is returned,
+    so every caller reads flights the same way. CSV/Parquet sources are streamed
+    straight into the snapshot (see load_flights_streaming) to bound peak memory.
+    `progress` is called with a message and a completion fraction between 0 and 1.
+    """
+    def report(message: str, fraction: float):
+        print(message)
+        if progress:
+            progress(message, fraction)
+
+    snapshot_path = snapshot_path_for(filepath)
+    if is_snapshot_fresh(filepath, snapshot_path):
+        report(f"Mapping flights from snapshot: {snapshot_path}", 0.1)
+        flights = load_snapshot(snapshot_path)
+        if flights is not None:
+            report(f"Loaded {len(flights)} flights from snapshot.", 1.0)
+            return flights
+        report("Snapshot unreadable, rebuilding it.", 0.1)
+
+    if can_stream(filepath):
+        report(f"Streaming flight data into snapshot: {filepath}", 0.2)
+        try:
+            flights = load_flights_streaming(filepath, snapshot_path)
+        except OSError as e:
+            print(f"Warning: Could not stream into snapshot {snapshot_path}: {e}")
+        else:
+            if flights is not None:
+                report(f"Loaded {len(flights)} flights.", 1.0)
+                return flights
+
+    report(f"Parsing flight data: {filepath}", 0.2)
+    flights = load_flights(filepath)
+    if flights:
+        report("Writing snapshot for faster startup...", 0.9)
+        try:
+            save_snapshot(flights, snapshot_path)
+            flights = load_snapshot(snapshot_path) or flights
+        except OSError as e:
+            print(f"Warning: Could not write snapshot {snapshot_path}: {e}")
+    report(f"Loaded {len(flights)} flights.", 1.0)
     return flights
 
+def flight_on_date(base_flight: Flight, flight_date: date) -> Flight:
+    """Returns a copy of a (weekly) base flight that departs on the given date."""
+    # Calculate the difference in days from the base flight's date
+    # This is important for multi-day flights
+    arrival_date_offset = (base_flight.arrival_datetime.date() - base_flight.departure_datetime.date()).days
+
+    new_departure_datetime = datetime.combine(flight_date, base_flight.departure_time)
+    new_arrival_datetime = datetime.combine(flight_date + timedelta(days=arrival_date_offset), base_flight.arrival_time)
+
+    return Flight(
+        date=flight_date,
+        airline_id=base_flight.airline_id,
+        flight_number_id=base_flight.flight_number_id,
+        flight_class_id=base_flight.flight_class_id,
+        flight_class_ids=base_flight.flight_class_ids,
+        departure_city_id=base_flight.departure_city_id,
+        arrival_city_id=base_flight.arrival_city_id,
+        departure_time=base_flight.departure_time,
+        arrival_time=base_flight.arrival_time,
+        departure_datetime=new_departure_datetime,
+        arrival_datetime=new_arrival_datetime,
+        duration=base_flight.duration,
+        transfers=base_flight.transfers,
+        transfer_info_id=base_flight.transfer_info_id,
+        visa_info_id=base_flight.visa_info_id,
+        direct_flight=base_flight.direct_flight
+    )
+
 def expand_flights_for_date_range(
     base_flights: List[Flight], 
     start_date: date, 
@@ -183,42 +666,19 @@ def expand_flights_for_date_range(
     Expands a list of base flights to cover a given date range.
     It assumes the base flights represent a typical week's schedule.
     """
-    flights_by_weekday = defaultdict(list)
-    for flight in base_flights:
-        flights_by_weekday[flight.date.weekday()].append(flight)
-
-    expanded_flights = []
-    current_date = start_date
-    while current_date <= end_date:
-        weekday = current_date.weekday()
-        if weekday in flights_by_weekday:
-            for base_flight in flights_by_weekday[weekday]:
-                # Calculate the difference in days from the base flight's date
-                # This is important for multi-day flights
-                arrival_date_offset = (base_flight.arrival_datetime.date() - base_flight.departure_datetime.date()).days
-                
-                new_departure_datetime = datetime.combine(current_date, base_flight.departure_time)
-                new_arrival_datetime = datetime.combine(current_date + timedelta(days=arrival_date_offset), base_flight.arrival_time)
-
-                new_flight = Flight(
-                    date=current_date,
-                    airline=base_flight.airline,
-                    flight_number=base_flight.flight_number,
-                    flight_class=base_flight.flight_class,
-                    departure_city_code=base_flight.departure_city_code,
-                    arrival_city_code=base_flight.arrival_city_code,
-                    departure_time=base_flight.departure_time,
-                    arrival_time=base_flight.arrival_time,
-                    departure_datetime=new_departure_datetime,
-                    arrival_datetime=new_arrival_datetime,
-                    duration=base_flight.duration,
-                    transfers=base_flight.transfers,
-                    transfer_info=base_flight.transfer_info,
-                    visa_info=base_flight.visa_info, # <-- ADD THIS LINE
-                    direct_flight=base_flight.direct_flight
-                )
-                expanded_flights.append(new_flight)
-        current_date += timedelta(days=1)
+    with tracing.span("expand_flights_for_date_range", days=(end_date - start_date).days + 1):
+        flights_by_weekday = defaultdict(list)
+        for flight in base_flights:
+            flights_by_weekday[flight.date.weekday()].append(flight)
+
+        expanded_flights = []
+        current_date = start_date
+        while current_date <= end_date:
+            weekday = current_date.weekday()
+            if weekday in flights_by_weekday:
+                for base_flight in flights_by_weekday[weekday]:
+                    expanded_flights.append(flight_on_date(base_flight, current_date))
+            current_date += timedelta(days=1)
     
     print(f"Expanded {len(base_flights)} base flights to {len(expanded_flights)} flights from {start_date} to {end_date}.")
     return expanded_flights
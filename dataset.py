@@ -0,0 +1,181 @@
+import itertools
+import threading
+from typing import Callable, List, Mapping, Optional, Sequence, Tuple
+
+from data_handler import (
+    ingest_changed_rows, load_flights_fast, load_row_index, load_snapshot, merge_class_variants, read_flight_tables,
+    save_row_index, save_snapshot, snapshot_path_for, source_signature
+)
+from models import Flight
+from result_store import dataset_fingerprint
+import tracing
+
+_versions = itertools.count(1)
+
+
+class FlightDataset:
+    """
+    One immutable version of the flight data and the indexes built over it.
+    A search takes the dataset it starts with and keeps using it to the end, so a
+    reload never changes the flights under a running search.
+    """
+
+    def __init__(
+        self,
+        flights: Sequence[Flight],
+        signature: Optional[Tuple[int, ...]],
+        rows: Optional[Mapping[tuple, Tuple[int, Flight]]] = None
+    ):
+        self.flights = flights
+        self.version = next(_versions)
+        self.signature = signature  # source_signature() of the file this version was read from
+        # Row index from ingest_changed_rows, or the SavedRowIndex of a snapshot; None
+        # until one is available (the next reload then parses every row).
+        self.rows = rows
+        self._fingerprint: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.flights)
+
+    @property
+    def fingerprint(self) -> str:
+        """Content hash of the flights (see dataset_fingerprint), computed on first use."""
+        if self._fingerprint is None:
+            self._fingerprint = dataset_fingerprint(self.flights)
+        return self._fingerprint
+
+
+class DatasetManager:
+    """
+    Owns the current FlightDataset and hot-reloads it when the source file changes.
+
+    reload() reads the sheet again, parses only the rows that were added or changed
+    (see ingest_changed_rows), writes the new snapshot and serves the new dataset from
+    it, and then swaps it in with a single reference assignment. Readers take `current`
+    once per search.
+    on_swap(dataset, parsed_rows) is called from the reloading thread after a swap.
+    Each reload saves its row index next to the snapshot (see save_row_index), and
+    load() picks it up, so the first reload after a start is incremental as well.
+    """
+
+    def __init__(self, filepath: str, on_swap: Optional[Callable[[FlightDataset, int], None]] = None):
+        self.filepath = filepath
+        self.on_swap = on_swap
+        self._current: Optional[FlightDataset] = None
+        self._reload_lock = threading.Lock()  # One reload at a time
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def current(self) -> Optional[FlightDataset]:
+        return self._current
+
+    def load(self, progress: Optional[Callable[[str, float], None]] = None) -> FlightDataset:
+        """
+        Initial load through the snapshot fast path, with the saved row index. Without
+        one (first run, or a snapshot written by load_flights_fast), it is built from the
+        sheet in the background.
+        """
+        signature = source_signature(self.filepath)
+        flights = load_flights_fast(self.filepath, progress=progress)
+        rows = load_row_index(snapshot_path_for(self.filepath), signature)
+        self._current = FlightDataset(flights, signature, rows)
+        if rows is None and signature is not None:
+            threading.Thread(target=self._index_rows, args=(self._current,), daemon=True).start()
+        return self._current
+
+    def _index_rows(self, dataset: FlightDataset) -> None:
+        with self._reload_lock:
+            if self._current is not dataset or source_signature(self.filepath) != dataset.signature:
+                return  # Changed already: the reload parses it in full
+            with tracing.span("dataset.index_rows", path=self.filepath):
+                try:
+                    df = read_flight_tables(self.filepath)
+                    rows, _ = ingest_changed_rows(df, {})
+                    del df
+                    if source_signature(self.filepath) != dataset.signature:
+                        return  # Read a newer version than the dataset's
+                    snapshot_path = snapshot_path_for(self.filepath)
+                    save_row_index(rows, dataset.signature, snapshot_path)
+                except Exception as e:  # Only costs the first reload its speed-up
+                    print(f"Warning: Could not index the rows of {self.filepath}: {e}")
+                    return
+                del rows
+                # The mapped index instead of the parsed rows: no Flights stay in memory.
+                dataset.rows = load_row_index(snapshot_path, dataset.signature)
+        print(f"Row index of {self.filepath} saved for incremental reloads.")
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuilds the dataset if the source file changed since the current version was read.
+        Returns True if a new version was swapped in.
+        """
+        with self._reload_lock:
+            previous = self._current
+            signature = source_signature(self.filepath)
+            if signature is None:
+                print(f"Warning: {self.filepath} is missing; keeping the loaded flights.")
+                return False
+            if not force and previous is not None and previous.signature == signature:
+                return False
+
+            with tracing.span("dataset.reload", path=self.filepath):
+                try:
+                    df = read_flight_tables(self.filepath)
+                except Exception as e:  # A half-written file must not take the app down
+                    print(f"Warning: Could not reload {self.filepath}: {e}")
+                    return False
+                # Without a row index (not built yet) the reload parses everything.
+                previous_rows = previous.rows if previous is not None and previous.rows is not None else {}
+                rows, parsed = ingest_changed_rows(df, previous_rows)
+                del df
+                flights = merge_class_variants([flight for _, flight in rows.values()])
+                dataset = self._mapped_dataset(flights, rows, signature)
+
+            self._current = dataset
+            print(f"Flight data reloaded: version {dataset.version}, {len(dataset)} flights, {parsed} rows parsed.")
+            if self.on_swap:
+                self.on_swap(dataset, parsed)
+            return True
+
+    def _mapped_dataset(
+        self,
+        flights: List[Flight],
+        rows: Mapping[tuple, Tuple[int, Flight]],
+        signature: Tuple[int, ...]
+    ) -> FlightDataset:
+        # Write the new version's snapshot and row index and serve it from those maps,
+        # like the initial load; the parsed Flights are dropped. If the snapshot can't be
+        # written or mapped, the version runs from the parsed lists instead.
+        snapshot_path = snapshot_path_for(self.filepath)
+        try:
+            save_snapshot(flights, snapshot_path)
+            save_row_index(rows, signature, snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not update snapshot: {e}")
+            return FlightDataset(flights, signature, rows)
+        store = load_snapshot(snapshot_path)
+        saved_rows = load_row_index(snapshot_path, signature)
+        return FlightDataset(
+            store if store is not None else flights,
+            signature,
+            saved_rows if saved_rows is not None else rows
+        )
+
+    def start_watching(self, interval: float = 5.0) -> None:
+        """Polls the source file every `interval` seconds and reloads it in the background."""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop_watching.clear()
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                current = self._current
+                if current is not None and source_signature(self.filepath) not in (None, current.signature):
+                    self.reload()
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
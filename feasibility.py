@@ -0,0 +1,124 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from csa import ConnectionScan
+
+# --- Time-window feasibility bounds ---
+# Per-query upper bounds on how late a path may be at a city and still finish in the
+# date window. Everything is computed in one backward sweep over the connection array
+# of a ConnectionScan (latest departure first), using only the minimum layover: dropping the maximum
+# layover and the country rules can only make the bounds looser, so a path that fails
+# them can never be completed and is safe to prune.
+#
+# "Ready" times are arrival times, in minutes on the search's timeline (see timeline.py):
+# a path that arrives at a city at time t can take any flight from there that departs
+# at t + min_layover or later.
+
+NEVER = -(1 << 62)  # Ready time for "can't do it at all"
+ALWAYS = 1 << 62    # Ready time for "already done"
+
+
+class FeasibilityBounds:
+    """
+    latest_ready(hops, city): the latest arrival at `city` that still allows `hops`
+    more connecting flights inside the window.
+    countries_reachable(city, t, visited, needed): whether at least `needed` countries
+    outside `visited` can still be reached from `city` when ready at `t`.
+    latest_ready_for_city(city): the latest arrival that can still reach `target_city`.
+
+    Bounds only hold for ready times at or after `valid_from`: in periodic mode they are
+    computed over the last weeks of the window only (see find_best_travel_plan), and
+    earlier paths are never pruned by them.
+    """
+
+    def __init__(
+        self,
+        scan: ConnectionScan,
+        max_hops: int,
+        city_country: Sequence[Optional[str]],
+        target_city: Optional[int] = None,
+        valid_from: int = NEVER
+    ):
+        self.valid_from = valid_from
+        min_layover = scan.min_layover
+
+        # Flights are swept latest departure first, so the first bound recorded for a
+        # city is its largest one: later (earlier-departing) flights never replace it.
+        # Flights departing after f.arrival were swept already, so every bound
+        # read for the destination is final for that arrival time.
+        # _latest_ready[h][city]; h = 0 needs no more flights.
+        self._latest_ready: List[Dict[int, int]] = [{} for _ in range(max_hops + 1)]
+        country_reach: Dict[int, Dict[str, int]] = defaultdict(dict)
+        target_ready: Dict[int, int] = {}
+        if target_city is not None:
+            target_ready[target_city] = ALWAYS
+
+        for f in reversed(scan.connections):
+            ready = f.departure - min_layover
+            arrival = f.arrival
+            origin, destination = f.departure_city_id, f.arrival_city_id
+            if origin == destination:
+                continue  # Never part of a useful path, and would alias the dicts below
+            latest_ready = self._latest_ready
+            if origin not in latest_ready[1]:
+                latest_ready[1][origin] = ready
+            for h in range(2, max_hops + 1):
+                if origin not in latest_ready[h] and arrival <= latest_ready[h - 1].get(destination, NEVER):
+                    latest_ready[h][origin] = ready
+            origin_reach = country_reach[origin]
+            destination_country = city_country[destination]
+            if destination_country and destination_country not in origin_reach:
+                origin_reach[destination_country] = ready
+            for country, latest in country_reach[destination].items():
+                if country not in origin_reach and arrival <= latest:
+                    origin_reach[country] = ready
+            if target_city is not None and origin not in target_ready and arrival <= target_ready.get(destination, NEVER):
+                target_ready[origin] = ready
+
+        self._target_ready = target_ready
+        # Per city, the countries it can reach, latest ready time first.
+        self._country_reach: Dict[int, List[Tuple[int, str]]] = {
+            city: sorted(((ready, country) for country, ready in reach.items()), reverse=True)
+            for city, reach in country_reach.items()
+        }
+
+    def latest_ready(self, hops: int, city: int) -> int:
+        if hops == 0:
+            return ALWAYS
+        if hops >= len(self._latest_ready):
+            return NEVER
+        return self._latest_ready[hops].get(city, NEVER)
+
+    def latest_ready_for_city(self, city: int) -> int:
+        return self._target_ready.get(city, NEVER)
+
+    def countries_reachable(self, city: int, ready: int, visited: frozenset, needed: int) -> bool:
+        if needed <= 0:
+            return True
+        found = 0
+        for latest, country in self._country_reach.get(city, ()):
+            if latest < ready:
+                break
+            if country not in visited:
+                found += 1
+                if found >= needed:
+                    return True
+        return False
+
+    def is_hopeless(
+        self,
+        city: int,
+        ready: int,
+        visited_countries: frozenset,
+        countries_needed: int,
+        needs_target_city: bool
+    ) -> bool:
+        """True if a path at `city` since `ready` provably can't be completed in the window."""
+        if ready < self.valid_from:
+            return False
+        hops_needed = max(countries_needed, 1 if needs_target_city else 0)
+        if hops_needed and ready > self.latest_ready(hops_needed, city):
+            return True
+        if needs_target_city and ready > self._target_ready.get(city, NEVER):
+            return True
+        return not self.countries_reachable(city, ready, visited_countries, countries_needed)
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections.abc import Sequence
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import (
+    Flight, AIRLINES, FLIGHT_NUMBERS, FLIGHT_CLASSES, CITY_CODES, TRANSFER_INFOS, VISA_INFOS
+)
+
+# --- Memory-mapped flight store ---
+# A fixed-width binary layout of the normalized flight table. Opening a store only
+# maps the file and decodes the (small) string tables; the rows stay in the OS page
+# cache and are shared by every process that opens the same file. Flight objects are
+# materialized from the mapped bytes as they are read.
+#
+# File layout (little endian):
+#   header   MAGIC, version, row count, string table offset/length, rows offset
+#   strings  UTF-8 JSON list with one string table per STRING_COLUMNS entry; the
+#            string columns of a row are indexes into their column's table
+#   rows     one ROW_STRUCT record per flight
+MAGIC = b"FLTSTORE"
+STORE_VERSION = 3
+HEADER_STRUCT = struct.Struct("<8sIIQQQ")
+ROW_STRUCT = struct.Struct(
+    "<i"        # date (proleptic ordinal)
+    "I"         # departure time (seconds since midnight)
+    "I"         # arrival time (seconds since midnight)
+    "h"         # arrival day offset relative to the departure date
+    "i"         # duration (seconds)
+    "h"         # transfers
+    "B"         # flags: bit 0 = direct flight
+    "I"         # available classes: bit i set = entry i of the class table
+    "IIIIIII"   # airline, flight number, class, from, to, transfer info, visa info
+)
+FLAG_DIRECT = 1
+# Position of the class mask within a row, for merging class variants in place.
+CLASS_MASK_OFFSET = struct.calcsize("<iIIhihB")
+CLASS_MASK_STRUCT = struct.Struct("<I")
+MAX_CLASSES = 32  # Width of the class bitmask
+# Vocabulary of each string column, in ROW_STRUCT order.
+STRING_COLUMNS = [AIRLINES, FLIGHT_NUMBERS, FLIGHT_CLASSES, CITY_CODES, CITY_CODES, TRANSFER_INFOS, VISA_INFOS]
+
+
+def _seconds_of_day(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+def _time_from_seconds(seconds: int) -> time:
+    return time(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+class FlightStoreWriter:
+    """
+    Appends flights to a new store one at a time, so a load never needs the whole flight
+    list in memory: rows are buffered and spilled to a temporary file, and the store is
+    assembled (atomically, via a temp file) by close(). Without a path, write_to()
+    hands the finished store to any binary file object instead.
+
+    With merge_classes=True, a flight that repeats an already written physical flight
+    (same key as data_handler.merge_class_variants) only adds its classes to that row.
+    """
+
+    FLUSH_ROWS = 4096
+
+    def __init__(self, path: Optional[str], merge_classes: bool = False):
+        self.path = path
+        self.merge_classes = merge_classes
+        # Per-column tables hold only the values the flights use, so a store does not
+        # depend on what else the writing process had encoded.
+        self._tables: List[List[str]] = [[] for _ in STRING_COLUMNS]
+        self._table_ids: List[Dict[int, int]] = [{} for _ in STRING_COLUMNS]
+        self._row_keys: Dict[tuple, int] = {}
+        self._buffer = bytearray()
+        self._flushed_rows = 0
+        self._row_count = 0
+        # Anonymous temp file next to the store (or in the system temp dir without a path).
+        self._rows_file = tempfile.TemporaryFile(dir=(os.path.dirname(path) or ".") if path else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def _string_id(self, column: int, code: int) -> int:
+        ids = self._table_ids[column]
+        if code not in ids:
+            ids[code] = len(self._tables[column])
+            self._tables[column].append(STRING_COLUMNS[column].decode(code))
+        return ids[code]
+
+    def _class_mask(self, class_ids) -> int:
+        mask = 0
+        for code in class_ids:
+            bit = self._string_id(2, code)
+            if bit >= MAX_CLASSES:
+                raise ValueError(f"A flight store holds at most {MAX_CLASSES} distinct flight classes")
+            mask |= 1 << bit
+        return mask
+
+    def append(self, f: Flight) -> None:
+        class_mask = self._class_mask(f.flight_class_ids)
+        if self.merge_classes:
+            key = (
+                f.airline_id, f.flight_number_id, f.departure_city_id, f.arrival_city_id,
+                f.departure_datetime, f.arrival_datetime, f.duration
+            )
+            index = self._row_keys.get(key)
+            if index is not None:
+                self._add_classes(index, class_mask)
+                return
+            self._row_keys[key] = self._row_count
+        self._buffer += ROW_STRUCT.pack(
+            f.date.toordinal(),
+            _seconds_of_day(f.departure_time),
+            _seconds_of_day(f.arrival_time),
+            (f.arrival_datetime.date() - f.departure_datetime.date()).days,
+            int(f.duration.total_seconds()),
+            f.transfers,
+            FLAG_DIRECT if f.direct_flight else 0,
+            class_mask,
+            self._string_id(0, f.airline_id), self._string_id(1, f.flight_number_id),
+            self._string_id(2, f.flight_class_id),
+            self._string_id(3, f.departure_city_id), self._string_id(4, f.arrival_city_id),
+            self._string_id(5, f.transfer_info_id), self._string_id(6, f.visa_info_id)
+        )
+        self._row_count += 1
+        if self._row_count - self._flushed_rows >= self.FLUSH_ROWS:
+            self._flush()
+
+    def extend(self, flights: Iterable[Flight]) -> None:
+        for flight in flights:
+            self.append(flight)
+
+    def _add_classes(self, index: int, class_mask: int) -> None:
+        if index >= self._flushed_rows:
+            # Class variants are usually adjacent rows, so this is the common case.
+            offset = (index - self._flushed_rows) * ROW_STRUCT.size + CLASS_MASK_OFFSET
+            (mask,) = CLASS_MASK_STRUCT.unpack_from(self._buffer, offset)
+            CLASS_MASK_STRUCT.pack_into(self._buffer, offset, mask | class_mask)
+            return
+        offset = index * ROW_STRUCT.size + CLASS_MASK_OFFSET
+        self._rows_file.seek(offset)
+        (mask,) = CLASS_MASK_STRUCT.unpack(self._rows_file.read(CLASS_MASK_STRUCT.size))
+        self._rows_file.seek(offset)
+        self._rows_file.write(CLASS_MASK_STRUCT.pack(mask | class_mask))
+        self._rows_file.seek(0, os.SEEK_END)
+
+    def _flush(self) -> None:
+        self._rows_file.write(self._buffer)
+        self._buffer = bytearray()
+        self._flushed_rows = self._row_count
+
+    def close(self) -> None:
+        """Writes the store file and removes the temporary row file."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            self.write_to(out)
+        self.abort()
+        os.replace(tmp_path, self.path)
+
+    def write_to(self, out) -> None:
+        """Writes the finished store to a binary file object (a file, or a BytesIO)."""
+        self._flush()
+        string_blob = json.dumps(self._tables, ensure_ascii=False).encode("utf-8")
+        strings_offset = HEADER_STRUCT.size
+        rows_offset = strings_offset + len(string_blob)
+        # Keep rows 8-byte aligned so the mapping can be read with aligned views too.
+        padding = (-rows_offset) % 8
+        rows_offset += padding
+
+        out.write(HEADER_STRUCT.pack(MAGIC, STORE_VERSION, self._row_count, strings_offset, len(string_blob), rows_offset))
+        out.write(string_blob)
+        out.write(b"\0" * padding)
+        self._rows_file.seek(0)
+        shutil.copyfileobj(self._rows_file, out)
+
+    def abort(self) -> None:
+        """Discards the temporary row file (and with it everything not written out yet)."""
+        self._rows_file.close()
+
+
+def write_flight_store(flights: Iterable[Flight], path: str) -> None:
+    """Writes flights to a memory-mappable store (atomically, via a temp file)."""
+    with FlightStoreWriter(path) as writer:
+        writer.extend(flights)
+
+
+class FlightStore(Sequence):
+    """
+    Read-only, memory-mapped view of a flight table written by write_flight_store.
+    Behaves like a List[Flight], so it can be passed anywhere base flights are expected.
+    Pickling a store only pickles its path: other processes re-map the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._attach(self._mmap)
+        except ValueError:
+            self._mmap.close()
+            raise
+
+    @classmethod
+    def from_buffer(cls, buffer) -> "FlightStore":
+        """A store over bytes that are already in memory (e.g. a shared memory block)."""
+        store = cls.__new__(cls)
+        store.path = None
+        store._mmap = None
+        store._attach(buffer)
+        return store
+
+    def _attach(self, buffer) -> None:
+        magic, version, row_count, strings_offset, strings_length, rows_offset = HEADER_STRUCT.unpack_from(buffer, 0)
+        if magic != MAGIC or version != STORE_VERSION:
+            raise ValueError(f"{self.path or 'buffer'} is not a version {STORE_VERSION} flight store")
+        self._row_count = row_count
+        self._rows_offset = rows_offset
+        tables = json.loads(bytes(buffer[strings_offset:strings_offset + strings_length]).decode("utf-8"))
+        # Translate each column's table to codes of this process's shared vocabularies.
+        self._codes: List[List[int]] = [
+            [vocabulary.encode(value) for value in table]
+            for vocabulary, table in zip(STRING_COLUMNS, tables)
+        ]
+        self._class_sets: Dict[int, frozenset] = {}
+        self._rows = memoryview(buffer)[rows_offset:rows_offset + row_count * ROW_STRUCT.size]
+
+    @classmethod
+    def open(cls, path: str) -> Optional["FlightStore"]:
+        """Opens a store, returning None if it is missing or not a valid store."""
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def content_digest(self) -> str:
+        """SHA-256 of the flights: the row bytes plus the strings their ids stand for."""
+        digest = hashlib.sha256()
+        for vocabulary, codes in zip(STRING_COLUMNS, self._codes):
+            digest.update(json.dumps([vocabulary.strings[code] for code in codes], ensure_ascii=False).encode("utf-8"))
+        digest.update(self._rows)
+        return digest.hexdigest()
+
+    def close(self) -> None:
+        self._rows.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __reduce__(self):
+        return (FlightStore, (self.path,))
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._row_count))]
+        if index < 0:
+            index += self._row_count
+        if not 0 <= index < self._row_count:
+            raise IndexError("flight store index out of range")
+        return self._flight_from_row(ROW_STRUCT.unpack_from(self._rows, index * ROW_STRUCT.size))
+
+    def __iter__(self) -> Iterator[Flight]:
+        for row in ROW_STRUCT.iter_unpack(self._rows):
+            yield self._flight_from_row(row)
+
+    def _flight_from_row(self, row: Tuple) -> Flight:
+        (ordinal, dep_seconds, arr_seconds, arr_day_offset, duration_seconds, transfers, flags, class_mask,
+         airline, flight_number, flight_class, dep_city, arr_city, transfer_info, visa_info) = row
+        codes = self._codes
+        class_ids = self._class_sets.get(class_mask)
+        if class_ids is None:
+            class_ids = frozenset(code for bit, code in enumerate(codes[2]) if class_mask >> bit & 1)
+            self._class_sets[class_mask] = class_ids
+        flight_date = date.fromordinal(ordinal)
+        departure_time = _time_from_seconds(dep_seconds)
+        arrival_time = _time_from_seconds(arr_seconds)
+        return Flight(
+            date=flight_date,
+            airline_id=codes[0][airline],
+            flight_number_id=codes[1][flight_number],
+            flight_class_id=codes[2][flight_class],
+            flight_class_ids=class_ids,
+            departure_city_id=codes[3][dep_city],
+            arrival_city_id=codes[4][arr_city],
+            departure_time=departure_time,
+            arrival_time=arrival_time,
+            departure_datetime=datetime.combine(flight_date, departure_time),
+            arrival_datetime=datetime.combine(flight_date + timedelta(days=arr_day_offset), arrival_time),
+            duration=timedelta(seconds=duration_seconds),
+            transfers=transfers,
+            transfer_info_id=codes[5][transfer_info],
+            visa_info_id=codes[6][visa_info],
+            direct_flight=bool(flags & FLAG_DIRECT)
+        )
@@ -0,0 +1,175 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from timeline import Leg
+
+# --- Disk-spilling search frontier ---
+# A drop-in for the heapq list in find_best_travel_plan when the frontier may not fit in
+# RAM. Entries are tuples ordered by (cost, counter); the counter is unique, so the
+# rest of an entry is never compared. At most max_in_memory entries stay in the hot
+# heap: when it overflows, its costlier half is written, sorted, to a run file on
+# disk. pop() takes the smallest of the hot heap and the run heads, so entries come
+# out in exactly the order a single in-memory heap would give.
+
+
+class PathCodec:
+    """
+    Encodes search entries (cost, counter, path, countries, cities) into compact
+    picklable tuples for the run files. Legs are replaced by their position in a
+    table of the legs seen so far, which never grows past the search network.
+    """
+
+    def __init__(self):
+        self._flights: List[Leg] = []
+        self._flight_ids: Dict[tuple, int] = {}
+
+    def _flight_id(self, leg: Leg) -> int:
+        # Identity of a leg: its base flight (held by the network for the whole search)
+        # and departure; periodic mode makes a new Leg every time it generates one.
+        key = (id(leg.flight), leg.departure)
+        flight_id = self._flight_ids.get(key)
+        if flight_id is None:
+            flight_id = self._flight_ids[key] = len(self._flights)
+            self._flights.append(leg)
+        return flight_id
+
+    def encode(self, entry: tuple) -> tuple:
+        cost, counter, path, countries, cities = entry
+        return cost, counter, tuple(self._flight_id(f) for f in path), tuple(countries), tuple(cities)
+
+    def decode(self, record: tuple) -> tuple:
+        cost, counter, flight_ids, countries, cities = record
+        return cost, counter, [self._flights[i] for i in flight_ids], frozenset(countries), set(cities)
+
+
+class _Run:
+    """One sorted run file, read back one record at a time."""
+
+    def __init__(self, path: str, length: int):
+        self.path = path
+        self.remaining = length
+        self._file = open(path, "rb")
+        self.head: Optional[tuple] = None
+        self.advance()
+
+    def advance(self) -> bool:
+        """Loads the next record into head; closes and deletes the file at the end."""
+        if self.remaining == 0:
+            self.head = None
+            self.close()
+            return False
+        self.head = pickle.load(self._file)
+        self.remaining -= 1
+        return True
+
+    def records(self) -> Iterator[tuple]:
+        while self.head is not None:
+            record = self.head
+            self.advance()
+            yield record
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self.path)
+
+
+def _sort_key(record: tuple) -> Tuple[Any, int]:
+    return record[0], record[1]
+
+
+class SpillingFrontier:
+    """
+    Priority queue of search entries whose memory use is capped at max_in_memory hot
+    entries (plus one head record per run file). Supports push, pop and len like the
+    heapq list it replaces. Runs are merged once there are more than max_runs of them,
+    to keep the number of open files and the cost of pop bounded.
+    """
+
+    def __init__(
+        self,
+        max_in_memory: int,
+        encode: Callable[[tuple], tuple],
+        decode: Callable[[tuple], tuple],
+        spill_dir: Optional[str] = None,
+        max_runs: int = 16
+    ):
+        self.max_in_memory = max(max_in_memory, 2)
+        self.encode = encode
+        self.decode = decode
+        self.max_runs = max_runs
+        self._hot: List[tuple] = []
+        self._runs: Dict[int, _Run] = {}
+        self._run_heads: List[Tuple[Any, int, int]] = []  # (cost, counter, run number)
+        self._next_run = 0
+        self._cold_count = 0
+        self.spilled_entries = 0
+        self._dir = tempfile.mkdtemp(prefix="frontier-", dir=spill_dir)
+        # Remove the run files even if the search dies before close().
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self._dir, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self._hot) + self._cold_count
+
+    def push(self, entry: tuple) -> None:
+        heapq.heappush(self._hot, entry)
+        if len(self._hot) > self.max_in_memory:
+            self._spill()
+
+    def pop(self) -> tuple:
+        if self._run_heads and (not self._hot or self._run_heads[0][:2] < self._hot[0][:2]):
+            _, _, run_number = heapq.heappop(self._run_heads)
+            run = self._runs[run_number]
+            entry = self.decode(run.head)
+            self._cold_count -= 1
+            if run.advance():
+                heapq.heappush(self._run_heads, (run.head[0], run.head[1], run_number))
+            else:
+                del self._runs[run_number]
+            return entry
+        return heapq.heappop(self._hot)
+
+    def _spill(self) -> None:
+        # A sorted list is a valid heap, so the cheaper half can stay as it is.
+        self._hot.sort()
+        keep = self.max_in_memory // 2
+        cold = self._hot[keep:]
+        del self._hot[keep:]
+        self._add_run(self.encode(entry) for entry in cold)
+        self.spilled_entries += len(cold)
+        if len(self._runs) > self.max_runs:
+            self._merge_runs()
+
+    def _add_run(self, records) -> None:
+        path = os.path.join(self._dir, f"run-{self._next_run}.pickle")
+        length = 0
+        with open(path, "wb") as out:
+            for record in records:
+                pickle.dump(record, out, protocol=pickle.HIGHEST_PROTOCOL)
+                length += 1
+        run = _Run(path, length)
+        self._cold_count += length
+        if run.head is not None:
+            self._runs[self._next_run] = run
+            heapq.heappush(self._run_heads, (run.head[0], run.head[1], self._next_run))
+        self._next_run += 1
+
+    def _merge_runs(self) -> None:
+        runs = list(self._runs.values())
+        self._runs.clear()
+        self._run_heads.clear()
+        self._cold_count = 0
+        self._add_run(heapq.merge(*(run.records() for run in runs), key=_sort_key))
+
+    def close(self) -> None:
+        """Deletes the run files."""
+        for run in self._runs.values():
+            run.close()
+        self._runs.clear()
+        self._run_heads.clear()
+        self._cleanup()
@@ -1,10 +1,17 @@
 # Forcing a reload to fix stale cache issue.
 import flet as ft
+import sqlite3
 import threading
+from collections import OrderedDict
+from functools import lru_cache
 from datetime import timedelta, datetime
-from main import find_best_travel_plan
-from data_handler import load_flights
-from models import CITIES_BY_CODE, get_city_by_code, TravelPlan
+from models import CITIES_BY_CODE, TRANSFER_INFOS, get_city_by_code, TravelPlan
+from network_cache import NetworkCache
+from result_store import ResultStore, find_best_travel_plan_stored
+from search_session import SearchSessionManager
+import tracing
+# NOTE: data_handler (pandas) and main (search) are imported lazily by the
+# background warm-up below so that the window is interactive immediately.
 
 # --- Helper Functions ---
 def format_delta(td: timedelta) -> str:
@@ -16,6 +23,97 @@ def format_delta(td: timedelta) -> str:
         return f"{days}d {int(hours)}h {int(minutes)}m"
     return f"{int(hours)}h {int(minutes)}m"
 
+@lru_cache(maxsize=None)
+def transfer_label(transfer_info_id: int) -> str:
+    """Display text for a transfer info code; evaluated once per vocabulary entry."""
+    transfer_info = TRANSFER_INFOS.decode(transfer_info_id)
+    return '直飞' if 'N/A:' in transfer_info else transfer_info
+
+# --- Result card formatting ---
+# Cards are rendered lazily: the results list shows RESULTS_BATCH_SIZE cards at a time
+# and adds the next batch when the user scrolls close to the end. While a search runs,
+# the best plans so far arrive with its progress updates and replace the cards shown.
+# The formatted text of each plan is cached, so re-showing a plan never re-formats it.
+# Only the results list and the search buttons are sent to the client, never the page.
+RESULTS_BATCH_SIZE = 10
+SCROLL_LOAD_MARGIN = 600  # Pixels from the end of the list that trigger the next batch
+PLAN_CARD_CACHE_SIZE = 500
+_plan_card_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+@lru_cache(maxsize=None)
+def city_label(city_code: str) -> str:
+    """'Country (City)' in Chinese for an IATA code."""
+    city = get_city_by_code(city_code)
+    return f"{city.country_cn} ({city.name_cn})" if city else city_code
+
+@lru_cache(maxsize=None)
+def country_label(city_code: str) -> str:
+    city = get_city_by_code(city_code)
+    return city.country_cn if city else city_code
+
+# Infeasibility codes (see precheck.py) shown to the user; details fill the placeholders.
+INFEASIBILITY_MESSAGES = {
+    "city_not_in_scope": "{city} 不在所选城市范围内",
+    "too_few_countries": "所选城市只覆盖 {available} 个国家，少于要求的 {required} 个",
+    "too_many_forced_cities": "必经城市（{forced} 个）多于要访问的国家数（{required} 个）",
+    "no_flights": "筛选后所选时间范围内没有航班",
+    "start_city_no_flights": "所选时间范围内没有从 {city} 出发的航班",
+    "end_city_no_flights": "所选时间范围内没有到达 {city} 的航班",
+    "forced_city_no_flights": "必经城市 {city} 在所选时间范围内没有航班",
+    "end_city_unreachable": "从 {start_city} 无法到达 {city}",
+    "forced_city_unreachable": "从 {start_city} 无法到达必经城市 {city}",
+    "too_few_reachable_countries": "从 {start_city} 只能到达 {reachable} 个国家，少于要求的 {required} 个",
+}
+
+def infeasibility_text(infeasibility) -> str:
+    details = {
+        name: city_label(value) if name in ("city", "start_city") else value
+        for name, value in infeasibility.details.items()
+    }
+    template = INFEASIBILITY_MESSAGES.get(infeasibility.code)
+    return f"此查询无解：{template.format(**details) if template else infeasibility.message}"
+
+def plan_card_key(flight) -> tuple:
+    """Everything a card shows of a flight: flights that differ in any of it get their own card."""
+    return (
+        flight.airline_id, flight.flight_number_id, flight.flight_class_ids,
+        flight.departure_city_id, flight.arrival_city_id, flight.departure_datetime, flight.arrival_datetime,
+        flight.duration, flight.transfer_info_id, flight.visa_info_id
+    )
+
+def plan_card_data(plan: TravelPlan) -> dict:
+    """Returns the display strings of a plan card, formatting each plan only once."""
+    key = tuple(plan_card_key(f) for f in plan.flights)
+    data = _plan_card_cache.get(key)
+    if data is not None:
+        _plan_card_cache.move_to_end(key)
+        return data
+
+    legs = []
+    for flight in plan.flights:
+        legs.append({
+            "route": f"{city_label(flight.departure_city_code)} 🡺 {city_label(flight.arrival_city_code)}",
+            "flight": f"{flight.airline} {flight.flight_number} • {' / '.join(flight.flight_classes)} ",
+            "details": (
+                f"{transfer_label(flight.transfer_info_id)}"
+                f"{f' • 签证信息: {flight.visa_info}' if flight.visa_info != 'N/A' else ''}"
+                f" • 飞行时间：{format_delta(flight.duration)}"
+            ),
+            "departure": f"出发: {flight.departure_datetime.strftime('%Y-%m-%d %H:%M')}",
+            "arrival": f"到达: {flight.arrival_datetime.strftime('%Y-%m-%d %H:%M')}",
+        })
+    data = {
+        "total_duration": f"总飞行时间: {format_delta(plan.total_duration)}",
+        "route_summary": " → ".join(
+            [country_label(f.departure_city_code) for f in plan.flights] + [country_label(plan.flights[-1].arrival_city_code)]
+        ),
+        "legs": legs,
+    }
+    _plan_card_cache[key] = data
+    if len(_plan_card_cache) > PLAN_CARD_CACHE_SIZE:
+        _plan_card_cache.popitem(last=False)
+    return data
+
 # --- Main Application ---
 def main(page: ft.Page):
     page.title = "旅行计划查找器"
@@ -23,9 +121,14 @@ def main(page: ft.Page):
     page.bgcolor = ft.Colors.GREY_200
 
     # --- Application State ---
-    all_flights = []
+    dataset_manager = None  # Set by load_initial_data; owns the hot-reloaded flight data
+    network_cache = NetworkCache()  # Prepared networks of recent searches, for quick re-queries
+    result_store = None  # Set by load_initial_data; results shared with other runs on this host
     search_results = []
-    stop_event = threading.Event()
+    search_infeasibility = None  # Why the last search had no possible answer, if the pre-check knew
+    search_progress_text = None
+    search_status = None  # Spinner and progress text above the cards while a search runs
+    shown_partial_plans = None  # The best-so-far plans the cards show
     city_name_to_code_map = {f"{city.country_cn} - {city.name_cn}": city.code for city in CITIES_BY_CODE.values()}
     sorted_cities = sorted(CITIES_BY_CODE.values(), key=lambda c: (c.country_cn, c.name_cn))
     city_display_names = [ft.dropdown.Option(text) for text in [f"{city.country_cn} - {city.name_cn}" for city in sorted_cities]]
@@ -163,7 +266,7 @@ def main(page: ft.Page):
     find_button = ft.ElevatedButton(text="寻找最佳方案", icon=ft.Icons.TRAVEL_EXPLORE, height=50, disabled=True)
     def stop_search_click(e):
         print("Stop button clicked!")
-        stop_event.set()
+        search_manager.cancel()
         stop_button.disabled = True # Prevent multiple clicks
         page.update()
 
@@ -173,12 +276,23 @@ def main(page: ft.Page):
         style=ft.ButtonStyle(bgcolor=ft.Colors.RED_400, color=ft.Colors.WHITE)
     )
     
-    # Results Display
-    results_view = ft.Column(
-        alignment=ft.MainAxisAlignment.START,
-        horizontal_alignment=ft.CrossAxisAlignment.STRETCH,
-        scroll=ft.ScrollMode.ADAPTIVE,
-        expand=True
+    # Startup progress (data loads in the background while the window is usable)
+    load_progress_bar = ft.ProgressBar(value=0)
+    load_status_text = ft.Text("加载航班数据中...", size=12, color=ft.Colors.GREY_600)
+
+    # Results Display (a ListView only lays out the cards that are on screen)
+    rendered_plan_count = 0
+    render_lock = threading.Lock()
+
+    def on_results_scroll(e):
+        if e.pixels >= e.max_scroll_extent - SCROLL_LOAD_MARGIN:
+            render_next_batch()
+
+    results_view = ft.ListView(
+        spacing=10,
+        expand=True,
+        on_scroll=on_results_scroll,
+        on_scroll_interval=100
     )
     
     # --- Dialog for Errors/Warnings using Cupertino style ---
@@ -234,26 +348,34 @@ def main(page: ft.Page):
             return
 
         # --- 2. If Validation Passes, Update UI to Loading State ---
-        stop_event.clear() # Reset for the new search
-        find_button.disabled = True
+        # The find button stays enabled: a new search replaces the running one.
+        nonlocal search_progress_text, search_status, shown_partial_plans
+        search_progress_text = ft.Text("寻找最佳方案...", size=16)
+        search_status = ft.Row(
+            [ft.ProgressRing(width=20, height=20, stroke_width=2), search_progress_text],
+            spacing=10
+        )
+        shown_partial_plans = None
         stop_button.visible = True
         stop_button.disabled = False
-        results_view.controls.clear()
-        results_view.controls.append(
-            ft.Container(
-                content=ft.Column(
-                    [
-                        ft.ProgressRing(),
-                        ft.Text("寻找最佳方案...", size=16)
-                    ],
-                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                    spacing=20
-                ),
-                alignment=ft.alignment.center,
-                expand=True
+        with render_lock:
+            results_view.controls.clear()
+            results_view.controls.append(
+                ft.Container(
+                    content=ft.Column(
+                        [
+                            ft.ProgressRing(),
+                            search_progress_text
+                        ],
+                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                        spacing=20
+                    ),
+                    alignment=ft.alignment.center,
+                    expand=True
+                )
             )
-        )
-        page.update()
+        results_view.update()
+        stop_button.update()
 
         # --- 3. Run Search in Background ---
         params = {
@@ -271,83 +393,135 @@ def main(page: ft.Page):
             "flight_class_filter": flight_class_rg.value,
             "max_transfers": max_transfers,
             "forced_cities": forced_city_codes,
-            "stop_event": stop_event
+            # Search the weekly schedule directly so long date windows stay cheap.
+            "periodic": True
         }
 
-        thread = threading.Thread(target=run_search, args=(params,), daemon=True)
-        thread.start()
-        
-    def run_search(params):
+        search_manager.start(params)
+
+    def run_search(params, stop_event, progress_callback):
+        nonlocal search_infeasibility
+        from main import find_best_travel_plan  # Already imported by the warm-up
+        search_infeasibility = None
+        latest_plans = None
+
+        def record_infeasibility(infeasibility):
+            nonlocal search_infeasibility
+            search_infeasibility = infeasibility
+
+        def record_plans(plans):
+            nonlocal latest_plans
+            latest_plans = plans
+
+        def report_progress(paths_explored, plans_found, queue_size):
+            # The session may throttle this call away; the next one carries the plans too.
+            progress_callback(paths_explored, plans_found, queue_size, latest_plans)
+        # Take the dataset once: a reload swapping in a new version doesn't affect this search.
+        dataset = dataset_manager.current
+        search_params = dict(
+            base_flights=dataset.flights, stop_event=stop_event, progress_callback=report_progress,
+            plans_callback=record_plans, network_cache=network_cache,
+            infeasible_callback=record_infeasibility, **params
+        )
+        if result_store is None:
+            return find_best_travel_plan(**search_params)
+        return find_best_travel_plan_stored(
+            result_store, dataset.fingerprint, dataset_manager.filepath, **search_params
+        )
+
+    def show_search_progress(generation, paths_explored, plans_found, queue_size, plans=None):
+        nonlocal search_results, shown_partial_plans, rendered_plan_count
+        if not search_manager.is_current(generation):
+            return
+        search_progress_text.value = f"寻找最佳方案... 已探索 {paths_explored} 条路径，找到 {plans_found} 个方案"
+        if not plans or plans is shown_partial_plans:
+            search_progress_text.update()
+            return
+        # New best plans: the cards of the first batch are rebuilt under the status line.
+        with render_lock:
+            shown_partial_plans = search_results = plans
+            results_view.controls.clear()
+            results_view.controls.append(search_status)
+            rendered_plan_count = 0
+        render_next_batch()
+
+    def show_search_results(generation, results, stopped):
         nonlocal search_results
-        search_results = find_best_travel_plan(base_flights=all_flights, **params)
-        display_results()
-
-    def display_results():
-        results_view.alignment = ft.MainAxisAlignment.START
-        results_view.horizontal_alignment = ft.CrossAxisAlignment.STRETCH
-        results_view.controls.clear()
-
-        if not search_results:
-            centered_message = ft.Container(
-                ft.Text("未找到符合指定条件的旅行计划。", size=18, italic=True),
-                alignment=ft.alignment.center,
-                expand=True
-            )
-            results_view.controls.append(centered_message)
-        else:
-            summary_text = f"找到了{len(search_results)}个最优的旅行方案"
-            if stop_event.is_set():
-                summary_text += " (搜索已由用户停止)"
-            summary = ft.Text(summary_text, size=18, weight=ft.FontWeight.BOLD)
-            results_view.controls.append(summary)
-            
-            for i, plan in enumerate(search_results):
-                results_view.controls.append(create_plan_card(plan, i+1))
-        
-        find_button.disabled = False
+        if not search_manager.is_current(generation):
+            return  # A new search started while these were being delivered
+        search_results = results
+        display_results(stopped)
+
+    def display_results(stopped=False):
+        nonlocal rendered_plan_count
+        with render_lock:
+            results_view.controls.clear()
+            rendered_plan_count = 0
+
+            if not search_results:
+                if stopped:
+                    message = "搜索已由用户停止，未找到旅行计划。"
+                elif search_infeasibility:
+                    message = infeasibility_text(search_infeasibility)
+                else:
+                    message = "未找到符合指定条件的旅行计划。"
+                centered_message = ft.Container(
+                    ft.Text(message, size=18, italic=True),
+                    alignment=ft.alignment.center,
+                    expand=True
+                )
+                results_view.controls.append(centered_message)
+            else:
+                summary_text = f"找到了{len(search_results)}个最优的旅行方案"
+                if stopped:
+                    summary_text += " (搜索已由用户停止)"
+                summary = ft.Text(summary_text, size=18, weight=ft.FontWeight.BOLD)
+                results_view.controls.append(summary)
+
+        render_next_batch(update=False)
+
         stop_button.visible = False
         stop_button.disabled = True
-        page.update()
+        with tracing.span("gui.update_results"):
+            results_view.update()
+            stop_button.update()
+
+    def render_next_batch(update=True):
+        """Appends the next RESULTS_BATCH_SIZE cards; only the results list is re-sent."""
+        nonlocal rendered_plan_count
+        with render_lock:
+            if rendered_plan_count >= len(search_results):
+                return
+            batch_end = min(rendered_plan_count + RESULTS_BATCH_SIZE, len(search_results))
+            with tracing.span("gui.render_cards", first=rendered_plan_count, count=batch_end - rendered_plan_count):
+                for i in range(rendered_plan_count, batch_end):
+                    results_view.controls.append(create_plan_card(search_results[i], i+1))
+            rendered_plan_count = batch_end
+        if update:
+            with tracing.span("gui.update_results"):
+                results_view.update()
 
     def create_plan_card(plan, plan_num):
+        data = plan_card_data(plan)
         flight_legs = []
-        for i, flight in enumerate(plan.flights):
-            dep_city = get_city_by_code(flight.departure_city_code)
-            arr_city = get_city_by_code(flight.arrival_city_code)
+        for i, leg in enumerate(data["legs"]):
             flight_legs.append(
                 ft.Row(
                     [
                         ft.Text(f"{i+1}.", weight=ft.FontWeight.BOLD, width=30),
                         ft.Column(
                             [
-                                                                # ft.Text(f"{dep_city.country_cn} ({dep_city.name_cn} {dep_city.code}) 🡺 {arr_city.country_cn} ({arr_city.name_cn} {arr_city.code})", weight=ft.FontWeight.BOLD),
-
-                                ft.Text(f"{dep_city.country_cn} ({dep_city.name_cn}) 🡺 {arr_city.country_cn} ({arr_city.name_cn})", weight=ft.FontWeight.BOLD),
-                                ft.Text(
-                                    (
-                                        f"{flight.airline} {flight.flight_number} • {flight.flight_class} "
-
-                                    ),
-                                    color=ft.Colors.GREY_600,
-                                    size=12
-                                ) ,
-                                                                ft.Text(
-                                    (
-
-                                        f"{'直飞' if 'N/A:' in flight.transfer_info else flight.transfer_info}"
-                                        f"{f' • 签证信息: {flight.visa_info}' if flight.visa_info != 'N/A' else ''}"
-                                        f" • 飞行时间：{format_delta(flight.duration)}"
-                                    ),
-                                    color=ft.Colors.GREY_600,
-                                    size=12
-                                )                             ],
+                                ft.Text(leg["route"], weight=ft.FontWeight.BOLD),
+                                ft.Text(leg["flight"], color=ft.Colors.GREY_600, size=12),
+                                ft.Text(leg["details"], color=ft.Colors.GREY_600, size=12)
+                            ],
                             spacing=2,
                             expand=True,
                         ),
                         ft.Column(
                             [
-                                ft.Text(f"出发: {flight.departure_datetime.strftime('%Y-%m-%d %H:%M')}"),
-                                ft.Text(f"到达: {flight.arrival_datetime.strftime('%Y-%m-%d %H:%M')}")
+                                ft.Text(leg["departure"]),
+                                ft.Text(leg["arrival"])
                             ],
                             spacing=2,
                             horizontal_alignment=ft.CrossAxisAlignment.END
@@ -357,15 +531,13 @@ def main(page: ft.Page):
                 )
             )
 
-        route_summary = " → ".join([get_city_by_code(f.departure_city_code).country_cn for f in plan.flights] + [get_city_by_code(plan.flights[-1].arrival_city_code).country_cn])
-
         return ft.Card(
             ft.Container(
                 ft.Column([
                     ft.Container(
                         ft.Row([
                             ft.Text(f"方案 {plan_num}", size=20, weight=ft.FontWeight.BOLD),
-                            ft.Text(f"总飞行时间: {format_delta(plan.total_duration)}", size=16),
+                            ft.Text(data["total_duration"], size=16),
                         ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                         bgcolor=ft.Colors.BLUE_GREY_50,
                         padding=15,
@@ -373,7 +545,7 @@ def main(page: ft.Page):
                     ),
                     ft.Container(
                         ft.Column([
-                            ft.Text(route_summary, weight=ft.FontWeight.BOLD, size=16),
+                            ft.Text(data["route_summary"], weight=ft.FontWeight.BOLD, size=16),
                             ft.Divider(height=10),
                             *flight_legs
                         ]),
@@ -385,6 +557,11 @@ def main(page: ft.Page):
             )
         )
 
+    search_manager = SearchSessionManager(
+        search_fn=run_search,
+        on_results=show_search_results,
+        on_progress=show_search_progress
+    )
     find_button.on_click = find_plan_click
     
     # --- Layout ---
@@ -419,6 +596,8 @@ def main(page: ft.Page):
             ),
             # Part 2: The fixed button section at the bottom
             ft.Divider(height=1),
+            load_progress_bar,
+            load_status_text,
             ft.Container(
                 content=ft.Row([find_button, stop_button], alignment=ft.MainAxisAlignment.CENTER, spacing=10),
                 padding=ft.padding.only(top=2, bottom=2) # Add some spacing around the buttons
@@ -449,49 +628,60 @@ def main(page: ft.Page):
         expand=True
     )
 
-    # --- Initial Data Loading in Background ---
-    def load_initial_data():
-        nonlocal all_flights
-        print("Loading flight data...")
-        all_flights = load_flights("merged_flight_data.xlsx")
-        print(f"Loaded {len(all_flights)} flights.")
-        
-        def enable_controls():
-            # Clear the loading indicator and add the main layout
-            page.controls.clear()
-            page.add(main_layout)
-            
-            # Enable all the interactive controls
-            for ctrl in [
-                start_city_dd, end_city_dd, num_countries_tf,
-                min_layover_tf, max_layover_tf, max_flight_duration_tf, flight_class_rg,
-                direct_only_cb, max_transfers_tf, no_fly_cb, find_button,
-                start_date_tf, end_date_tf, start_date_button, end_date_button,
-                select_all_forced_cities_cb, select_all_cities_cb
-            ]:
-                ctrl.disabled = False
-            
-            for cb, _ in forced_city_checkboxes:
-                cb.disabled = False
+    # --- Startup: interactive window first, data warm-up in the background ---
+    # Controls that don't depend on flight data are usable right away.
+    city_and_date_controls = [
+        start_city_dd, end_city_dd, num_countries_tf,
+        start_date_tf, end_date_tf, start_date_button, end_date_button,
+        select_all_forced_cities_cb, select_all_cities_cb
+    ] + [cb for cb, _ in forced_city_checkboxes]
+    # Controls that only make sense once the flights are loaded.
+    data_controls = [
+        min_layover_tf, max_layover_tf, max_flight_duration_tf, flight_class_rg,
+        direct_only_cb, max_transfers_tf, no_fly_cb, find_button
+    ]
+
+    def report_load_progress(message, fraction):
+        load_status_text.value = message
+        load_progress_bar.value = fraction
+        page.update()
 
-            page.update()
-        
-        enable_controls()
+    def show_dataset_swap(dataset, parsed_rows):
+        # Networks and formatted cards of the old version won't be asked for again.
+        network_cache.clear()
+        _plan_card_cache.clear()
+        if result_store is not None:
+            result_store.invalidate(dataset_manager.filepath, dataset.fingerprint)
+        load_status_text.value = f"数据已更新：{len(dataset)} 个航班（重新解析 {parsed_rows} 行）"
+        page.update()
 
-    loading_indicator = ft.Container(
-        content=ft.Column(
-            [
-                ft.ProgressRing(),
-                ft.Text("加载航班数据中...", size=18)
-            ],
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-            spacing=20
-        ),
-        alignment=ft.alignment.center,
-        expand=True
-    )
-    
-    page.add(loading_indicator)
+    def load_initial_data():
+        nonlocal dataset_manager, result_store
+        report_load_progress("加载航班数据中...", 0.05)
+        from dataset import DatasetManager
+        dataset_manager = DatasetManager("merged_flight_data.xlsx", on_swap=show_dataset_swap)
+        # Reserve the last 10% of the bar for warming up the search module.
+        dataset = dataset_manager.load(
+            progress=lambda message, fraction: report_load_progress(message, fraction * 0.9)
+        )
+        report_load_progress("准备搜索引擎...", 0.9)
+        import main  # noqa: F401 -- warm the search module before the first click
+        try:
+            result_store = ResultStore()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open the result store: {e}")
+        print(f"Loaded {len(dataset)} flights.")
+        dataset_manager.start_watching()
+
+        for ctrl in data_controls:
+            ctrl.disabled = False
+        load_status_text.value = f"已加载 {len(dataset)} 个航班"
+        load_progress_bar.visible = False
+        page.update()
+
+    page.add(main_layout)
+    for ctrl in city_and_date_controls:
+        ctrl.disabled = False
     page.update()
 
     load_thread = threading.Thread(target=load_initial_data, daemon=True)
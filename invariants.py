@@ -0,0 +1,120 @@
+import os
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from models import CITY_CODES, TravelPlan, country_by_city_id
+from timeline import Leg
+
+# --- Debug invariants ---
+# Checks of what the search guarantees by construction: candidate flights leave the city
+# the path is in, found paths are continuous and start at start_city, layovers stay in
+# bounds. They cost time on every expansion and every goal hit, so production searches
+# skip them; find_best_travel_plan(debug_invariants=True), or FLIGHT_DEBUG_INVARIANTS=1
+# in the environment, turns them on. A broken invariant raises InvariantViolation
+# instead of being skipped, so verify_invariants.py can report it.
+
+DEBUG_INVARIANTS_ENV = "FLIGHT_DEBUG_INVARIANTS"
+
+
+class InvariantViolation(AssertionError):
+    """A search result or intermediate path broke one of the search's invariants."""
+
+
+def debug_invariants_enabled(debug_invariants: Optional[bool] = None) -> bool:
+    """An explicit debug_invariants wins; None falls back to the environment."""
+    if debug_invariants is not None:
+        return debug_invariants
+    return os.environ.get(DEBUG_INVARIANTS_ENV, "0") not in ("", "0")
+
+
+def checked_departures(candidate_flights: Iterable, departure_city_id: int) -> Iterator:
+    """The search's candidate flights, checked to leave departure_city_id."""
+    for flight in candidate_flights:
+        if flight.departure_city_id != departure_city_id:
+            raise InvariantViolation(
+                f"Discontinuous route: a candidate flight departs from {flight.departure_city_code}, "
+                f"the path is in {CITY_CODES.strings[departure_city_id]}"
+            )
+        yield flight
+
+
+def check_path(
+    path: Sequence[Leg],
+    start_city_id: Optional[int],
+    min_layover: int,
+    max_layover: int
+) -> None:
+    """A path of legs that reached the goal: start city, continuity and layovers (minutes)."""
+    if not path:
+        raise InvariantViolation("Empty path reached the goal")
+    if start_city_id is not None and path[0].departure_city_id != start_city_id:
+        raise InvariantViolation(
+            f"Path doesn't start from {CITY_CODES.strings[start_city_id]}! Starts from {path[0].departure_city_code}"
+        )
+    for i in range(len(path) - 1):
+        if path[i].arrival_city_id != path[i + 1].departure_city_id:
+            raise InvariantViolation(
+                f"Discontinuity between flight {i} and {i + 1}: flight {i} arrives at {path[i].arrival_city_code}, "
+                f"flight {i + 1} departs from {path[i + 1].departure_city_code}"
+            )
+        layover = path[i + 1].departure - path[i].arrival
+        if not min_layover <= layover <= max_layover:
+            raise InvariantViolation(
+                f"Layover of {layover} minutes in {path[i].arrival_city_code} is outside [{min_layover}, {max_layover}]"
+            )
+
+
+def check_plan(
+    plan: TravelPlan,
+    start_date: date,
+    end_date: date,
+    cities_choice: List[str],
+    num_countries: int,
+    start_city: Optional[str] = None,
+    end_city: Optional[str] = None,
+    min_layover_hours: int = 10,
+    max_layover_hours: int = 48,
+    forced_cities: Optional[List[str]] = None
+) -> None:
+    """
+    A returned plan against the query that produced it: everything check_path covers,
+    plus the date window, the city scope, end_city, forced cities and the country count.
+    """
+    flights = plan.flights
+    if not flights:
+        raise InvariantViolation("Empty plan")
+    if start_city and flights[0].departure_city_code != start_city:
+        raise InvariantViolation(f"Plan doesn't start from {start_city}! Starts from {flights[0].departure_city_code}")
+    if end_city and flights[-1].arrival_city_code != end_city:
+        raise InvariantViolation(f"Plan doesn't end in {end_city}! Ends in {flights[-1].arrival_city_code}")
+    chosen = set(cities_choice)
+    for i, flight in enumerate(flights):
+        if not start_date <= flight.departure_datetime.date() <= end_date:
+            raise InvariantViolation(f"Flight {i} departs on {flight.departure_datetime.date()}, outside the window")
+        if flight.departure_city_code not in chosen or flight.arrival_city_code not in chosen:
+            raise InvariantViolation(
+                f"Flight {i} ({flight.departure_city_code}>{flight.arrival_city_code}) leaves the chosen cities"
+            )
+        if i == 0:
+            continue
+        previous = flights[i - 1]
+        if previous.arrival_city_id != flight.departure_city_id:
+            raise InvariantViolation(
+                f"Discontinuity between flight {i - 1} and {i}: flight {i - 1} arrives at {previous.arrival_city_code}, "
+                f"flight {i} departs from {flight.departure_city_code}"
+            )
+        layover = flight.departure_datetime - previous.arrival_datetime
+        if not timedelta(hours=min_layover_hours) <= layover <= timedelta(hours=max_layover_hours):
+            raise InvariantViolation(f"Layover of {layover} in {previous.arrival_city_code} is outside the bounds")
+
+    visited = [flights[0].departure_city_code] + [flight.arrival_city_code for flight in flights]
+    missing = set(forced_cities or []) - set(visited)
+    if missing:
+        raise InvariantViolation(f"Plan misses forced cities {sorted(missing)}")
+
+    city_country = country_by_city_id()
+    countries = {city_country[CITY_CODES.encode(code)] for code in visited}
+    if start_city:
+        countries.discard(city_country[CITY_CODES.encode(start_city)])
+    if len(countries) != num_countries:
+        raise InvariantViolation(f"Plan visits {len(countries)} countries, {num_countries} were asked for")
@@ -1,10 +1,129 @@
 import heapq
-from typing import List, Optional, Dict, Tuple, Set
+import time as clock
+from typing import Callable, List, Optional, Dict, Tuple, Set
 from collections import defaultdict
+from dataclasses import dataclass, replace
+from functools import partial
 from datetime import timedelta, date
 
-from data_handler import expand_flights_for_date_range, load_flights
-from models import TravelPlan, Flight, get_city_by_code, CITIES
+from csa import ConnectionScan
+from data_handler import load_flights
+from feasibility import NEVER, FeasibilityBounds
+from frontier import PathCodec, SpillingFrontier
+from invariants import check_path, checked_departures, debug_invariants_enabled
+from network_cache import NetworkCache, network_flight_count, network_signature
+from pareto import ParetoLabels
+from precheck import Infeasibility, check_network, check_query
+from timeline import MINUTES_PER_DAY, Leg, LegSchedule, expand_legs
+import tracing
+from models import TravelPlan, Flight, CITIES, CITY_CODES, FLIGHT_CLASSES, country_by_city_id
+
+PROGRESS_EVERY_PATHS = 1000
+# In periodic mode the feasibility bounds only cover the end of the window (see below).
+FEASIBILITY_TAIL_DAYS = 14
+
+def with_matched_classes(path: List[Flight], allowed_class_ids: Optional[Set[int]]) -> List[Flight]:
+    """
+    Copies a path for a plan. With a class filter, each flight that offers several
+    classes is reported in the class that matched the filter.
+    """
+    if allowed_class_ids is None:
+        return list(path)
+    plan_flights = []
+    for flight in path:
+        matched = flight.flight_class_ids & allowed_class_ids
+        if matched != flight.flight_class_ids or flight.flight_class_id not in matched:
+            matched_class_id = min(matched)
+            flight = replace(flight, flight_class_id=matched_class_id, flight_class_ids=frozenset([matched_class_id]))
+        plan_flights.append(flight)
+    return plan_flights
+
+@dataclass
+class PreparedNetwork:
+    """
+    The part of a search that depends only on the data, the date window and the flight
+    filters: the filtered flights (legs of the window, see timeline.py, or the weekly
+    base flights in periodic mode) and their indexes. Times are minutes since the start
+    of the window. Reusable across queries that differ in anything else (see NetworkCache).
+    """
+    base_flights: List[Flight]  # The filtered weekly base flights
+    flights: List  # Legs, or base flights in periodic mode
+    allowed_class_ids: Optional[Set[int]]
+    flights_by_departure: Dict[int, List]
+    schedule: Optional[LegSchedule]
+    # Legs sorted by (departure, arrival): the connections of the ConnectionScan that the
+    # feasibility bounds are swept from. The bounds hold for paths ready at or after
+    # bounds_from. Periodic mode only covers the last FEASIBILITY_TAIL_DAYS, expanded
+    # for this purpose; paths ready before are not pruned.
+    bound_legs: List[Leg]
+    bounds_from: int
+
+def index_by_departure(flights: List) -> Dict[int, List]:
+    flights_by_departure = defaultdict(list)
+    for flight in flights:
+        flights_by_departure[flight.departure_city_id].append(flight)
+    return flights_by_departure
+
+def prepare_network(
+    base_flights: List[Flight],
+    start_date: date,
+    end_date: date,
+    cities_choice: List[str],
+    flight_class_filter: str = "ALL",
+    max_transfers: Optional[int] = None,
+    max_flight_duration_hours: Optional[int] = None,
+    no_fly_start_hour: Optional[int] = None,
+    no_fly_end_hour: Optional[int] = None,
+    periodic: bool = False
+) -> PreparedNetwork:
+    """Pre-filters, expands and indexes the flights for find_best_travel_plan."""
+    allowed_city_ids = {CITY_CODES.encode(code) for code in cities_choice}
+    # A network with a departure index (see shared_network.py) hands out only the flights
+    # leaving the chosen cities, so the rest are never decoded or expanded.
+    if hasattr(base_flights, "departing_from"):
+        base_flights = base_flights.departing_from(allowed_city_ids)
+
+    # String filters run once per vocabulary entry; per flight they are set lookups on codes.
+    allowed_class_ids = None
+    if flight_class_filter != "ALL":
+        allowed_class_ids = FLIGHT_CLASSES.codes_where(lambda flight_class: flight_class_filter in flight_class)
+
+    # Every filter is date-independent, so the weekly base flights are filtered before
+    # they are expanded.
+    with tracing.span("prefilter", flights=len(base_flights)):
+        pre_filtered_flights = []
+        for flight in base_flights:
+            if (allowed_class_ids is not None and allowed_class_ids.isdisjoint(flight.flight_class_ids)) or \
+               (max_transfers is not None and flight.transfers > max_transfers) or \
+               (flight.departure_city_id not in allowed_city_ids or flight.arrival_city_id not in allowed_city_ids) or \
+               (max_flight_duration_hours is not None and flight.duration > timedelta(hours=max_flight_duration_hours)):
+                continue
+            if no_fly_start_hour is not None and no_fly_end_hour is not None:
+                dep_hour = flight.departure_time.hour
+                is_overnight = no_fly_start_hour > no_fly_end_hour
+                if (is_overnight and (dep_hour >= no_fly_start_hour or dep_hour < no_fly_end_hour)) or \
+                   (not is_overnight and (no_fly_start_hour <= dep_hour < no_fly_end_hour)):
+                    continue
+            pre_filtered_flights.append(flight)
+
+    if periodic:
+        tail_start = max(start_date, end_date - timedelta(days=FEASIBILITY_TAIL_DAYS))
+        bound_legs = expand_legs(pre_filtered_flights, tail_start, end_date, origin=start_date)
+        bounds_from = (tail_start - start_date).days * MINUTES_PER_DAY
+        flights = pre_filtered_flights
+    else:
+        flights = bound_legs = expand_legs(pre_filtered_flights, start_date, end_date)
+        bounds_from = NEVER
+
+    with tracing.span("network_index", flights=len(flights)):
+        # In periodic mode flights_by_departure holds weekly base flights; it is then only
+        # used for the (date-independent) forced city reachability check.
+        flights_by_departure = index_by_departure(flights)
+        schedule = LegSchedule(pre_filtered_flights, start_date, end_date) if periodic else None
+        bound_legs = sorted(bound_legs, key=lambda leg: (leg.departure, leg.arrival))
+    return PreparedNetwork(
+        pre_filtered_flights, flights, allowed_class_ids, flights_by_departure, schedule, bound_legs, bounds_from
+    )
 
 def find_best_travel_plan(
     base_flights: List[Flight],
@@ -23,7 +142,20 @@ def find_best_travel_plan(
     no_fly_end_hour: Optional[int] = None,
     forced_cities: Optional[List[str]] = None,
     stop_event: Optional[object] = None,
-    top_n: int = 5
+    top_n: int = 5,
+    periodic: bool = False,
+    pareto: bool = False,
+    progress_callback: Optional[Callable[[int, int, int], None]] = None,
+    plans_callback: Optional[Callable[[List[TravelPlan]], None]] = None,
+    trace_path: Optional[str] = None,
+    max_frontier_entries: Optional[int] = None,
+    spill_dir: Optional[str] = None,
+    network_cache: Optional[NetworkCache] = None,
+    beam_width: Optional[int] = None,
+    deadline_seconds: Optional[float] = None,
+    seed_cities: Optional[List[str]] = None,
+    infeasible_callback: Optional[Callable[[Infeasibility], None]] = None,
+    debug_invariants: Optional[bool] = None
 ) -> List[TravelPlan]:
     """
     Balanced search: faster with forced cities but still finds diverse results.
@@ -32,305 +164,466 @@ def find_best_travel_plan(
     - If start_city is specified: visit num_countries ADDITIONAL countries (start country doesn't count)
     - If start_city is None (Any): visit exactly num_countries total
     - End city always counts unless it's the same as start country
+
+    periodic=True searches the weekly schedule directly (see LegSchedule) instead of
+    expanding every day of the window up front, so long windows cost no more to set up
+    than a single week.
+
+    pareto=True returns the Pareto front over total flight time, elapsed trip time and
+    total transfers instead of the top_n plans by flight time (top_n is ignored); see
+    ParetoLabels for the dominance rules.
+
+    progress_callback, if given, is called every PROGRESS_EVERY_PATHS explored paths
+    with (paths_explored, plans_found, queue_size). plans_callback, if given, is called
+    on the same schedule with the best plans found so far, ordered as the results are,
+    whenever they changed since its last call; it lets a UI show plans while the search
+    is still running.
+
+    trace_path traces this search (see tracing.py) and writes the Chrome trace there
+    when it returns, whichever way it does; tracing is off again afterwards.
+
+    max_frontier_entries caps the number of queued paths held in memory: the costlier
+    ones are spilled to sorted run files in spill_dir (default: the temp directory) and
+    merged back as the search reaches them (see SpillingFrontier). Results are the same
+    as with the in-memory queue.
+
+    network_cache, if given, reuses the prepared network (see prepare_network) of earlier
+    queries with the same base flights, date window and flight filters.
+
+    beam_width turns the search into a beam search: whenever the queue holds more than
+    twice beam_width paths, only the beam_width cheapest are kept. Memory stays bounded
+    but the results are no longer guaranteed to be the best ones.
+
+    deadline_seconds stops the search after that long and returns the best plans found
+    so far; they are exact if the search finishes in time.
+
+    seed_cities restricts the first departure city to these codes when start_city is None
+    (the country counting is unchanged). Searches over disjoint seed_cities find disjoint
+    plans, which is how the planner splits a search across processes (see planner.py).
+
+    Queries that provably have no answer (see precheck.py) return [] before searching;
+    infeasible_callback, if given, is called with the reason.
+
+    debug_invariants checks the search's own invariants as it runs (see invariants.py)
+    and raises InvariantViolation if one breaks; None (the default) follows the
+    FLIGHT_DEBUG_INVARIANTS environment variable.
     """
+    if beam_width and max_frontier_entries:
+        raise ValueError("beam_width and max_frontier_entries can't be combined")
+    if trace_path:
+        with tracing.recording(trace_path):
+            return find_best_travel_plan(**dict(locals(), trace_path=None))
+    deadline = clock.monotonic() + deadline_seconds if deadline_seconds else None
+    debug_invariants = debug_invariants_enabled(debug_invariants)
     if not base_flights or not cities_choice or num_countries <= 0:
         return []
 
-    # 1. Expand and Pre-filter flights
-    search_flights = expand_flights_for_date_range(base_flights, start_date, end_date)
-    
-    pre_filtered_flights = []
-    for flight in search_flights:
-        if (flight_class_filter != "ALL" and flight_class_filter not in flight.flight_class) or \
-           (max_transfers is not None and flight.transfers > max_transfers) or \
-           (flight.departure_city_code not in cities_choice or flight.arrival_city_code not in cities_choice) or \
-           (max_flight_duration_hours is not None and flight.duration > timedelta(hours=max_flight_duration_hours)):
-            continue
-        if no_fly_start_hour is not None and no_fly_end_hour is not None:
-            dep_hour = flight.departure_time.hour
-            is_overnight = no_fly_start_hour > no_fly_end_hour
-            if (is_overnight and (dep_hour >= no_fly_start_hour or dep_hour < no_fly_end_hour)) or \
-               (not is_overnight and (no_fly_start_hour <= dep_hour < no_fly_end_hour)):
-                continue
-        pre_filtered_flights.append(flight)
+    def reject(infeasibility: Infeasibility) -> List[TravelPlan]:
+        print(f"Query is infeasible ({infeasibility.code}): {infeasibility.message}")
+        if infeasible_callback:
+            infeasible_callback(infeasibility)
+        return []
+
+    infeasibility = check_query(cities_choice, num_countries, start_city, end_city, forced_cities)
+    if infeasibility:
+        return reject(infeasibility)
+
+    # 1. Expand, pre-filter and index the flights (or take them from the cache).
+    network_params = dict(
+        start_date=start_date, end_date=end_date, cities_choice=cities_choice,
+        flight_class_filter=flight_class_filter, max_transfers=max_transfers,
+        max_flight_duration_hours=max_flight_duration_hours, no_fly_start_hour=no_fly_start_hour,
+        no_fly_end_hour=no_fly_end_hour, periodic=periodic
+    )
+    if network_cache is not None:
+        network = network_cache.get_or_build(
+            base_flights, network_signature(**network_params),
+            lambda: prepare_network(base_flights, **network_params), network_flight_count
+        )
+    else:
+        network = prepare_network(base_flights, **network_params)
+    pre_filtered_flights = network.flights
+    allowed_class_ids = network.allowed_class_ids
+    flights_by_departure = network.flights_by_departure
+    schedule = network.schedule
     print(f"Total flights after filtering: {len(pre_filtered_flights)}")
 
-    if not pre_filtered_flights: return []
+    with tracing.span("precheck"):
+        infeasibility = check_network(
+            network, num_countries, start_city, end_city, forced_cities, periodic, start_date, end_date
+        )
+    if infeasibility:
+        return reject(infeasibility)
+
+    # From here on cities are handled by their CITY_CODES codes.
+    start_city_id = CITY_CODES.encode(start_city) if start_city else None
+    end_city_id = CITY_CODES.encode(end_city) if end_city else None
+    forced_cities_set = {CITY_CODES.encode(code) for code in forced_cities} if forced_cities else set()
+    city_country = country_by_city_id()
 
-    forced_cities_set = set(forced_cities) if forced_cities else set()
     if forced_cities_set:
-        filtered_with_forced = [
-            f for f in pre_filtered_flights 
-            if f.departure_city_code in forced_cities_set or f.arrival_city_code in forced_cities_set
-        ]
-        other_flights = [
-            f for f in pre_filtered_flights 
-            if f.departure_city_code not in forced_cities_set and f.arrival_city_code not in forced_cities_set
-        ]
-        print(f"Flights touching forced cities: {len(filtered_with_forced)}, Other flights: {len(other_flights)}")
-        pre_filtered_flights = filtered_with_forced + other_flights
-    
-    flights_by_departure = defaultdict(list)
-    for flight in pre_filtered_flights:
-        flights_by_departure[flight.departure_city_code].append(flight)
+        # Flights touching forced cities go first, so they are also expanded first.
+        # This is per query, so it re-indexes the (possibly cached) network.
+        with tracing.span("network_index", flights=len(pre_filtered_flights)):
+            filtered_with_forced = [
+                f for f in pre_filtered_flights 
+                if f.departure_city_id in forced_cities_set or f.arrival_city_id in forced_cities_set
+            ]
+            other_flights = [
+                f for f in pre_filtered_flights 
+                if f.departure_city_id not in forced_cities_set and f.arrival_city_id not in forced_cities_set
+            ]
+            print(f"Flights touching forced cities: {len(filtered_with_forced)}, Other flights: {len(other_flights)}")
+            pre_filtered_flights = filtered_with_forced + other_flights
+            flights_by_departure = index_by_departure(pre_filtered_flights)
+            if periodic:
+                schedule = LegSchedule(pre_filtered_flights, start_date, end_date)
+    # The search runs on the minute timeline of the window (see timeline.py).
+    min_layover = min_layover_hours * 60
+    max_layover = max_layover_hours * 60
 
     # Get start country if specified
-    start_country = None
-    if start_city:
-        start_country_obj = get_city_by_code(start_city)
-        start_country = start_country_obj.country if start_country_obj else None
+    start_country = city_country[start_city_id] if start_city else None
     
     # Target is the number of NEW countries to visit (excluding start)
     target_country_count = num_countries
+
+    # Latest times a path may be at each city and still collect its missing countries
+    # (and reach end_city) inside the window; paths past them are pruned before the push.
+    with tracing.span("feasibility_bounds"):
+        scan = ConnectionScan(network.bound_legs, min_layover, presorted=True)
+        feasibility = FeasibilityBounds(scan, max(target_country_count, 1), city_country, end_city_id, network.bounds_from)
+    paths_pruned_window = 0
     
-    priority_queue: List[Tuple[timedelta, int, List[Flight], frozenset, set]] = []
-    found_plans: Dict[Tuple[str, ...], TravelPlan] = {}
+    # Entries are (flight time in minutes, counter, path of legs, countries, cities).
+    if max_frontier_entries:
+        codec = PathCodec()
+        priority_queue = SpillingFrontier(max_frontier_entries, codec.encode, codec.decode, spill_dir)
+        push, pop = priority_queue.push, priority_queue.pop
+    else:
+        priority_queue: List[Tuple[int, int, List[Leg], frozenset, set]] = []
+        push, pop = partial(heapq.heappush, priority_queue), partial(heapq.heappop, priority_queue)
+    found_plans: Dict[Tuple[int, ...], Tuple[int, TravelPlan]] = {}  # signature -> (flight time, plan)
+    plans_version = reported_plans_version = 0  # Bumped whenever the best plans change
     counter = 0
 
+    pareto_labels = ParetoLabels() if pareto else None
+    def best_plans():
+        if pareto_labels:
+            return pareto_labels.plans()
+        plans = [plan for _, plan in found_plans.values()]
+        plans.sort(key=lambda p: p.total_duration)
+        return plans[:top_n]
+
+    def search_state(path, countries, cities):
+        # Everything that decides how a path can continue (see ParetoLabels).
+        forced_visited = frozenset(forced_cities_set.intersection(cities)) if forced_cities_set else None
+        return (path[-1].arrival_city_id, path[-1].arrival, countries, forced_visited)
+
     # 2. Seed the Priority Queue
-    initial_cities = [start_city] if start_city else cities_choice
-    for city_code in initial_cities:
-        start_country_obj = get_city_by_code(city_code)
-        if not start_country_obj: continue
-        current_start_country = start_country_obj.country
+    # The span closes however the search ends (an invariant violation or a failing
+    # callback included), so later spans on this thread keep the right parent.
+    with tracing.span("search", pareto=pareto, periodic=periodic):
+        if start_city:
+            initial_cities = [start_city_id]
+        else:
+            initial_cities = [CITY_CODES.encode(code) for code in (seed_cities if seed_cities is not None else cities_choice)]
+        for city_id in initial_cities:
+            current_start_country = city_country[city_id]
+            if not current_start_country: continue
         
-        for flight in flights_by_departure.get(city_code, []):
-            arrival_city_obj = get_city_by_code(flight.arrival_city_code)
-            if not arrival_city_obj or arrival_city_obj.country == current_start_country:
-                continue
+            # Periodic mode seeds each weekly flight once, on its first date; later weeks
+            # are pushed one at a time as earlier ones are popped (see the search loop).
+            seed_flights = schedule.first_departures(city_id) if schedule else flights_by_departure.get(city_id, [])
+            for flight in seed_flights:
+                arrival_country = city_country[flight.arrival_city_id]
+                if not arrival_country or arrival_country == current_start_country:
+                    continue
             
-            initial_path = [flight]
-            initial_duration = flight.duration
-            initial_countries = frozenset([current_start_country, arrival_city_obj.country])
-            initial_cities_visited = {city_code, flight.arrival_city_code}
-            heapq.heappush(priority_queue, (initial_duration, counter, initial_path, initial_countries, initial_cities_visited))
-            counter += 1
-
-    # 3. Search Loop
-    paths_explored = 0
-    paths_pruned_forced = 0
-    paths_pruned_impossible = 0
-    pruning_threshold = None
-
-    while priority_queue:
-        if stop_event and stop_event.is_set():
-            print("Search stopped by user.")
-            break
-        paths_explored += 1
-        if paths_explored % 10000 == 0:
-            print(f"Paths: {paths_explored}, Pruned(forced): {paths_pruned_forced}, Pruned(impossible): {paths_pruned_impossible}, Plans: {len(found_plans)}, Queue: {len(priority_queue)}")
-
-        current_duration, _, current_path, visited_countries, visited_cities = heapq.heappop(priority_queue)
-
-        # Calculate how many NEW countries we've visited (excluding start if specified)
-        if start_city and start_country and start_country in visited_countries:
-            new_countries_count = len(visited_countries) - 1
-        else:
-            new_countries_count = len(visited_countries)
+                initial_path = [flight]
+                initial_duration = flight.duration
+                initial_countries = frozenset([current_start_country, arrival_country])
+                initial_cities_visited = {city_id, flight.arrival_city_id}
+                initial_countries_count = len(initial_countries) - 1 if start_city else len(initial_countries)
+                if feasibility.is_hopeless(
+                    flight.arrival_city_id, flight.arrival, initial_countries,
+                    target_country_count - initial_countries_count,
+                    end_city_id is not None and flight.arrival_city_id != end_city_id
+                ):
+                    paths_pruned_window += 1
+                    continue
+                if pareto_labels and not pareto_labels.add_label(search_state(initial_path, initial_countries, initial_cities_visited), initial_path):
+                    continue
+                push((initial_duration, counter, initial_path, initial_countries, initial_cities_visited))
+                counter += 1
+
+        # 3. Search Loop
+        paths_explored = 0
+        paths_pruned_forced = 0
+        paths_pruned_impossible = 0
+        paths_dropped_beam = 0
+        pruning_threshold = None
+
+        while priority_queue:
+            if stop_event and stop_event.is_set():
+                print("Search stopped by user.")
+                break
+            if deadline and paths_explored % PROGRESS_EVERY_PATHS == 0 and clock.monotonic() > deadline:
+                print(f"Search stopped at the {deadline_seconds}s deadline.")
+                break
+            if beam_width and len(priority_queue) > 2 * beam_width:
+                # A sorted list is a valid heap; push/pop keep working on the same list.
+                paths_dropped_beam += len(priority_queue) - beam_width
+                priority_queue[:] = heapq.nsmallest(beam_width, priority_queue)
+            paths_explored += 1
+            if plans_callback and plans_version != reported_plans_version and paths_explored % PROGRESS_EVERY_PATHS == 0:
+                reported_plans_version = plans_version
+                plans_callback(best_plans())
+            if progress_callback and paths_explored % PROGRESS_EVERY_PATHS == 0:
+                plans_found = len(pareto_labels.front) if pareto_labels else len(found_plans)
+                progress_callback(paths_explored, plans_found, len(priority_queue))
+            if paths_explored % 10000 == 0:
+                print(f"Paths: {paths_explored}, Pruned(forced): {paths_pruned_forced}, Pruned(impossible): {paths_pruned_impossible}, Pruned(window): {paths_pruned_window}, Plans: {len(found_plans)}, Queue: {len(priority_queue)}")
+
+            current_duration, _, current_path, visited_countries, visited_cities = pop()
+
+            if schedule and len(current_path) == 1 and not (pruning_threshold and current_duration >= pruning_threshold):
+                next_week_flight = schedule.next_week(current_path[0])
+                if next_week_flight and not (
+                    pareto_labels and not pareto_labels.add_label(search_state([next_week_flight], visited_countries, visited_cities), [next_week_flight])
+                ):
+                    push((current_duration, counter, [next_week_flight], visited_countries, visited_cities.copy()))
+                    counter += 1
+
+            if pareto_labels and not pareto_labels.is_alive(search_state(current_path, visited_countries, visited_cities), current_path):
+                continue
+
+            # Calculate how many NEW countries we've visited (excluding start if specified)
+            if start_city and start_country and start_country in visited_countries:
+                new_countries_count = len(visited_countries) - 1
+            else:
+                new_countries_count = len(visited_countries)
 
-        # CRITICAL OPTIMIZATION: Early exit if we can't possibly beat existing plans
-        if pruning_threshold and current_duration >= pruning_threshold:
-            continue
+            # CRITICAL OPTIMIZATION: Early exit if we can't possibly beat existing plans
+            if pruning_threshold and current_duration >= pruning_threshold:
+                continue
 
-        # Prune if we've already visited more countries than target
-        if new_countries_count > target_country_count:
-            continue
+            # Prune if we've already visited more countries than target
+            if new_countries_count > target_country_count:
+                continue
         
-        last_flight = current_path[-1]
+            last_flight = current_path[-1]
         
-        # --- SMART PRUNING for forced cities ---
-        if forced_cities_set:
-            forced_visited = forced_cities_set.intersection(visited_cities)
-            forced_remaining = len(forced_cities_set) - len(forced_visited)
+            # --- SMART PRUNING for forced cities ---
+            if forced_cities_set:
+                forced_visited = forced_cities_set.intersection(visited_cities)
+                forced_remaining = len(forced_cities_set) - len(forced_visited)
             
-            if new_countries_count >= target_country_count and forced_remaining > 0:
-                paths_pruned_forced += 1
-                continue
+                if new_countries_count >= target_country_count and forced_remaining > 0:
+                    paths_pruned_forced += 1
+                    continue
             
-            countries_left = target_country_count - new_countries_count
-            if forced_remaining > 0 and countries_left < forced_remaining:
-                paths_pruned_forced += 1
-                continue
+                countries_left = target_country_count - new_countries_count
+                if forced_remaining > 0 and countries_left < forced_remaining:
+                    paths_pruned_forced += 1
+                    continue
             
-            # NEW: Check if forced cities are even reachable from current location
-            # If we still need to visit forced cities but have no flights to them
-            if forced_remaining > 0 and countries_left > 0:
-                current_location = last_flight.arrival_city_code
-                # Check if any forced city is reachable with remaining countries budget
-                can_reach_forced = False
-                for forced_city in forced_cities_set:
-                    if forced_city in visited_cities:
-                        continue
-                    # Check if there's any path from current location to this forced city
-                    # Check direct flights from current location to forced city
-                    for flight in flights_by_departure.get(current_location, []):
-                        if flight.arrival_city_code == forced_city:
-                            can_reach_forced = True
+                # NEW: Check if forced cities are even reachable from current location
+                # If we still need to visit forced cities but have no flights to them
+                if forced_remaining > 0 and countries_left > 0:
+                    current_location = last_flight.arrival_city_id
+                    # Check if any forced city is reachable with remaining countries budget
+                    can_reach_forced = False
+                    for forced_city in forced_cities_set:
+                        if forced_city in visited_cities:
+                            continue
+                        # Check if there's any path from current location to this forced city
+                        # Check direct flights from current location to forced city
+                        for flight in flights_by_departure.get(current_location, []):
+                            if flight.arrival_city_id == forced_city:
+                                can_reach_forced = True
+                                break
+                        if can_reach_forced:
                             break
-                    if can_reach_forced:
-                        break
                     
-                    # Check 1-hop connections (current → intermediate → forced)
-                    for next_flight in flights_by_departure.get(current_location, []):
-                        intermediate = next_flight.arrival_city_code
-                        for connecting_flight in flights_by_departure.get(intermediate, []):
-                            if connecting_flight.arrival_city_code == forced_city:
-                                can_reach_forced = True
+                        # Check 1-hop connections (current → intermediate → forced)
+                        for next_flight in flights_by_departure.get(current_location, []):
+                            intermediate = next_flight.arrival_city_id
+                            for connecting_flight in flights_by_departure.get(intermediate, []):
+                                if connecting_flight.arrival_city_id == forced_city:
+                                    can_reach_forced = True
+                                    break
+                            if can_reach_forced:
                                 break
                         if can_reach_forced:
                             break
-                    if can_reach_forced:
-                        break
                 
-                if not can_reach_forced:
-                    paths_pruned_impossible += 1
-                    continue
+                    if not can_reach_forced:
+                        paths_pruned_impossible += 1
+                        continue
         
-        # --- GOAL CHECK ---
-        reached_target = new_countries_count >= target_country_count
+            # --- GOAL CHECK ---
+            reached_target = new_countries_count >= target_country_count
         
-        if reached_target and ((not end_city) or (last_flight.arrival_city_code == end_city)):
-            
-            # Check forced cities requirement
-            if forced_cities_set and not forced_cities_set.issubset(visited_cities):
-                paths_pruned_forced += 1
-                continue
-            new_plan = TravelPlan(flights=list(current_path))
-            path_valid = True
-            if start_city:
-                if new_plan.flights[0].departure_city_code != start_city:
-                    print(f"ERROR: Path doesn't start from {start_city}! Starts from {new_plan.flights[0].departure_city_code}")
-                    path_valid = False
+            if reached_target and ((not end_city) or (last_flight.arrival_city_id == end_city_id)):
             
-            for i in range(len(new_plan.flights) - 1):
-                if new_plan.flights[i].arrival_city_code != new_plan.flights[i+1].departure_city_code:
-                    print(f"ERROR: Discontinuity between flight {i} and {i+1}!")
-                    print(f"  Flight {i} arrives at: {new_plan.flights[i].arrival_city_code}")
-                    print(f"  Flight {i+1} departs from: {new_plan.flights[i+1].departure_city_code}")
-                    path_valid = False
-                    break
-            
-            if not path_valid:
-                continue
-            first_city = start_city if start_city else current_path[0].departure_city_code
-            path_signature = tuple([first_city] + [f.arrival_city_code for f in new_plan.flights])
+                # Check forced cities requirement
+                if forced_cities_set and not forced_cities_set.issubset(visited_cities):
+                    paths_pruned_forced += 1
+                    continue
+                # Paths start at start_city and are continuous by construction (seeding and
+                # flights_by_departure); debug mode checks it.
+                if debug_invariants:
+                    check_path(current_path, start_city_id, min_layover, max_layover)
+                new_plan = TravelPlan(flights=with_matched_classes(
+                    [leg.dated_flight(start_date) for leg in current_path], allowed_class_ids
+                ))
+                if pareto_labels:
+                    if pareto_labels.add_plan(new_plan, current_path):
+                        plans_version += 1
+                    continue
+                first_city = start_city_id if start_city else current_path[0].departure_city_id
+                path_signature = tuple([first_city] + [f.arrival_city_id for f in new_plan.flights])
             
-            if path_signature not in found_plans or new_plan.total_duration < found_plans[path_signature].total_duration:
-                found_plans[path_signature] = new_plan
+                if path_signature not in found_plans or current_duration < found_plans[path_signature][0]:
+                    found_plans[path_signature] = (current_duration, new_plan)
+                    plans_version += 1
 
-                if len(found_plans) > top_n:
-                    sorted_plans = sorted(found_plans.values(), key=lambda p: p.total_duration, reverse=True)
-                    worst_plan_to_remove = sorted_plans[0]
+                    if len(found_plans) > top_n:
+                        sorted_plans = sorted(found_plans.values(), key=lambda entry: entry[0], reverse=True)
+                        worst_plan_to_remove = sorted_plans[0]
                     
-                    sig_to_remove = next(sig for sig, plan in found_plans.items() if plan is worst_plan_to_remove)
-                    del found_plans[sig_to_remove]
+                        sig_to_remove = next(sig for sig, entry in found_plans.items() if entry is worst_plan_to_remove)
+                        del found_plans[sig_to_remove]
 
-            if len(found_plans) == top_n:
-                pruning_threshold = max(p.total_duration for p in found_plans.values())
+                if len(found_plans) == top_n:
+                    pruning_threshold = max(duration for duration, _ in found_plans.values())
 
-            continue
-
-        # --- Explore Next Flights ---
-        departure_city_code = last_flight.arrival_city_code
-        for next_flight in flights_by_departure.get(departure_city_code, []):
-            if next_flight.departure_city_code != departure_city_code:
-                print(f"ERROR: Discontinuous route! Last arrival: {departure_city_code}, Next departure: {next_flight.departure_city_code}")
                 continue
-                    # NEW FIX: Don't visit end_city unless it's the final destination
-            if end_city and next_flight.arrival_city_code == end_city:
-                arrival_city_obj = get_city_by_code(next_flight.arrival_city_code)
-                if arrival_city_obj:
-                    end_city_is_new_country = arrival_city_obj.country not in visited_countries
-                    # Check if visiting end_city now would complete our requirements
-                    if end_city_is_new_country:
-                        # If end_city is a new country, we need exactly target-1 countries visited
-                        if new_countries_count != target_country_count - 1:
-                            continue  # Can't visit end city yet, not enough countries visited
-                    else:
-                        # If end_city is not a new country, we need exactly target countries visited
-                        if new_countries_count != target_country_count:
-                            continue  # Can't visit end city yet, not enough countries visited
+
+            # --- Explore Next Flights ---
+            departure_city_id = last_flight.arrival_city_id
+            if schedule:
+                candidate_flights = schedule.departures_between(
+                    departure_city_id, last_flight.arrival + min_layover, last_flight.arrival + max_layover
+                )
+            else:
+                candidate_flights = flights_by_departure.get(departure_city_id, [])
+            if debug_invariants:
+                candidate_flights = checked_departures(candidate_flights, departure_city_id)
+            for next_flight in candidate_flights:
+                # NEW FIX: Don't visit end_city unless it's the final destination
+                if end_city and next_flight.arrival_city_id == end_city_id:
+                    end_country = city_country[end_city_id]
+                    if end_country:
+                        end_city_is_new_country = end_country not in visited_countries
+                        # Check if visiting end_city now would complete our requirements
+                        if end_city_is_new_country:
+                            # If end_city is a new country, we need exactly target-1 countries visited
+                            if new_countries_count != target_country_count - 1:
+                                continue  # Can't visit end city yet, not enough countries visited
+                        else:
+                            # If end_city is not a new country, we need exactly target countries visited
+                            if new_countries_count != target_country_count:
+                                continue  # Can't visit end city yet, not enough countries visited
             
                 
-            if next_flight.departure_datetime < last_flight.arrival_datetime: continue
-            layover = next_flight.departure_datetime - last_flight.arrival_datetime
-            if not (timedelta(hours=min_layover_hours) <= layover <= timedelta(hours=max_layover_hours)):
-                continue
+                if next_flight.departure < last_flight.arrival: continue
+                layover = next_flight.departure - last_flight.arrival
+                if not (min_layover <= layover <= max_layover):
+                    continue
 
-            arrival_city_obj = get_city_by_code(next_flight.arrival_city_code)
-            if not arrival_city_obj:
-                continue
+                arrival_country = city_country[next_flight.arrival_city_id]
+                if not arrival_country:
+                    continue
 
-            is_new_country = arrival_city_obj.country not in visited_countries
+                is_new_country = arrival_country not in visited_countries
             
-            # CRITICAL: Only allow exploring to a new country if we haven't exceeded the limit
-            # OR if it's the final leg to the end city
+                # CRITICAL: Only allow exploring to a new country if we haven't exceeded the limit
+                # OR if it's the final leg to the end city
             
-            if not is_new_country:
+                if not is_new_country:
 
-                is_final_leg_home = (
-                    end_city is not None and
-                    next_flight.arrival_city_code == end_city and
-                    new_countries_count >= target_country_count
-                )
+                    is_final_leg_home = (
+                        end_city is not None and
+                        next_flight.arrival_city_id == end_city_id and
+                        new_countries_count >= target_country_count
+                    )
 
-            # If it's going to an already-visited country
-                # Only allow if it's the valid final leg to end_city
-                if not is_final_leg_home:
-                    continue
-            else:
-                # It's a new country - only allow if we haven't reached the limit yet
-                # UNLESS it's also the end city (which would make it the final leg)
-                if new_countries_count >= target_country_count:
-                    # We've reached the target, only allow if this IS the end city
-                    if not (end_city and next_flight.arrival_city_code == end_city):
+                # If it's going to an already-visited country
+                    # Only allow if it's the valid final leg to end_city
+                    if not is_final_leg_home:
                         continue
+                else:
+                    # It's a new country - only allow if we haven't reached the limit yet
+                    # UNLESS it's also the end city (which would make it the final leg)
+                    if new_countries_count >= target_country_count:
+                        # We've reached the target, only allow if this IS the end city
+                        if not (end_city and next_flight.arrival_city_id == end_city_id):
+                            continue
 
-            new_path = current_path + [next_flight]
-            new_duration = current_duration + next_flight.duration
-                        # OPTIMIZATION: Don't even add to queue if already too long
-            if pruning_threshold and new_duration >= pruning_threshold:
-                continue
+                new_path = current_path + [next_flight]
+                new_duration = current_duration + next_flight.duration
+                            # OPTIMIZATION: Don't even add to queue if already too long
+                if pruning_threshold and new_duration >= pruning_threshold:
+                    continue
             
-            new_countries = visited_countries.union({arrival_city_obj.country})
-            new_cities_visited = visited_cities.copy()
-            new_cities_visited.add(next_flight.arrival_city_code)
-            # CRITICAL: Check if this new path would exceed country limit
-            # Calculate the new country count (excluding start if specified)
-            if start_city and start_country and start_country in new_countries:
-                new_path_countries_count = len(new_countries) - 1
-            else:
-                new_path_countries_count = len(new_countries)
+                new_countries = visited_countries.union({arrival_country})
+                new_cities_visited = visited_cities.copy()
+                new_cities_visited.add(next_flight.arrival_city_id)
+                # CRITICAL: Check if this new path would exceed country limit
+                # Calculate the new country count (excluding start if specified)
+                if start_city and start_country and start_country in new_countries:
+                    new_path_countries_count = len(new_countries) - 1
+                else:
+                    new_path_countries_count = len(new_countries)
             
-            # Don't add paths that already exceed the target (unless it's the final destination)
-            # Don't add paths that already exceed the target (unless it's the final destination)
-            if new_path_countries_count > target_country_count:
-                if not (end_city and next_flight.arrival_city_code == end_city):
-                    continue
+                # Don't add paths that already exceed the target (unless it's the final destination)
+                # Don't add paths that already exceed the target (unless it's the final destination)
+                if new_path_countries_count > target_country_count:
+                    if not (end_city and next_flight.arrival_city_id == end_city_id):
+                        continue
 
-            # NEW: PRE-PRUNING FOR FORCED CITIES
-            if forced_cities_set:
-                forced_visited = forced_cities_set.intersection(new_cities_visited)
-                forced_remaining = len(forced_cities_set) - len(forced_visited)
+                # NEW: PRE-PRUNING FOR FORCED CITIES
+                if forced_cities_set:
+                    forced_visited = forced_cities_set.intersection(new_cities_visited)
+                    forced_remaining = len(forced_cities_set) - len(forced_visited)
                 
-                # Calculate countries we can still visit
-                countries_left_to_visit = target_country_count - new_path_countries_count
+                    # Calculate countries we can still visit
+                    countries_left_to_visit = target_country_count - new_path_countries_count
                 
-                # If we need to visit more forced cities than we have new countries left in our budget,
-                # this path is impossible. Prune it now.
-                if forced_remaining > 0 and countries_left_to_visit < forced_remaining:
-                    continue # PRUNE! This path can never satisfy the forced cities constraint.
+                    # If we need to visit more forced cities than we have new countries left in our budget,
+                    # this path is impossible. Prune it now.
+                    if forced_remaining > 0 and countries_left_to_visit < forced_remaining:
+                        continue # PRUNE! This path can never satisfy the forced cities constraint.
+
+                # Not enough time left in the window to collect the missing countries / reach end_city
+                if feasibility.is_hopeless(
+                    next_flight.arrival_city_id, next_flight.arrival, new_countries,
+                    target_country_count - new_path_countries_count,
+                    end_city is not None and next_flight.arrival_city_id != end_city_id
+                ):
+                    paths_pruned_window += 1
+                    continue
+
+                if pareto_labels and not pareto_labels.add_label(search_state(new_path, new_countries, new_cities_visited), new_path):
+                    continue
 
-            # PUSH TO QUEUE
-            heapq.heappush(priority_queue, (new_duration, counter, new_path, new_countries, new_cities_visited))
-            counter += 1
+                # PUSH TO QUEUE
+                push((new_duration, counter, new_path, new_countries, new_cities_visited))
+                counter += 1
 
-    print(f"Search complete: {paths_explored} paths explored, {paths_pruned_forced} pruned (forced cities), {paths_pruned_impossible} pruned (unreachable)")
+    if max_frontier_entries:
+        print(f"Frontier: {priority_queue.spilled_entries} entries spilled to disk")
+        priority_queue.close()
+    print(f"Search complete: {paths_explored} paths explored, {paths_pruned_forced} pruned (forced cities), {paths_pruned_impossible} pruned (unreachable), {paths_pruned_window} pruned (time window)")
+    if beam_width:
+        print(f"Beam: {paths_dropped_beam} queued paths dropped (width {beam_width})")
     
     # 4. Final Processing
-    unique_best_plans = list(found_plans.values())
-    unique_best_plans.sort(key=lambda p: p.total_duration)
-    return unique_best_plans[:top_n]
+    if pareto_labels:
+        print(f"Pareto front: {len(pareto_labels.front)} plans")
+    return best_plans()
 
 
 if __name__ == '__main__':
@@ -357,7 +650,12 @@ if __name__ == '__main__':
 
     print(f"\nSearching for {params['top_n']} plans visiting {params['num_countries']} countries from {params['start_city']}, forcing {params['forced_cities']}...")
     
-    top_plans = find_best_travel_plan(**params)
+    # Reruns with the same data and parameters are answered from the result store.
+    from result_store import ResultStore, dataset_fingerprint, find_best_travel_plan_stored
+    result_store = ResultStore()
+    top_plans = find_best_travel_plan_stored(
+        result_store, dataset_fingerprint(base_flights), "merged_flight_data.xlsx", **params
+    )
     
     if top_plans:
         print(f"\n--- Found {len(top_plans)} Travel Plan(s) ---")
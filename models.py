@@ -1,6 +1,7 @@
+import threading
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import Callable, List, Dict, FrozenSet, Optional, Set
 
 CITIES: List[Dict[str, str]] = [
     {'name': 'Bamako', 'name_cn': '巴马科', 'code': 'BKO', 'country': 'Mali', 'country_cn': '马里'},
@@ -44,24 +45,140 @@ class City:
     country: str
     country_cn: str
 
-@dataclass
+class Vocabulary:
+    """
+    Dictionary encoding for one string column: every distinct value gets a small
+    integer code, shared by all flights. Filters that only depend on the string are
+    evaluated once per entry (codes_where) instead of once per flight.
+    """
+
+    def __init__(self, initial: Optional[List[str]] = None):
+        self.strings: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        for value in initial or []:
+            self.encode(value)
+
+    def encode(self, value) -> int:
+        """Returns the code for a value, adding it to the vocabulary if it is new."""
+        value = str(value)
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self.strings)
+                    self.strings.append(value)
+                    self._codes[value] = code
+        return code
+
+    def lookup(self, value: str) -> Optional[int]:
+        """Returns the code for a value without adding it (None if unknown)."""
+        return self._codes.get(value)
+
+    def decode(self, code: int) -> str:
+        return self.strings[code]
+
+    def codes_where(self, predicate: Callable[[str], bool]) -> Set[int]:
+        """Codes of all entries for which predicate(value) is true."""
+        return {code for code, value in enumerate(self.strings) if predicate(value)}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+# Shared vocabularies for the dictionary-encoded Flight columns.
+AIRLINES = Vocabulary()
+FLIGHT_NUMBERS = Vocabulary()
+FLIGHT_CLASSES = Vocabulary()
+CITY_CODES = Vocabulary([city_data['code'] for city_data in CITIES])
+TRANSFER_INFOS = Vocabulary()
+VISA_INFOS = Vocabulary()
+
+@dataclass(slots=True)
 class Flight:
+    """
+    A scheduled flight. Airline, flight number, class, cities, transfer and visa info
+    are stored as codes into the shared vocabularies above; the properties of the same
+    name return the decoded strings.
+
+    One Flight is one physical flight: the class variants the sheet lists separately
+    are merged into flight_class_ids. flight_class_id is the class the flight is
+    reported in (the matched class once a plan is built with a class filter).
+    """
     date: datetime.date
-    airline: str
-    flight_number: str
-    flight_class: str
-    departure_city_code: str
-    arrival_city_code: str
+    airline_id: int
+    flight_number_id: int
+    flight_class_id: int
+    flight_class_ids: FrozenSet[int]
+    departure_city_id: int
+    arrival_city_id: int
     departure_time: datetime.time
     arrival_time: datetime.time
     departure_datetime: datetime
     arrival_datetime: datetime
     duration: timedelta
     transfers: int
-    transfer_info: str
-    visa_info: str  # <-- ADD THIS LINE
+    transfer_info_id: int
+    visa_info_id: int
     direct_flight: bool
 
+    @property
+    def airline(self) -> str:
+        return AIRLINES.strings[self.airline_id]
+
+    @property
+    def flight_number(self) -> str:
+        return FLIGHT_NUMBERS.strings[self.flight_number_id]
+
+    @property
+    def flight_class(self) -> str:
+        return FLIGHT_CLASSES.strings[self.flight_class_id]
+
+    @property
+    def flight_classes(self) -> List[str]:
+        """Names of all classes available on this flight."""
+        return sorted(FLIGHT_CLASSES.strings[code] for code in self.flight_class_ids)
+
+    @property
+    def departure_city_code(self) -> str:
+        return CITY_CODES.strings[self.departure_city_id]
+
+    @property
+    def arrival_city_code(self) -> str:
+        return CITY_CODES.strings[self.arrival_city_id]
+
+    @property
+    def transfer_info(self) -> str:
+        return TRANSFER_INFOS.strings[self.transfer_info_id]
+
+    @property
+    def visa_info(self) -> str:
+        return VISA_INFOS.strings[self.visa_info_id]
+
+    # Codes are only meaningful inside one process, so pickles carry the strings
+    # and are re-encoded into the receiving process's vocabularies.
+    def __getstate__(self):
+        return (
+            self.date, self.airline, self.flight_number, self.flight_class, self.flight_classes,
+            self.departure_city_code, self.arrival_city_code,
+            self.departure_time, self.arrival_time, self.departure_datetime, self.arrival_datetime,
+            self.duration, self.transfers, self.transfer_info, self.visa_info, self.direct_flight
+        )
+
+    def __setstate__(self, state):
+        (self.date, airline, flight_number, flight_class, flight_classes, departure_city_code, arrival_city_code,
+         self.departure_time, self.arrival_time, self.departure_datetime, self.arrival_datetime,
+         self.duration, self.transfers, transfer_info, visa_info, self.direct_flight) = state
+        self.airline_id = AIRLINES.encode(airline)
+        self.flight_number_id = FLIGHT_NUMBERS.encode(flight_number)
+        self.flight_class_id = FLIGHT_CLASSES.encode(flight_class)
+        self.flight_class_ids = frozenset(FLIGHT_CLASSES.encode(name) for name in flight_classes)
+        self.departure_city_id = CITY_CODES.encode(departure_city_code)
+        self.arrival_city_id = CITY_CODES.encode(arrival_city_code)
+        self.transfer_info_id = TRANSFER_INFOS.encode(transfer_info)
+        self.visa_info_id = VISA_INFOS.encode(visa_info)
+
 @dataclass
 class TravelPlan:
     flights: List[Flight] = field(default_factory=list)
@@ -70,6 +187,17 @@ class TravelPlan:
     def __post_init__(self):
         self.total_duration = sum((f.duration for f in self.flights), timedelta())
 
+    @property
+    def elapsed_duration(self) -> timedelta:
+        """Time from the first departure to the last arrival, layovers included."""
+        if not self.flights:
+            return timedelta()
+        return self.flights[-1].arrival_datetime - self.flights[0].departure_datetime
+
+    @property
+    def total_transfers(self) -> int:
+        return sum(f.transfers for f in self.flights)
+
 
 # Helper for city lookups
 CITIES_BY_CODE: Dict[str, City] = {
@@ -79,3 +207,11 @@ CITIES_BY_CODE: Dict[str, City] = {
 def get_city_by_code(code: str) -> City | None:
     """Returns a City object for a given IATA code."""
     return CITIES_BY_CODE.get(code)
+
+def country_by_city_id() -> List[Optional[str]]:
+    """Country name for every code in CITY_CODES (None for cities missing from CITIES)."""
+    countries = []
+    for code in CITY_CODES.strings:
+        city = CITIES_BY_CODE.get(code)
+        countries.append(city.country if city else None)
+    return countries
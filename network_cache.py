@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+# --- Prepared-network cache ---
+# The expanded, filtered and indexed flight network of a search depends only on the
+# data and on the date window and flight filters, not on num_countries, start/end city
+# or forced cities. Interactive re-queries that only change those reuse the network.
+
+# Rough size of one flight held by a prepared network: its Leg (see timeline.py) with
+# the minute ints, plus the list and index references to it.
+APPROX_BYTES_PER_FLIGHT = 200
+
+
+def network_signature(
+    start_date: date,
+    end_date: date,
+    cities_choice: List[str],
+    flight_class_filter: str = "ALL",
+    max_transfers: Optional[int] = None,
+    max_flight_duration_hours: Optional[int] = None,
+    no_fly_start_hour: Optional[int] = None,
+    no_fly_end_hour: Optional[int] = None,
+    periodic: bool = False
+) -> Tuple:
+    """
+    The cache signature of a prepared network: prepare_network's arguments other than
+    the base flights. Every caller that caches networks keys them with this.
+    """
+    return (
+        periodic, start_date, end_date, tuple(sorted(cities_choice)), flight_class_filter, max_transfers,
+        max_flight_duration_hours, no_fly_start_hour, no_fly_end_hour
+    )
+
+
+def network_flight_count(network: Any) -> int:
+    """Flights a prepared network owns: its legs (periodic mode shares the weekly base flights)."""
+    return len(network.bound_legs) if network.schedule is not None else len(network.flights)
+
+
+class NetworkCache:
+    """
+    Thread-safe LRU cache of prepared networks. Entries are keyed on the filter signature
+    and on the identity of the base flights (the dataset version: a reload builds a new
+    flight sequence). An entry keeps its base flights alive, so their id can't be reused
+    while it is cached. Least recently used entries are evicted once the estimated size
+    of all entries exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, Any, int]]" = OrderedDict()  # key -> (base, network, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(
+        self,
+        base_flights: Any,
+        signature: Hashable,
+        build: Callable[[], Any],
+        flight_count: Callable[[Any], int]
+    ) -> Any:
+        """Returns the cached network for (base_flights, signature), building it on a miss."""
+        key = (id(base_flights), signature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is base_flights:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Built outside the lock: a concurrent search may build the same network once more,
+        # which is cheaper than making every other lookup wait for the build.
+        network = build()
+        size = flight_count(network) * APPROX_BYTES_PER_FLIGHT
+        if size > self.max_bytes:
+            return network  # Would evict everything else and still not fit
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (base_flights, network, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return network
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self._bytes
@@ -0,0 +1,87 @@
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from models import TravelPlan
+from timeline import Leg, to_minutes
+
+# Objectives of a (partial) plan, all minimized: (total flight time, elapsed time from
+# first departure to last arrival, total transfers), times in minutes.
+Objectives = Tuple[int, int, int]
+
+
+def path_objectives(path: List[Leg]) -> Objectives:
+    flight_time = 0
+    transfers = 0
+    for leg in path:
+        flight_time += leg.duration
+        transfers += leg.transfers
+    return flight_time, path[-1].arrival - path[0].departure, transfers
+
+def plan_objectives(plan: TravelPlan) -> Objectives:
+    return to_minutes(plan.total_duration), to_minutes(plan.elapsed_duration), plan.total_transfers
+
+def weakly_dominates(a: Objectives, b: Objectives) -> bool:
+    """True if a is at least as good as b in every objective."""
+    return a[0] <= b[0] and a[1] <= b[1] and a[2] <= b[2]
+
+
+class ParetoLabels:
+    """
+    Label sets for the Pareto search mode of find_best_travel_plan.
+
+    A label is kept per search state (last arrival city and time, visited countries,
+    visited forced cities): two partial paths in the same state have exactly the same
+    continuations, so one whose flight time and transfers are no lower and whose first
+    departure is no later can never lead to a better plan and is dropped. Partial
+    paths that an already finished plan weakly dominates are dropped too, since every
+    objective only grows as a path is extended.
+    """
+
+    def __init__(self):
+        # state -> list of (flight time, transfers, first departure)
+        self._labels: Dict[Hashable, List[tuple]] = {}
+        self.front: List[Tuple[Objectives, TravelPlan]] = []
+
+    @staticmethod
+    def _label(path: List[Leg]) -> tuple:
+        flight_time, _, transfers = path_objectives(path)
+        return flight_time, transfers, path[0].departure
+
+    @staticmethod
+    def _label_dominates(a: tuple, b: tuple) -> bool:
+        return a[0] <= b[0] and a[1] <= b[1] and a[2] >= b[2]
+
+    def _dominated_by_front(self, path: List[Leg]) -> bool:
+        objectives = path_objectives(path)
+        return any(weakly_dominates(plan_objectives, objectives) for plan_objectives, _ in self.front)
+
+    def add_label(self, state: Hashable, path: List[Leg]) -> bool:
+        """Records a partial path; returns False if it is dominated and should not be pushed."""
+        if self._dominated_by_front(path):
+            return False
+        label = self._label(path)
+        labels = self._labels.setdefault(state, [])
+        if any(self._label_dominates(existing, label) for existing in labels):
+            return False
+        labels[:] = [existing for existing in labels if not self._label_dominates(label, existing)]
+        labels.append(label)
+        return True
+
+    def is_alive(self, state: Hashable, path: List[Leg]) -> bool:
+        """False if a popped path was superseded after it was pushed."""
+        return self._label(path) in self._labels.get(state, ()) and not self._dominated_by_front(path)
+
+    def add_plan(self, plan: TravelPlan, path: Optional[List[Leg]] = None) -> bool:
+        """
+        Adds a finished plan (built from `path`, if the search has it) to the front
+        unless an existing plan weakly dominates it.
+        """
+        objectives = path_objectives(path) if path else plan_objectives(plan)
+        if any(weakly_dominates(existing, objectives) for existing, _ in self.front):
+            return False
+        self.front = [(existing, p) for existing, p in self.front if not weakly_dominates(objectives, existing)]
+        self.front.append((objectives, plan))
+        return True
+
+    def plans(self) -> List[TravelPlan]:
+        """The front, ordered by flight time, then elapsed time, then transfers."""
+        return [plan for _, plan in sorted(self.front, key=lambda entry: entry[0])]
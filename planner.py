@@ -0,0 +1,223 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from main import find_best_travel_plan, prepare_network
+from network_cache import NetworkCache, network_flight_count, network_signature
+from pareto import ParetoLabels
+from models import TravelPlan, Flight
+
+# --- Query planner ---
+# Estimates how many paths a query will explore from cheap statistics of its prepared
+# network, before searching, and picks how to run it:
+#   exact     best-first search as it is (small searches)
+#   parallel  exact, split by first departure city over worker processes
+#   deadline  exact best-first with a time budget, best plans so far if it runs out
+#   beam      best-first keeping only the cheapest BEAM_WIDTH queued paths (huge searches)
+# The estimate is a branching-factor model, good for orders of magnitude only. The
+# full tree (seeds * branching ** (legs - 1)) overestimates by up to 1000x, because the
+# country rules, the feasibility bounds and the top_n threshold cut most of it; the
+# explored paths grow like seeds * (1 + branching) ** (EXPLORED_EXPONENT * (legs - 1)),
+# which was fitted on synthetic queries (within 2x for most of them).
+
+EXACT_PATH_LIMIT = 200_000       # Estimated paths an exact search handles in seconds
+PARALLEL_PATH_LIMIT = 5_000_000  # Beyond this even a split exact search takes too long
+DEADLINE_SECONDS = 60.0
+BEAM_WIDTH = 20_000
+MIN_PARALLEL_SEED_CITIES = 4     # Fewer first cities than this don't split usefully
+EXPLORED_EXPONENT = 0.3
+
+# Keyword arguments that tie a search to this process: events and callbacks can't be
+# sent to worker processes, and every worker would write the same trace file.
+IN_PROCESS_PARAMS = ("stop_event", "progress_callback", "plans_callback", "infeasible_callback", "trace_path")
+
+# Keyword arguments of find_best_travel_plan that prepare_network takes as well.
+NETWORK_PARAMS = (
+    "start_date", "end_date", "cities_choice", "flight_class_filter", "max_transfers",
+    "max_flight_duration_hours", "no_fly_start_hour", "no_fly_end_hour", "periodic"
+)
+
+
+@dataclass
+class SearchEstimate:
+    dated_flights: int           # Filtered flights over the whole window
+    departure_cities: int        # Cities with at least one filtered departure
+    flights_per_city_day: float
+    branching: float             # Expected next flights per path (the layover range's share)
+    legs: int                    # Flights in a complete plan, at least
+    max_legs_in_window: float    # How many legs fit in the window at best
+    seeds: float                 # First flights
+    paths: float                 # Estimated paths explored
+
+
+@dataclass
+class QueryPlan:
+    strategy: str                # "exact", "parallel", "deadline" or "beam"
+    reason: str
+    estimate: SearchEstimate
+    options: Dict[str, Any] = field(default_factory=dict)  # Extra find_best_travel_plan arguments
+    workers: int = 1
+
+
+def estimate_search(network, params: dict) -> SearchEstimate:
+    """Estimates the size of a search from its prepared network (see prepare_network)."""
+    start_date: date = params["start_date"]
+    end_date: date = params["end_date"]
+    window_days = (end_date - start_date).days + 1
+    base_flights: List[Flight] = network.base_flights
+    # Periodic networks search the weekly flights, each of which runs once a week.
+    dated_flights = len(base_flights) * window_days / 7 if params.get("periodic") else len(network.flights)
+    departure_cities = max(len(network.flights_by_departure), 1)
+    flights_per_city_day = dated_flights / departure_cities / window_days
+
+    min_layover_hours = params.get("min_layover_hours", 10)
+    max_layover_hours = params.get("max_layover_hours", 48)
+    branching = flights_per_city_day * max(max_layover_hours - min_layover_hours, 0) / 24
+
+    average_hours = sum((f.duration for f in base_flights), timedelta()) / len(base_flights) / timedelta(hours=1) if base_flights else 0
+    max_legs_in_window = window_days * 24 / (average_hours + min_layover_hours) if average_hours + min_layover_hours else float("inf")
+    legs = max(params["num_countries"], 1) + (1 if params.get("end_city") else 0)
+
+    if params.get("start_city"):
+        seeds = dated_flights / departure_cities
+    else:
+        seed_cities = params.get("seed_cities")
+        seeds = dated_flights * (len(seed_cities) / departure_cities if seed_cities is not None else 1)
+    paths = seeds * (1 + branching) ** (EXPLORED_EXPONENT * (legs - 1))
+    if legs > max_legs_in_window:
+        paths = min(paths, seeds)  # The feasibility bounds cut nearly every path
+    return SearchEstimate(
+        int(dated_flights), departure_cities, flights_per_city_day, branching,
+        legs, max_legs_in_window, seeds, paths
+    )
+
+
+def choose_strategy(estimate: SearchEstimate, params: dict, max_workers: Optional[int] = None) -> QueryPlan:
+    workers = max_workers or os.cpu_count() or 1
+    seed_cities = len(params.get("cities_choice") or ())
+    size = f"~{estimate.paths:,.0f} paths ({estimate.seeds:,.0f} first flights, branching {estimate.branching:.1f} over {estimate.legs} legs)"
+    if estimate.paths <= EXACT_PATH_LIMIT:
+        return QueryPlan("exact", f"{size}: small enough for an exact best-first search", estimate)
+    if estimate.paths <= PARALLEL_PATH_LIMIT:
+        if params.get("start_city"):
+            reason = f"{size}: too large to finish quickly, and a fixed start city can't be split over processes"
+        elif any(params.get(name) for name in IN_PROCESS_PARAMS):
+            reason = f"{size}: too large to finish quickly; stoppable, reporting or traced searches run in one process"
+        elif workers < 2 or seed_cities < MIN_PARALLEL_SEED_CITIES:
+            reason = f"{size}: too large to finish quickly, and only {workers} worker(s) / {seed_cities} first cities to split over"
+        else:
+            workers = min(workers, seed_cities)
+            return QueryPlan(
+                "parallel", f"{size}: split by first departure city over {workers} processes", estimate, workers=workers
+            )
+        return QueryPlan(
+            "deadline", f"{reason}; exact search with a {DEADLINE_SECONDS:.0f}s budget",
+            estimate, {"deadline_seconds": DEADLINE_SECONDS}
+        )
+    if params.get("pareto") or params.get("max_frontier_entries"):
+        # Dropping queued paths would leave holes in the front, and a beam can't be
+        # combined with a spilling queue; a budget at least keeps every plan exact.
+        what = "Pareto front" if params.get("pareto") else "spilling search"
+        return QueryPlan(
+            "deadline", f"{size}: too large for an exact search; {what} with a {DEADLINE_SECONDS:.0f}s budget",
+            estimate, {"deadline_seconds": DEADLINE_SECONDS}
+        )
+    return QueryPlan(
+        "beam", f"{size}: too large for an exact search; beam search keeping the {BEAM_WIDTH:,} cheapest queued paths",
+        estimate, {"beam_width": BEAM_WIDTH}
+    )
+
+
+def plan_query(
+    base_flights: List[Flight],
+    network_cache: Optional[NetworkCache] = None,
+    max_workers: Optional[int] = None,
+    **params
+) -> QueryPlan:
+    """
+    Picks a strategy for find_best_travel_plan(base_flights, **params). With a
+    network_cache, the prepared network built here is reused by the search itself.
+    """
+    network_params = {name: params[name] for name in NETWORK_PARAMS if name in params}
+    if network_cache is not None:
+        # Same signature as find_best_travel_plan, so the search finds this entry.
+        network = network_cache.get_or_build(
+            base_flights, network_signature(**network_params),
+            lambda: prepare_network(base_flights, **network_params), network_flight_count
+        )
+    else:
+        network = prepare_network(base_flights, **network_params)
+    return choose_strategy(estimate_search(network, params), params, max_workers)
+
+
+def _search_partition(base_flights: List[Flight], params: dict) -> List[TravelPlan]:
+    return find_best_travel_plan(base_flights, **params)
+
+
+def search_parallel(base_flights: List[Flight], workers: int, **params) -> List[TravelPlan]:
+    """
+    Exact search split by first departure city: each worker searches plans starting
+    from its share of cities_choice, and the per-worker top_n lists (or Pareto fronts)
+    are merged. Plans from different first cities never collide, so the merge is the
+    exact top_n (or front).
+    Pass a SharedFlightNetwork or FlightStore as base_flights to avoid copying the
+    flights into every worker.
+    """
+    cities = list(params["cities_choice"])
+    shares = [cities[i::workers] for i in range(workers)]
+    plans: List[TravelPlan] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_search_partition, base_flights, dict(params, seed_cities=share))
+            for share in shares if share
+        ]
+        for future in futures:
+            plans.extend(future.result())
+    if params.get("pareto"):
+        labels = ParetoLabels()
+        for plan in plans:
+            labels.add_plan(plan)
+        return labels.plans()
+    plans.sort(key=lambda p: p.total_duration)
+    return plans[:params.get("top_n", 5)]
+
+
+def find_best_travel_plan_auto(
+    base_flights: List[Flight],
+    network_cache: Optional[NetworkCache] = None,
+    max_workers: Optional[int] = None,
+    **params
+) -> Tuple[List[TravelPlan], QueryPlan]:
+    """find_best_travel_plan with the strategy chosen by plan_query; returns (plans, plan)."""
+    if network_cache is None:
+        network_cache = NetworkCache()
+    query_plan = plan_query(base_flights, network_cache, max_workers, **params)
+    print(f"Query plan: {query_plan.strategy} ({query_plan.reason})")
+    if query_plan.strategy == "parallel":
+        return search_parallel(base_flights, query_plan.workers, **params), query_plan
+    # A budget or beam width the caller set itself wins over the planner's.
+    options = {name: value for name, value in query_plan.options.items() if params.get(name) is None}
+    plans = find_best_travel_plan(base_flights, **dict(params, **options), network_cache=network_cache)
+    return plans, query_plan
+
+
+if __name__ == '__main__':
+    from data_handler import load_flights_fast
+    from models import CITIES
+
+    base_flights = load_flights_fast("merged_flight_data.xlsx")
+    params = {
+        "start_date": date(2025, 9, 29),
+        "end_date": date(2025, 10, 26),
+        "cities_choice": [c['code'] for c in CITIES],
+        "num_countries": 5,
+        "min_layover_hours": 6,
+        "max_layover_hours": 72,
+        "top_n": 5
+    }
+    plans, query_plan = find_best_travel_plan_auto(base_flights, **params)
+    print(f"Estimate: {query_plan.estimate}")
+    for plan in plans:
+        print(f"{plan.total_duration}: {' -> '.join([plan.flights[0].departure_city_code] + [f.arrival_city_code for f in plan.flights])}")
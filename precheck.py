@@ -0,0 +1,155 @@
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from models import CITY_CODES, country_by_city_id
+
+# --- Infeasibility pre-check ---
+# Rejects queries that provably have no answer before the search runs, in milliseconds:
+# check_query() looks at the parameters alone, check_network() at the filtered network
+# (which cities have flights, and what can be reached from start_city at all, ignoring
+# times and the country rules). Both only use relaxations of the search's own rules, so
+# a query they reject would have come back empty from find_best_travel_plan anyway.
+
+
+@dataclass
+class Infeasibility:
+    """Why a query can't have an answer. `code` is stable; `details` depend on it."""
+    code: str
+    message: str
+    details: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"code": self.code, "message": self.message, "details": self.details}
+
+
+def _country(code: str) -> Optional[str]:
+    city_id = CITY_CODES.lookup(code)
+    return country_by_city_id()[city_id] if city_id is not None else None
+
+
+def check_query(
+    cities_choice: List[str],
+    num_countries: int,
+    start_city: Optional[str] = None,
+    end_city: Optional[str] = None,
+    forced_cities: Optional[List[str]] = None
+) -> Optional[Infeasibility]:
+    """Checks that only need the parameters: city scope, country count, forced cities."""
+    chosen = set(cities_choice)
+    for role, codes in (("start", [start_city]), ("end", [end_city]), ("forced", forced_cities or [])):
+        for code in codes:
+            if code and code not in chosen:
+                return Infeasibility(
+                    "city_not_in_scope", f"{role} city {code} is not among the chosen cities",
+                    {"city": code, "role": role}
+                )
+
+    # With a start city, num_countries counts countries other than its own.
+    start_country = _country(start_city) if start_city else None
+    countries = {_country(code) for code in chosen} - {None, start_country}
+    if len(countries) < num_countries:
+        return Infeasibility(
+            "too_few_countries",
+            f"the chosen cities span {len(countries)} countries, {num_countries} are required",
+            {"available": len(countries), "required": num_countries}
+        )
+
+    # Every forced city is a new country (the search never returns to a visited one,
+    # except for the final leg into end_city).
+    forced = [code for code in (forced_cities or []) if code not in (start_city, end_city)]
+    if len(forced) > num_countries:
+        return Infeasibility(
+            "too_many_forced_cities",
+            f"{len(forced)} forced cities can't fit in a trip through {num_countries} countries",
+            {"forced": len(forced), "required": num_countries}
+        )
+    return None
+
+
+def _reachable_from(city_id: int, successors: Dict[int, Set[int]]) -> Set[int]:
+    # Cities reachable in one or more flights; city_id itself only through a cycle.
+    reached: Set[int] = set()
+    queue = deque(successors.get(city_id, ()))
+    while queue:
+        city = queue.popleft()
+        if city not in reached:
+            reached.add(city)
+            queue.extend(successors.get(city, set()) - reached)
+    return reached
+
+
+def check_network(
+    network,
+    num_countries: int,
+    start_city: Optional[str] = None,
+    end_city: Optional[str] = None,
+    forced_cities: Optional[List[str]] = None,
+    periodic: bool = False,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Optional[Infeasibility]:
+    """Checks against the filtered network of the query (see prepare_network)."""
+    flights = network.flights
+    if periodic and start_date is not None and end_date is not None and (end_date - start_date).days < 6:
+        # Weekly flights only run in the window on its own weekdays.
+        weekdays = {(start_date + timedelta(days=i)).weekday() for i in range((end_date - start_date).days + 1)}
+        flights = [f for f in flights if f.date.weekday() in weekdays]
+    if not flights:
+        return Infeasibility("no_flights", "no flights are left in the window after filtering")
+
+    successors: Dict[int, Set[int]] = {}
+    arrivals: Set[int] = set()
+    for f in flights:
+        successors.setdefault(f.departure_city_id, set()).add(f.arrival_city_id)
+        arrivals.add(f.arrival_city_id)
+
+    start_city_id = CITY_CODES.encode(start_city) if start_city else None
+    end_city_id = CITY_CODES.encode(end_city) if end_city else None
+    forced_ids = {CITY_CODES.encode(code): code for code in forced_cities or []}
+
+    if start_city_id is not None and start_city_id not in successors:
+        return Infeasibility(
+            "start_city_no_flights", f"no flights leave {start_city} in the window",
+            {"city": start_city}
+        )
+    if end_city_id is not None and end_city_id not in arrivals:
+        return Infeasibility(
+            "end_city_no_flights", f"no flights arrive in {end_city} in the window",
+            {"city": end_city}
+        )
+    for city_id, code in forced_ids.items():
+        if city_id == start_city_id:
+            continue
+        # With Any start, a forced city can be where the trip begins.
+        if city_id not in arrivals and (start_city_id is not None or city_id not in successors):
+            return Infeasibility(
+                "forced_city_no_flights", f"forced city {code} has no flights in the window",
+                {"city": code}
+            )
+
+    if start_city_id is None:
+        return None
+    reachable = _reachable_from(start_city_id, successors)
+    if end_city_id is not None and end_city_id not in reachable:
+        return Infeasibility(
+            "end_city_unreachable", f"{end_city} can't be reached from {start_city}",
+            {"city": end_city, "start_city": start_city}
+        )
+    for city_id, code in forced_ids.items():
+        if city_id != start_city_id and city_id not in reachable:
+            return Infeasibility(
+                "forced_city_unreachable", f"forced city {code} can't be reached from {start_city}",
+                {"city": code, "start_city": start_city}
+            )
+    city_country = country_by_city_id()
+    start_country = city_country[start_city_id]
+    countries = {city_country[city_id] for city_id in reachable} - {None, start_country}
+    if len(countries) < num_countries:
+        return Infeasibility(
+            "too_few_reachable_countries",
+            f"only {len(countries)} countries can be reached from {start_city}, {num_countries} are required",
+            {"reachable": len(countries), "required": num_countries, "start_city": start_city}
+        )
+    return None
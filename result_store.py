@@ -0,0 +1,277 @@
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime, time as time_of_day, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from models import Flight, TravelPlan
+
+# --- Persistent result store ---
+# Search results in a SQLite file shared by every process on the host (GUI sessions
+# and main.py runs), so an expensive query is computed once per version of
+# the flight data. Rows are keyed by the canonical query parameters plus a fingerprint
+# of the loaded flights: when the data changes, old results can't be hit any more, and
+# storing a result for a new version of a source deletes that source's older rows.
+# The least recently used rows are evicted once the payloads exceed max_bytes.
+# Payloads are compressed JSON holding each flight's strings (not pickles: the file is
+# shared, and loading a pickle from it would run whatever code was written into it).
+
+DEFAULT_RESULT_STORE = os.environ.get("FLIGHT_RESULT_STORE", "flight_results.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Part of every key, so rows written in an older payload format are never read.
+PAYLOAD_FORMAT = "json-1"
+
+# find_best_travel_plan arguments that don't change the plans it returns.
+UNKEYED_PARAMS = (
+    "base_flights", "stop_event", "progress_callback", "plans_callback", "trace_path", "max_frontier_entries",
+    "spill_dir", "network_cache", "infeasible_callback", "debug_invariants"
+)
+
+# find_best_travel_plan arguments whose order doesn't matter; keyed sorted, so the same
+# cities ticked in another order hit the same entry.
+UNORDERED_PARAMS = ("cities_choice", "forced_cities", "seed_cities")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    source TEXT,
+    params TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE INDEX IF NOT EXISTS results_source ON results (source, dataset);
+"""
+
+
+def dataset_fingerprint(flights: Sequence[Flight]) -> str:
+    """
+    Content hash of loaded flights. Stores (and shared networks) hash their bytes;
+    a list of flights is hashed flight by flight, which takes a few seconds for a
+    large sheet, so callers compute it once per dataset version. The two hashes of the
+    same flights differ; a process that switches between them only loses cache hits.
+    """
+    content_digest = getattr(flights, "content_digest", None)
+    if content_digest is not None:
+        return content_digest()
+    digest = hashlib.sha256()
+    for flight in flights:
+        digest.update(repr(flight.__getstate__()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Can't key a search on {type(value).__name__}")
+
+
+def canonical_query(params: Dict[str, Any]) -> str:
+    """
+    The search parameters as canonical JSON: defaults filled in, so passing a default
+    explicitly and leaving it out give the same key; city lists sorted; parameters that
+    don't affect the results left out.
+    """
+    from main import find_best_travel_plan
+
+    bound = inspect.signature(find_best_travel_plan).bind_partial(**params)
+    bound.apply_defaults()
+    keyed = {name: value for name, value in bound.arguments.items() if name not in UNKEYED_PARAMS}
+    for name in UNORDERED_PARAMS:
+        if keyed.get(name) is not None:
+            keyed[name] = sorted(keyed[name])
+    return json.dumps(keyed, sort_keys=True, default=_json_default, ensure_ascii=False)
+
+
+def _flight_to_json(flight: Flight) -> list:
+    # Flight.__getstate__ order, with the vocabulary codes already decoded to strings.
+    (flight_date, airline, flight_number, flight_class, flight_classes, departure_city, arrival_city,
+     departure_time, arrival_time, departure_datetime, arrival_datetime,
+     duration, transfers, transfer_info, visa_info, direct_flight) = flight.__getstate__()
+    return [
+        flight_date.isoformat(), airline, flight_number, flight_class, flight_classes, departure_city, arrival_city,
+        departure_time.isoformat(), arrival_time.isoformat(), departure_datetime.isoformat(), arrival_datetime.isoformat(),
+        duration.total_seconds(), transfers, transfer_info, visa_info, direct_flight
+    ]
+
+
+def _flight_from_json(values: list) -> Flight:
+    (flight_date, airline, flight_number, flight_class, flight_classes, departure_city, arrival_city,
+     departure_time, arrival_time, departure_datetime, arrival_datetime,
+     duration, transfers, transfer_info, visa_info, direct_flight) = values
+    flight = Flight.__new__(Flight)
+    flight.__setstate__((
+        date.fromisoformat(flight_date), str(airline), str(flight_number), str(flight_class),
+        [str(name) for name in flight_classes], str(departure_city), str(arrival_city),
+        time_of_day.fromisoformat(departure_time), time_of_day.fromisoformat(arrival_time),
+        datetime.fromisoformat(departure_datetime), datetime.fromisoformat(arrival_datetime),
+        timedelta(seconds=float(duration)), int(transfers), str(transfer_info), str(visa_info), bool(direct_flight)
+    ))
+    return flight
+
+
+def encode_plans(plans: List[TravelPlan]) -> bytes:
+    data = [[_flight_to_json(flight) for flight in plan.flights] for plan in plans]
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def decode_plans(payload: bytes) -> List[TravelPlan]:
+    """Rebuilds the plans of a payload; raises ValueError if it isn't one."""
+    try:
+        data = json.loads(zlib.decompress(payload).decode("utf-8"))
+        return [TravelPlan(flights=[_flight_from_json(values) for values in plan]) for plan in data]
+    except (zlib.error, UnicodeDecodeError, TypeError, KeyError) as e:
+        raise ValueError(f"Not a stored result: {e}") from e
+
+
+class ResultStore:
+    """
+    get(dataset, params) / put(dataset, params, plans) over the SQLite file at `path`.
+    `dataset` is a dataset_fingerprint. Safe to share between threads; other processes
+    open the same file with their own ResultStore.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESULT_STORE, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")  # Readers in other processes don't block writers
+        self._db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(dataset: str, params: Dict[str, Any]) -> str:
+        return ResultStore._key(dataset, canonical_query(params))
+
+    @staticmethod
+    def _key(dataset: str, query: str) -> str:
+        return hashlib.sha256(f"{PAYLOAD_FORMAT}\n{dataset}\n{query}".encode("utf-8")).hexdigest()
+
+    def get(self, dataset: str, params: Dict[str, Any]) -> Optional[List[TravelPlan]]:
+        key = self.key(dataset, params)
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                try:
+                    plans = decode_plans(row[0])
+                except ValueError as e:
+                    print(f"Warning: Dropping unreadable stored result: {e}")
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return plans
+
+    def put(
+        self,
+        dataset: str,
+        params: Dict[str, Any],
+        plans: List[TravelPlan],
+        source: Optional[str] = None
+    ) -> None:
+        """
+        Stores the plans of a finished search. With the data `source` (its path), rows
+        stored for other versions of that source are deleted.
+        """
+        query = canonical_query(params)
+        key = self._key(dataset, query)
+        payload = encode_plans(plans)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if source is not None:
+                    self._db.execute("DELETE FROM results WHERE source = ? AND dataset != ?", (source, dataset))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, dataset, source, query, payload, len(payload), now, now)
+                )
+                self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY last_used"):
+            evicted.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def invalidate(self, source: str, dataset: str) -> int:
+        """Deletes the rows of `source` that belong to any version but `dataset`."""
+        with self._lock:
+            return self._db.execute("DELETE FROM results WHERE source = ? AND dataset != ?", (source, dataset)).rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def find_best_travel_plan_stored(
+    result_store: ResultStore,
+    dataset: str,
+    source: Optional[str] = None,
+    **params
+) -> List[TravelPlan]:
+    """
+    find_best_travel_plan(**params) through the result store. Searches that were stopped
+    or ran against a deadline may be incomplete, so their results aren't stored. Neither
+    are rejected infeasible queries: the pre-check is cheap, and running it again on a
+    later call reports the reason through infeasible_callback once more.
+    """
+    from main import find_best_travel_plan
+
+    plans = result_store.get(dataset, params)
+    if plans is not None:
+        print(f"Results for this query loaded from {result_store.path}.")
+        return plans
+    infeasible = []
+    callback = params.get("infeasible_callback")
+
+    def record_infeasibility(infeasibility):
+        infeasible.append(infeasibility)
+        if callback:
+            callback(infeasibility)
+
+    plans = find_best_travel_plan(**dict(params, infeasible_callback=record_infeasibility))
+    stop_event = params.get("stop_event")
+    if not infeasible and not (stop_event and stop_event.is_set()) and not params.get("deadline_seconds"):
+        result_store.put(dataset, params, plans, source)
+    return plans
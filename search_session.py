@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SearchSession:
+    """One search run: its generation token, its own stop event and its worker thread."""
+
+    def __init__(self, generation: int, params: Dict[str, Any]):
+        self.generation = generation
+        self.params = params
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_progress_time = 0.0
+
+
+class SearchSessionManager:
+    """
+    Runs GUI searches with cancel-and-replace semantics.
+
+    Every start() gets a new generation token and a fresh stop event. The superseded
+    search is cancelled, and the new worker waits up to `join_timeout` seconds for it
+    to stop before searching, so the UI thread never waits. A search that takes longer
+    to stop keeps running alongside the new one until it notices; its results are
+    dropped. Results and progress from any generation other than the current one are
+    dropped. Progress is forwarded at most once per `progress_interval` seconds.
+
+    search_fn(params, stop_event, progress_callback) runs the search and returns its results.
+    on_results(generation, results, stopped) and on_progress(generation, *progress) are
+    called from the worker thread, without the manager's lock held; a start() can
+    still supersede the generation while on_results runs, so it should check
+    is_current() before writing shared state. A search stopped before it got to run
+    delivers no results, with stopped=True.
+    """
+
+    def __init__(
+        self,
+        search_fn: Callable[[Dict[str, Any], threading.Event, Callable], List[Any]],
+        on_results: Callable[[int, List[Any], bool], None],
+        on_progress: Optional[Callable[..., None]] = None,
+        progress_interval: float = 0.25,
+        join_timeout: float = 5.0
+    ):
+        self.search_fn = search_fn
+        self.on_results = on_results
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.join_timeout = join_timeout
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._current: Optional[SearchSession] = None
+
+    @property
+    def current_generation(self) -> int:
+        return self._generation
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self._generation
+
+    def start(self, params: Dict[str, Any]) -> int:
+        """Cancels any running search and starts a new one. Returns its generation."""
+        with self._lock:
+            previous = self._current
+            if previous:
+                previous.stop_event.set()
+            self._generation += 1
+            session = SearchSession(self._generation, params)
+            self._current = session
+            session.thread = threading.Thread(target=self._run, args=(session, previous), daemon=True)
+            session.thread.start()
+        return session.generation
+
+    def cancel(self) -> None:
+        """Asks the current search to stop; it still delivers what it found so far."""
+        with self._lock:
+            if self._current:
+                self._current.stop_event.set()
+
+    def _run(self, session: SearchSession, previous: Optional[SearchSession]) -> None:
+        if previous and previous.thread:
+            previous.thread.join(self.join_timeout)
+            if previous.thread.is_alive():
+                print(f"Warning: search {previous.generation} is still stopping; its results will be dropped.")
+        if not self.is_current(session.generation):
+            return  # Superseded before it even started
+
+        def report_progress(*progress):
+            now = time.monotonic()
+            if now - session.last_progress_time < self.progress_interval:
+                return
+            session.last_progress_time = now
+            if self.on_progress and self.is_current(session.generation):
+                self.on_progress(session.generation, *progress)
+
+        # Stopped while it waited for the previous search: nothing to run, but the caller
+        # still gets its (empty) results.
+        if session.stop_event.is_set():
+            results = []
+        else:
+            results = self.search_fn(session.params, session.stop_event, report_progress)
+
+        with self._lock:
+            if not self.is_current(session.generation):
+                print(f"Dropping results of superseded search {session.generation}.")
+                return
+            self._current = None
+        self.on_results(session.generation, results, session.stop_event.is_set())
@@ -0,0 +1,199 @@
+import atexit
+import io
+import struct
+import sys
+from collections.abc import Sequence
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from flight_store import FlightStore, FlightStoreWriter, ROW_STRUCT
+from models import Flight
+
+# --- Shared-memory flight network ---
+# The loaded flights (in the flight store format, see flight_store.py) plus an index of
+# rows by departure city, in one multiprocessing.shared_memory block. Worker processes
+# attach to the block by name: nothing is copied or unpickled, and Flight objects are
+# decoded from the shared bytes as they are read.
+#
+# Block layout (little endian):
+#   header   NETWORK_MAGIC, store length, index offset, number of departure cities
+#   store    a complete flight store
+#   index    for departure city table entry i, row ids city_offsets[i]:city_offsets[i+1]
+#            of row_ids; both uint32 arrays, rows in store order within each city
+NETWORK_MAGIC = b"FLTSHARE"
+NETWORK_HEADER = struct.Struct("<8sQQQ")
+DEPARTURE_CITY_FIELD = 11  # Position of the departure city string id in a ROW_STRUCT row
+
+
+class SharedFlightNetwork(Sequence):
+    """
+    Read-only flights in shared memory. Behaves like a List[Flight], so it can be passed
+    to find_best_travel_plan as base_flights; departing_from() uses the city index.
+
+    SharedFlightNetwork.create(flights) exports flights and owns the block (close() also
+    unlinks it). SharedFlightNetwork.attach(name) maps an existing block read-only.
+    Pickling a network only pickles the block name, so handing it to a multiprocessing
+    pool attaches the workers instead of copying the flights.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        self._buffer = shm.buf.toreadonly()
+        magic, store_length, index_offset, city_count = NETWORK_HEADER.unpack_from(self._buffer, 0)
+        if magic != NETWORK_MAGIC:
+            self._buffer.release()
+            raise ValueError(f"Shared memory block {shm.name} is not a flight network")
+        self._store = FlightStore.from_buffer(self._buffer[NETWORK_HEADER.size:NETWORK_HEADER.size + store_length])
+        self._city_offsets = self._buffer[index_offset:index_offset + (city_count + 1) * 4].cast("I")
+        rows_offset = index_offset + (city_count + 1) * 4
+        self._row_ids = self._buffer[rows_offset:rows_offset + len(self._store) * 4].cast("I")
+        # Store table id of each departure city, by this process's CITY_CODES code.
+        self._city_table_ids = {code: i for i, code in enumerate(self._store._codes[3])}
+
+    @classmethod
+    def create(cls, flights: Iterable[Flight], name: Optional[str] = None) -> "SharedFlightNetwork":
+        """Exports flights (a list or a FlightStore) into a new shared memory block."""
+        if isinstance(flights, FlightStore) and flights.path:
+            with open(flights.path, "rb") as f:
+                store_bytes = f.read()
+        else:
+            out = io.BytesIO()
+            writer = FlightStoreWriter(None)
+            try:
+                writer.extend(flights)
+                writer.write_to(out)
+            finally:
+                writer.abort()
+            store_bytes = out.getvalue()
+        store = FlightStore.from_buffer(store_bytes)
+
+        # Group row ids by departure city table id (a counting sort keeps store order).
+        departure_ids = [row[DEPARTURE_CITY_FIELD] for row in ROW_STRUCT.iter_unpack(store._rows)]
+        city_count = len(store._codes[3])
+        city_offsets = [0] * (city_count + 1)
+        for table_id in departure_ids:
+            city_offsets[table_id + 1] += 1
+        for i in range(city_count):
+            city_offsets[i + 1] += city_offsets[i]
+        row_ids = [0] * len(departure_ids)
+        next_slot = city_offsets[:-1]
+        for row_id, table_id in enumerate(departure_ids):
+            row_ids[next_slot[table_id]] = row_id
+            next_slot[table_id] += 1
+        store.close()
+
+        index_offset = NETWORK_HEADER.size + len(store_bytes)
+        index_offset += (-index_offset) % 8  # Keep the uint32 arrays aligned
+        size = index_offset + (len(city_offsets) + len(row_ids)) * 4
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        try:
+            NETWORK_HEADER.pack_into(shm.buf, 0, NETWORK_MAGIC, len(store_bytes), index_offset, city_count)
+            shm.buf[NETWORK_HEADER.size:NETWORK_HEADER.size + len(store_bytes)] = store_bytes
+            struct.pack_into(f"<{len(city_offsets)}I", shm.buf, index_offset, *city_offsets)
+            struct.pack_into(f"<{len(row_ids)}I", shm.buf, index_offset + len(city_offsets) * 4, *row_ids)
+            network = cls(shm, owner=True)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        print(f"Exported {len(network)} flights to shared memory block {shm.name} ({size} bytes).")
+        return network
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFlightNetwork":
+        """
+        Maps an exported network read-only. Near-free: only the string tables are decoded,
+        and a process attaches to each block once (later calls return the same network).
+        """
+        network = _attached.get(name)
+        if network is None:
+            if sys.version_info >= (3, 13):
+                # The creating process owns the block; attaching must not register it for cleanup.
+                shm = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                shm = shared_memory.SharedMemory(name=name)
+            network = _attached[name] = cls(shm, owner=False)
+        return network
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def close(self) -> None:
+        """Detaches from the block; the creating network also frees it."""
+        if _attached.get(self.name) is self:
+            del _attached[self.name]
+        self._store.close()
+        self._city_offsets.release()
+        self._row_ids.release()
+        self._buffer.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __reduce__(self):
+        return (SharedFlightNetwork.attach, (self.name,))
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __getitem__(self, index):
+        return self._store[index]
+
+    def __iter__(self) -> Iterator[Flight]:
+        return iter(self._store)
+
+    def content_digest(self) -> str:
+        return self._store.content_digest()
+
+    def departing_from(self, city_ids: Iterable[int]) -> List[Flight]:
+        """The flights departing from any of the given cities (CITY_CODES codes), in store order."""
+        row_ids = []
+        for city_id in city_ids:
+            table_id = self._city_table_ids.get(city_id)
+            if table_id is not None:
+                row_ids.extend(self._row_ids[self._city_offsets[table_id]:self._city_offsets[table_id + 1]])
+        row_ids.sort()
+        return [self._store[row_id] for row_id in row_ids]
+
+
+_attached: Dict[str, SharedFlightNetwork] = {}  # Networks this process attached to, by block name
+
+@atexit.register
+def _detach_all() -> None:
+    # The views into a block must be released before SharedMemory's own cleanup runs.
+    for network in list(_attached.values()):
+        network.close()
+
+
+def _search_worker(network: SharedFlightNetwork, params: dict) -> list:
+    # Used by the example below: `network` arrives as a block name and attaches here.
+    from main import find_best_travel_plan
+    plans = find_best_travel_plan(base_flights=network, **params)
+    return [(str(plan.total_duration), [f.arrival_city_code for f in plan.flights]) for plan in plans]
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import date
+
+    from data_handler import load_flights_fast
+    from models import CITIES
+
+    with SharedFlightNetwork.create(load_flights_fast("merged_flight_data.xlsx")) as network:
+        queries = [
+            {"start_date": date(2025, 9, 29), "end_date": date(2025, 10, 5), "start_city": start_city,
+             "cities_choice": [c['code'] for c in CITIES], "num_countries": 3, "top_n": 3}
+            for start_city in ("CAI", "ADD", "NBO", "CMN")
+        ]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            for query, plans in zip(queries, executor.map(_search_worker, [network] * len(queries), queries)):
+                print(f"{query['start_city']}: {plans}")
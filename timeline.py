@@ -0,0 +1,163 @@
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, time, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from data_handler import flight_on_date
+from models import CITY_CODES, Flight
+import tracing
+
+# --- Integer-minute timeline ---
+# The search works on legs: dated flights whose times are integer minutes since midnight
+# at the start of the search window. Comparing and adding ints is much cheaper than
+# datetime/timedelta arithmetic, and a leg only refers to its (weekly) base flight, so
+# expanding a window creates no date or datetime objects. Dated Flight objects are made
+# (with flight_on_date) only for the flights of the plans a search returns. The sheet's
+# times are whole minutes; seconds, if any, are dropped.
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_day(t: time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def to_minutes(duration: timedelta) -> int:
+    return duration // timedelta(minutes=1)
+
+
+@dataclass(slots=True)
+class Leg:
+    departure: int          # Minutes since the start of the window
+    arrival: int
+    duration: int           # Flight time in minutes (the sheet's, not arrival - departure)
+    departure_city_id: int
+    arrival_city_id: int
+    transfers: int
+    day: int                # Departure day, counted from the start of the window
+    flight: Flight          # The weekly base flight
+
+    @property
+    def departure_city_code(self) -> str:
+        return CITY_CODES.strings[self.departure_city_id]
+
+    @property
+    def arrival_city_code(self) -> str:
+        return CITY_CODES.strings[self.arrival_city_id]
+
+    def dated_flight(self, start_date: date) -> Flight:
+        return flight_on_date(self.flight, start_date + timedelta(days=self.day))
+
+
+class _LegTemplate:
+    """What a base flight's legs have in common, computed once per base flight."""
+    __slots__ = ("flight", "weekday", "departure_minute", "arrival_offset", "duration")
+
+    def __init__(self, flight: Flight):
+        self.flight = flight
+        self.weekday = flight.date.weekday()
+        self.departure_minute = minute_of_day(flight.departure_time)
+        # Arrival relative to midnight of the departure day, as flight_on_date computes it.
+        arrival_days = (flight.arrival_datetime.date() - flight.departure_datetime.date()).days
+        self.arrival_offset = arrival_days * MINUTES_PER_DAY + minute_of_day(flight.arrival_time)
+        self.duration = to_minutes(flight.duration)
+
+    def leg(self, day: int) -> Leg:
+        flight = self.flight
+        midnight = day * MINUTES_PER_DAY
+        return Leg(
+            midnight + self.departure_minute, midnight + self.arrival_offset, self.duration,
+            flight.departure_city_id, flight.arrival_city_id, flight.transfers, day, flight
+        )
+
+
+def expand_legs(base_flights: List[Flight], start_date: date, end_date: date, origin: Optional[date] = None) -> List[Leg]:
+    """
+    The legs of the weekly base flights on every day from start_date to end_date, in
+    the order expand_flights_for_date_range gives. Minutes count from `origin`
+    (default: start_date).
+    """
+    origin = origin or start_date
+    with tracing.span("expand_legs", days=(end_date - start_date).days + 1):
+        templates_by_weekday = defaultdict(list)
+        for flight in base_flights:
+            template = _LegTemplate(flight)
+            templates_by_weekday[template.weekday].append(template)
+        legs = []
+        for day in range((start_date - origin).days, (end_date - origin).days + 1):
+            for template in templates_by_weekday.get((origin + timedelta(days=day)).weekday(), ()):
+                legs.append(template.leg(day))
+    print(f"Expanded {len(base_flights)} base flights to {len(legs)} flights from {start_date} to {end_date}.")
+    return legs
+
+
+class LegSchedule:
+    """
+    The periodic alternative to expand_legs: base flights are indexed by departure city
+    and by minute of the week relative to the start of the window, and legs are made
+    only when the search asks for departures in a time range. Memory and build cost
+    depend on the size of the weekly schedule, not on the length of the window.
+    """
+
+    def __init__(self, base_flights: List[Flight], start_date: date, end_date: date):
+        self.start_date = start_date
+        self.last_day = (end_date - start_date).days
+        start_weekday = start_date.weekday()
+        by_departure = defaultdict(list)
+        for flight in base_flights:
+            template = _LegTemplate(flight)
+            # Minute of the week of the flight's first departure in the window.
+            first_day = (template.weekday - start_weekday) % 7
+            by_departure[flight.departure_city_id].append((first_day * MINUTES_PER_DAY + template.departure_minute, template))
+        self._phases: Dict[int, List[int]] = {}
+        self._templates: Dict[int, List[_LegTemplate]] = {}
+        self._weekly_order: Dict[int, List[_LegTemplate]] = {}
+        for city_id, entries in by_departure.items():
+            # Seeds go out in the order of the week starting on Monday (stable for ties),
+            # so results don't depend on the weekday the window starts on.
+            self._weekly_order[city_id] = [
+                template for _, template in sorted(entries, key=lambda e: e[1].weekday * MINUTES_PER_DAY + e[1].departure_minute)
+            ]
+            entries.sort(key=lambda entry: entry[0])
+            self._phases[city_id] = [phase for phase, _ in entries]
+            self._templates[city_id] = [template for _, template in entries]
+
+    def first_departures(self, city_id: int) -> Iterator[Leg]:
+        """Each weekly flight from a city on its first day inside the window."""
+        start_weekday = self.start_date.weekday()
+        for template in self._weekly_order.get(city_id, ()):
+            day = (template.weekday - start_weekday) % 7
+            if day <= self.last_day:
+                yield template.leg(day)
+
+    def next_week(self, leg: Leg) -> Optional[Leg]:
+        """The same weekly flight one week later, or None past the end of the window."""
+        day = leg.day + 7
+        if day > self.last_day:
+            return None
+        return Leg(
+            leg.departure + MINUTES_PER_WEEK, leg.arrival + MINUTES_PER_WEEK, leg.duration,
+            leg.departure_city_id, leg.arrival_city_id, leg.transfers, day, leg.flight
+        )
+
+    def departures_between(self, city_id: int, earliest: int, latest: int) -> Iterator[Leg]:
+        """Legs from a city departing in [earliest, latest] (minutes) and inside the window."""
+        phases = self._phases.get(city_id)
+        if not phases:
+            return
+        templates = self._templates[city_id]
+        earliest = max(earliest, 0)
+        week_start = earliest - earliest % MINUTES_PER_WEEK
+        i = bisect_left(phases, earliest - week_start)
+        while True:
+            if i == len(phases):
+                i = 0
+                week_start += MINUTES_PER_WEEK
+            departure = week_start + phases[i]
+            day = departure // MINUTES_PER_DAY
+            if departure > latest or day > self.last_day:
+                return
+            yield templates[i].leg(day)
+            i += 1
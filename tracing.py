@@ -0,0 +1,183 @@
+import atexit
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# --- Opt-in phase tracing ---
+# Timed spans for the load / expand / filter / index / search / render phases, with
+# the tracemalloc peak and the number of allocated blocks gained during each phase,
+# exported as Chrome trace-event JSON (open it in chrome://tracing or ui.perfetto.dev).
+#
+# Tracing is off by default and span() then returns a shared no-op span.
+# Turn it on with the FLIGHT_TRACE=<output.json> environment variable (the trace is
+# written at exit; FLIGHT_TRACE_MEMORY=0 skips tracemalloc), call enable(), or trace
+# one block with recording().
+
+_enabled = False
+_memory = False
+_output_path: Optional[str] = None
+_events: List[Dict[str, Any]] = []
+_events_lock = threading.Lock()
+_local = threading.local()  # Per-thread stack of open spans (for nested peaks)
+_origin_ns = time.perf_counter_ns()
+
+
+class _NoSpan:
+    """What span() returns while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def finish(self) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def enable(output_path: Optional[str] = None, memory: bool = True) -> None:
+    """Starts recording spans; with memory=True tracemalloc is started as well."""
+    global _enabled, _memory, _output_path
+    _enabled = True
+    _memory = memory
+    if output_path:
+        _output_path = output_path
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable() -> None:
+    global _enabled, _memory
+    _enabled = False
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memory = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _Span:
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+        self.child_peak = 0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        if _memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The parent's peak so far must survive our reset_peak().
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+        self.start_blocks = sys.getallocatedblocks()
+        stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        _local.stack.pop()
+        args = dict(self.args)
+        args["allocated_blocks_delta"] = sys.getallocatedblocks() - self.start_blocks
+        if _memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            if _local.stack:
+                _local.stack[-1].child_peak = max(_local.stack[-1].child_peak, peak)
+            args["tracemalloc_peak_bytes"] = peak
+            args["tracemalloc_peak_above_start_bytes"] = peak - self.start_memory
+            args["tracemalloc_delta_bytes"] = current - self.start_memory
+        event = {
+            "name": self.name,
+            "cat": "phase",
+            "ph": "X",
+            "ts": (self.start_ns - _origin_ns) / 1000,
+            "dur": (end_ns - self.start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with _events_lock:
+            _events.append(event)
+            if _memory:
+                _events.append({
+                    "name": "tracemalloc", "ph": "C", "ts": event["ts"] + event["dur"],
+                    "pid": event["pid"], "args": {"current_bytes": current},
+                })
+        return False
+
+    def finish(self) -> None:
+        self.__exit__(None, None, None)
+
+
+def span(name: str, **args):
+    """Context manager timing one phase; extra keyword arguments are stored on the event."""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+def start_span(name: str, **args):
+    """span() for phases that don't fit in a with block; call .finish() on the result."""
+    return span(name, **args).__enter__()
+
+def events() -> List[Dict[str, Any]]:
+    with _events_lock:
+        return list(_events)
+
+def clear() -> None:
+    with _events_lock:
+        _events.clear()
+
+@contextmanager
+def recording(output_path: str, memory: bool = True):
+    """
+    Traces a block and writes its trace to output_path however the block exits. Tracing
+    (and tracemalloc) is switched off and the events are dropped afterwards, unless it
+    was already on for the whole process (FLIGHT_TRACE): then the trace so far is
+    written and recording goes on.
+    """
+    if _enabled:
+        try:
+            yield
+        finally:
+            export_chrome_trace(output_path)
+        return
+    clear()
+    enable(memory=memory)
+    try:
+        yield
+    finally:
+        disable()
+        export_chrome_trace(output_path)
+        clear()
+
+def export_chrome_trace(path: Optional[str] = None) -> Optional[str]:
+    """Writes the recorded events as Chrome trace-event JSON; returns the path written."""
+    path = path or _output_path
+    if not path:
+        return None
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, f)
+    print(f"Trace written to {path} ({len(_events)} events)")
+    return path
+
+
+if os.environ.get("FLIGHT_TRACE"):
+    enable(os.environ["FLIGHT_TRACE"], memory=os.environ.get("FLIGHT_TRACE_MEMORY", "1") != "0")
+    # Only the main process writes the file; worker processes (e.g. a parallel load)
+    # inherit the variable but must not overwrite the main process's trace.
+    if multiprocessing.parent_process() is None:
+        atexit.register(export_chrome_trace)
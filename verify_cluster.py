@@ -0,0 +1,114 @@
+import secrets
+from contextlib import closing
+from typing import Callable, Dict, List, Optional
+
+from cluster import Coordinator, WorkerQueue
+
+# --- Cluster scheduling checks ---
+# Drives a Coordinator's scheduling (_join/_assign/_complete) with simulated workers that
+# keep their prefetched queries in a WorkerQueue, as run_worker does, in a fixed
+# interleaving. No connections are made and no search runs, so every scenario is
+# deterministic. Run it after changing the scheduling or the worker loop:
+#   python verify_cluster.py
+
+
+class SimulatedWorker:
+    """run_worker's loop, one message at a time; `fails` decides which queries raise."""
+
+    def __init__(self, coordinator: Coordinator, name: str, prefetch: int = 2, fails: Callable[[int], bool] = lambda task_id: False):
+        self.coordinator = coordinator
+        self.name = name
+        self.prefetch = prefetch
+        self.fails = fails
+        self.tasks = WorkerQueue()
+        self.running: Optional[int] = None
+        self.stopped = False
+        coordinator._join(name, name, 0)
+
+    def start_next(self) -> Optional[int]:
+        """Takes the next query, fetching when out of them; None if there is nothing to run."""
+        task = self.tasks.next()
+        if task is None:
+            reply = self.coordinator._assign(self.name, self.prefetch)
+            if reply[0] == "stop":
+                self.stopped = True
+            if reply[0] == "tasks":
+                self.tasks.add(reply[1])
+                task = self.tasks.next()
+        self.running = None if task is None else task[0]
+        return self.running
+
+    def finish(self) -> None:
+        """Reports the running query as done (or failed) and applies the cancellations."""
+        task_id, self.running = self.running, None
+        error = "Traceback:\nRuntimeError: simulated failure" if self.fails(task_id) else None
+        _, stolen = self.coordinator._complete(self.name, task_id, None if error else [], error)
+        self.tasks.cancel(stolen)
+
+
+def _coordinator(query_count: int) -> Coordinator:
+    return Coordinator([{} for _ in range(query_count)], ("127.0.0.1", 0), secrets.token_bytes(16))
+
+
+def _drain(coordinator: Coordinator, workers: List[SimulatedWorker], max_rounds: int = 50) -> List[str]:
+    """Round-robin until every worker is told to stop; what went wrong, if it never ends."""
+    for _ in range(max_rounds):
+        for worker in workers:
+            if worker.stopped:
+                continue
+            if worker.running is None:
+                worker.start_next()
+            if worker.running is not None:
+                worker.finish()
+        if all(worker.stopped for worker in workers):
+            return []
+    return [
+        f"not finished after {max_rounds} rounds: done={sorted(coordinator._done)}, "
+        f"outstanding={ {name: ids for name, ids in coordinator._outstanding.items() if ids} }"
+    ]
+
+
+def check_steal_error_retry() -> List[str]:
+    """
+    A thief steals a query and fails on it; the retry goes back to the victim, which
+    must run it rather than skip it as still stolen.
+    """
+    with closing(_coordinator(2)) as coordinator:
+        victim = SimulatedWorker(coordinator, "victim")
+        thief = SimulatedWorker(coordinator, "thief", fails=lambda task_id: True)
+        victim.start_next()                  # Prefetches 0 and 1, runs 0
+        thief.start_next()                   # Queue empty: steals 1
+        thief.finish()                       # 1 fails and is requeued
+        thief.stopped = True                 # The thief leaves the scenario
+        victim.finish()                      # 0 done; learns 1 was stolen
+        problems = _drain(coordinator, [victim])
+        if not problems and coordinator._done != {0, 1}:
+            problems.append(f"done={sorted(coordinator._done)}, expected [0, 1]")
+        return problems
+
+
+def check_steal_back() -> List[str]:
+    """Queries stolen back and forth between workers with a deep prefetch all finish."""
+    with closing(_coordinator(12)) as coordinator:
+        workers = [SimulatedWorker(coordinator, f"w{i}", prefetch=4, fails=lambda task_id, i=i: i == 0 and task_id % 3 == 0) for i in range(3)]
+        problems = _drain(coordinator, workers)
+        if not problems and len(coordinator._done) != 12:
+            problems.append(f"{len(coordinator._done)} of 12 queries done")
+        return problems
+
+
+CHECKS: Dict[str, Callable[[], List[str]]] = {
+    "steal_error_retry": check_steal_error_retry,
+    "steal_back": check_steal_back,
+}
+
+
+if __name__ == '__main__':
+    import sys
+
+    failed = 0
+    for name, check in CHECKS.items():
+        problems = check()
+        print(f"{name}: {'ok' if not problems else '; '.join(problems)}")
+        failed += bool(problems)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+import contextlib
+import io
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Sequence
+
+from invariants import InvariantViolation, check_plan
+from main import find_best_travel_plan
+from models import CITIES, Flight, TravelPlan
+
+# --- Invariant verification harness ---
+# Runs benchmark queries with debug_invariants=True (see invariants.py), checks every
+# returned plan against its query with check_plan, and compares the plans with those of
+# the same query in production mode, so the checks that production searches skip are
+# still exercised. Run it after changing the search:
+#   python verify_invariants.py --data merged_flight_data.xlsx --count 50
+#   python verify_invariants.py --queries batch.jsonl   (the query files of cluster.py)
+
+# Search modes every query is verified in, as extra find_best_travel_plan arguments.
+MODES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    "periodic": {"periodic": True},
+    "pareto": {"pareto": True},
+    "spilling": {"max_frontier_entries": 500},
+}
+
+# find_best_travel_plan arguments that check_plan verifies a plan against.
+PLAN_PARAMS = (
+    "start_date", "end_date", "cities_choice", "num_countries", "start_city", "end_city",
+    "min_layover_hours", "max_layover_hours", "forced_cities"
+)
+
+
+@dataclass
+class Failure:
+    query_index: int
+    mode: str
+    reason: str
+    query: Dict[str, Any] = field(default_factory=dict)
+
+
+def benchmark_queries(count: int, seed: int = 1, first_date: date = date(2025, 9, 29)) -> Iterator[Dict[str, Any]]:
+    """
+    `count` reproducible queries spread over the search's features: windows of a few
+    days to a few weeks, fixed and Any start cities, end cities, class, transfer,
+    duration and no-fly filters, and forced cities.
+    """
+    rng = random.Random(seed)
+    codes = [c['code'] for c in CITIES]
+    for _ in range(count):
+        start_date = first_date + timedelta(days=rng.randrange(14))
+        query = {
+            "start_date": start_date,
+            "end_date": start_date + timedelta(days=rng.randrange(3, 25)),
+            "cities_choice": rng.sample(codes, rng.randrange(min(8, len(codes)), len(codes) + 1)),
+            "num_countries": rng.randrange(1, 5),
+            "min_layover_hours": rng.choice([2, 6, 10]),
+            "max_layover_hours": rng.choice([24, 48, 72]),
+            "top_n": rng.choice([1, 3, 5]),
+        }
+        if rng.random() < 0.7:
+            query["start_city"] = rng.choice(query["cities_choice"])
+        if rng.random() < 0.3:
+            query["end_city"] = rng.choice(query["cities_choice"])
+        if rng.random() < 0.3:
+            query["flight_class_filter"] = rng.choice(["Economy", "Business"])
+        if rng.random() < 0.3:
+            query["max_transfers"] = rng.randrange(0, 2)
+        if rng.random() < 0.3:
+            query["max_flight_duration_hours"] = rng.randrange(5, 12)
+        if rng.random() < 0.2:
+            query["no_fly_start_hour"], query["no_fly_end_hour"] = 23, 6
+        if rng.random() < 0.25:
+            query["forced_cities"] = rng.sample(query["cities_choice"], rng.randrange(1, 3))
+        yield query
+
+
+def _plan_key(plan: TravelPlan) -> List[str]:
+    return [f"{f.flight_number} {f.departure_city_code}>{f.arrival_city_code} {f.departure_datetime:%Y-%m-%d %H:%M}" for f in plan.flights]
+
+
+def _search(base_flights: Sequence[Flight], query: Dict[str, Any], extra: Dict[str, Any], debug: bool) -> List[TravelPlan]:
+    # The search's own progress output would drown the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return find_best_travel_plan(base_flights, **dict(query, **extra, debug_invariants=debug))
+
+
+def verify_query(
+    base_flights: Sequence[Flight],
+    query: Dict[str, Any],
+    modes: Sequence[str] = tuple(MODES),
+    query_index: int = 0
+) -> List[Failure]:
+    """Verifies one query in each of `modes`; returns what went wrong (nothing if it all held)."""
+    failures = []
+    plan_query = {name: query[name] for name in PLAN_PARAMS if name in query}
+    for mode in modes:
+        try:
+            plans = _search(base_flights, query, MODES[mode], debug=True)
+            for plan in plans:
+                check_plan(plan, **plan_query)
+        except InvariantViolation as e:
+            failures.append(Failure(query_index, mode, str(e), query))
+            continue
+        # The checks must only observe: production mode returns the same plans.
+        production_plans = _search(base_flights, query, MODES[mode], debug=False)
+        if [_plan_key(p) for p in plans] != [_plan_key(p) for p in production_plans]:
+            failures.append(Failure(query_index, mode, "plans differ from production mode", query))
+    return failures
+
+
+def verify_queries(
+    base_flights: Sequence[Flight],
+    queries: Sequence[Dict[str, Any]],
+    modes: Sequence[str] = tuple(MODES)
+) -> List[Failure]:
+    failures = []
+    for i, query in enumerate(queries):
+        query_failures = verify_query(base_flights, query, modes, i)
+        for failure in query_failures:
+            print(f"Query {i} ({failure.mode}): {failure.reason}")
+        if not query_failures:
+            print(f"Query {i}: ok")
+        failures.extend(query_failures)
+    return failures
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from cluster import load_worker_flights, read_queries
+
+    parser = argparse.ArgumentParser(description="Check the search's invariants across benchmark queries.")
+    parser.add_argument("--data", default="merged_flight_data.xlsx", help="flight sheet or .flights snapshot")
+    parser.add_argument("--queries", help="JSON lines query file (as for cluster.py); default: generated queries")
+    parser.add_argument("--count", type=int, default=30, help="number of generated queries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    base_flights = load_worker_flights(args.data)
+    if not base_flights:
+        print("Could not load flight data. Exiting.")
+        sys.exit(2)
+    queries = read_queries(args.queries) if args.queries else list(benchmark_queries(args.count, args.seed))
+    failures = verify_queries(base_flights, queries, args.modes)
+    print(f"{len(queries)} queries x {len(args.modes)} modes: {len(failures)} failures")
+    sys.exit(1 if failures else 0)